@@ -0,0 +1,352 @@
+"""
+Columnar Activity Store
+Compact append-only storage for the view, download and rating logs
+
+Each activity log keeps one typed NumPy array per column instead of one dict
+per event. User, resource and session ids are interned to int32, device
+types and IPs are dictionary-encoded to int32 (both are client input, so
+their number of distinct values is not bounded), row ids are 16-byte UUIDs and
+timestamps are int64 microseconds since 1970-01-01 (naive wall-clock time,
+the same clock as the ISO strings used elsewhere).
+
+A log is a list of chunks whose capacity doubles up to MAX_CHUNK_ROWS, so
+appends never copy existing rows and scans touch a handful of arrays.
+"""
+
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+FIRST_CHUNK_ROWS = 1024
+MAX_CHUNK_ROWS = 1 << 20
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+def to_micros(value: datetime) -> int:
+    """Naive datetime -> int64 microseconds"""
+    return (value - _EPOCH) // _MICROSECOND
+
+def from_micros(value: int) -> datetime:
+    """int64 microseconds -> naive datetime"""
+    return _EPOCH + timedelta(microseconds=int(value))
+
+# ============================================================================
+# BUILDING BLOCKS
+# ============================================================================
+
+class Interner:
+    """Bidirectional string <-> dense int mapping"""
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def intern(self, value: str) -> int:
+        code = self.ids.get(value)
+        if code is None:
+            code = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value: str) -> int:
+        """Code for a value, or -1 if it was never interned"""
+        return self.ids.get(value, -1)
+
+    def __getitem__(self, code: int) -> str:
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+class ColumnarLog:
+    """Append-only table of fixed-width columns stored in geometrically growing chunks"""
+
+    def __init__(self, schema: Dict[str, str]):
+        self.schema = {name: np.dtype(dtype) for name, dtype in schema.items()}
+        self.chunks: List[Dict[str, np.ndarray]] = []
+        self.sizes: List[int] = []
+        self.starts: List[int] = []
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, **values) -> int:
+        """Append one row; returns its row number"""
+        if not self.chunks or self.sizes[-1] == len(self.chunks[-1][next(iter(self.schema))]):
+            self._grow()
+        chunk, offset = self.chunks[-1], self.sizes[-1]
+        for name, value in values.items():
+            chunk[name][offset] = value
+        self.sizes[-1] += 1
+        self.length += 1
+        return self.length - 1
+
+    def _grow(self):
+        capacity = min(FIRST_CHUNK_ROWS << len(self.chunks), MAX_CHUNK_ROWS)
+        self.chunks.append({name: np.zeros(capacity, dtype) for name, dtype in self.schema.items()})
+        self.starts.append(self.length)
+        self.sizes.append(0)
+
+    def _locate(self, row: int) -> Tuple[Dict[str, np.ndarray], int]:
+        index = int(np.searchsorted(self.starts, row, side="right")) - 1
+        return self.chunks[index], row - self.starts[index]
+
+    def get(self, row: int) -> Dict[str, object]:
+        """One row as a dict of column -> scalar"""
+        chunk, offset = self._locate(row)
+        return {name: chunk[name][offset] for name in self.schema}
+
+    def set(self, row: int, **values):
+        """Overwrite columns of an existing row"""
+        chunk, offset = self._locate(row)
+        for name, value in values.items():
+            chunk[name][offset] = value
+
+    def iter_chunks(self) -> Iterator[Tuple[int, Dict[str, np.ndarray]]]:
+        """Yield (first row number, filled column slices) per chunk"""
+        for start, chunk, size in zip(self.starts, self.chunks, self.sizes):
+            if size:
+                yield start, {name: column[:size] for name, column in chunk.items()}
+
+    def column(self, name: str) -> np.ndarray:
+        """Whole column as one array (copies when there is more than one chunk)"""
+        parts = [chunk[name] for _, chunk in self.iter_chunks()]
+        if not parts:
+            return np.zeros(0, self.schema[name])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def slice(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        """Rows [start, stop) as one array per column (views when they fall in one chunk)"""
+        parts: Dict[str, list] = {name: [] for name in self.schema}
+        for first, chunk in self.iter_chunks():
+            size = len(chunk[next(iter(chunk))])
+            lo, hi = max(start - first, 0), min(stop - first, size)
+            if lo < hi:
+                for name, column in chunk.items():
+                    parts[name].append(column[lo:hi])
+        return {
+            name: (values[0] if len(values) == 1 else
+                   np.concatenate(values) if values else np.zeros(0, self.schema[name]))
+            for name, values in parts.items()
+        }
+
+    def scan(self, columns: Optional[List[str]] = None, **equals) -> Dict[str, np.ndarray]:
+        """Vectorized filter: rows where every given column equals its value.
+
+        Range filters use `<column>__ge` / `<column>__lt` keys. The result
+        always includes a `row` column with global row numbers.
+        """
+        columns = list(self.schema) if columns is None else columns
+        parts: Dict[str, list] = {name: [] for name in columns + ["row"]}
+        for start, chunk in self.iter_chunks():
+            mask = np.ones(len(chunk[next(iter(chunk))]), dtype=bool)
+            for key, value in equals.items():
+                name, _, op = key.partition("__")
+                if op == "ge":
+                    mask &= chunk[name] >= value
+                elif op == "lt":
+                    mask &= chunk[name] < value
+                else:
+                    mask &= chunk[name] == value
+            hits = np.flatnonzero(mask)
+            if len(hits):
+                for name in columns:
+                    parts[name].append(chunk[name][hits])
+                parts["row"].append(hits + start)
+        return {
+            name: np.concatenate(values) if values else np.zeros(0, self.schema.get(name, np.int64))
+            for name, values in parts.items()
+        }
+
+    def nbytes(self) -> int:
+        return sum(column.nbytes for chunk in self.chunks for column in chunk.values())
+
+    def __getstate__(self):
+        # Trim each chunk to its filled rows; restored chunks are then full,
+        # so the next append starts a fresh chunk
+        return {
+            "schema": {name: dtype.str for name, dtype in self.schema.items()},
+            "chunks": [{name: column[:size] for name, column in chunk.items()}
+                       for chunk, size in zip(self.chunks, self.sizes)],
+        }
+
+    def widen(self, schema: Dict[str, str]):
+        """Cast columns restored with an older, narrower dtype to the current schema"""
+        for name, dtype in schema.items():
+            dtype = np.dtype(dtype)
+            if self.schema.get(name, dtype) != dtype:
+                self.schema[name] = dtype
+                for chunk in self.chunks:
+                    chunk[name] = chunk[name].astype(dtype)
+
+    def __setstate__(self, state):
+        self.schema = {name: np.dtype(dtype) for name, dtype in state["schema"].items()}
+        self.chunks = state["chunks"]
+        self.sizes, self.starts, self.length = [], [], 0
+        for chunk in self.chunks:
+            size = len(chunk[next(iter(self.schema))])
+            self.starts.append(self.length)
+            self.sizes.append(size)
+            self.length += size
+
+# ============================================================================
+# ACTIVITY STORE
+# ============================================================================
+
+VIEW_SCHEMA = {
+    "view_id": "V16", "user": "i4", "resource": "i4", "timestamp": "i8",
+    "duration": "i4", "device": "i4", "session": "i4",
+}
+DOWNLOAD_SCHEMA = {
+    "download_id": "V16", "user": "i4", "resource": "i4", "timestamp": "i8",
+    "size": "i8", "success": "?", "ip": "i4",
+}
+RATING_SCHEMA = {
+    "rating_id": "V16", "user": "i4", "resource": "i4", "rating": "i1",
+    "rated_at": "i8", "updated_at": "i8",
+}
+
+class ActivityStore:
+    """The three activity logs plus the dictionaries they share"""
+
+    def __init__(self):
+        self.users = Interner()
+        self.resources = Interner()
+        self.sessions = Interner()
+        self.devices = Interner()
+        self.ips = Interner()
+        self.views = ColumnarLog(VIEW_SCHEMA)
+        self.downloads = ColumnarLog(DOWNLOAD_SCHEMA)
+        self.ratings = ColumnarLog(RATING_SCHEMA)
+        self.reviews: Dict[int, str] = {}          # rating row -> review text (only when non-empty)
+        self.rating_rows: Dict[int, int] = {}      # (user << 32 | resource) -> rating row
+
+    def restore(self, other: "ActivityStore"):
+        """Take over the contents of a store loaded from a snapshot (keeps log identities)"""
+        for name, value in vars(other).items():
+            current = getattr(self, name, None)
+            if isinstance(current, ColumnarLog):
+                schema = current.schema
+                current.__setstate__(value.__getstate__())
+                current.widen(schema)           # snapshots from before a column was widened
+            else:
+                setattr(self, name, value)
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def log_view(self, view_id: str, user_id: str, resource_id: str, timestamp: datetime,
+                 duration: int, device: str, session: str) -> int:
+        return self.views.append(
+            view_id=uuid.UUID(view_id).bytes, user=self.users.intern(user_id),
+            resource=self.resources.intern(resource_id), timestamp=to_micros(timestamp),
+            duration=duration, device=self.devices.intern(device), session=self.sessions.intern(session)
+        )
+
+    def log_download(self, download_id: str, user_id: str, resource_id: str, timestamp: datetime,
+                     size: int, success: bool, ip_address: str) -> int:
+        return self.downloads.append(
+            download_id=uuid.UUID(download_id).bytes, user=self.users.intern(user_id),
+            resource=self.resources.intern(resource_id), timestamp=to_micros(timestamp),
+            size=size, success=success, ip=self.ips.intern(ip_address)
+        )
+
+    def find_rating(self, user_id: str, resource_id: str) -> Optional[int]:
+        user, resource = self.users.lookup(user_id), self.resources.lookup(resource_id)
+        if user < 0 or resource < 0:
+            return None
+        return self.rating_rows.get(user << 32 | resource)
+
+    def add_rating(self, rating_id: str, user_id: str, resource_id: str, rating: int,
+                   review: str, timestamp: datetime) -> int:
+        user, resource = self.users.intern(user_id), self.resources.intern(resource_id)
+        micros = to_micros(timestamp)
+        row = self.ratings.append(rating_id=uuid.UUID(rating_id).bytes, user=user, resource=resource,
+                                  rating=rating, rated_at=micros, updated_at=micros)
+        self.rating_rows[user << 32 | resource] = row
+        if review:
+            self.reviews[row] = review
+        return row
+
+    def update_rating(self, row: int, rating: int, review: str, timestamp: datetime):
+        self.ratings.set(row, rating=rating, updated_at=to_micros(timestamp))
+        if review:
+            self.reviews[row] = review
+        else:
+            self.reviews.pop(row, None)
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def view_record(self, row: int) -> dict:
+        """A view row in the activities_views table shape"""
+        r = self.views.get(row)
+        return {
+            "view_id": str(uuid.UUID(bytes=r["view_id"].tobytes())),
+            "user_id": self.users[r["user"]],
+            "resource_id": self.resources[r["resource"]],
+            "view_timestamp": from_micros(r["timestamp"]).isoformat(),
+            "view_duration_seconds": int(r["duration"]),
+            "device_type": self.devices[r["device"]],
+            "session_id": self.sessions[r["session"]],
+        }
+
+    def download_record(self, row: int) -> dict:
+        """A download row in the activities_downloads table shape"""
+        r = self.downloads.get(row)
+        return {
+            "download_id": str(uuid.UUID(bytes=r["download_id"].tobytes())),
+            "user_id": self.users[r["user"]],
+            "resource_id": self.resources[r["resource"]],
+            "download_timestamp": from_micros(r["timestamp"]).isoformat(),
+            "file_size_downloaded": int(r["size"]),
+            "download_success": bool(r["success"]),
+            "ip_address": self.ips[r["ip"]],
+        }
+
+    def rating_record(self, row: int) -> dict:
+        """A rating row in the activities_ratings table shape"""
+        r = self.ratings.get(row)
+        return {
+            "rating_id": str(uuid.UUID(bytes=r["rating_id"].tobytes())),
+            "user_id": self.users[r["user"]],
+            "resource_id": self.resources[r["resource"]],
+            "rating_value": int(r["rating"]),
+            "review_text": self.reviews.get(row, ""),
+            "rated_at": from_micros(r["rated_at"]).isoformat(),
+            "updated_at": from_micros(r["updated_at"]).isoformat(),
+        }
+
+    def scan(self, log: ColumnarLog, user_id: Optional[str] = None, resource_id: Optional[str] = None,
+             since: Optional[datetime] = None, until: Optional[datetime] = None,
+             time_column: str = "timestamp", columns: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """Vectorized scan of one log by user, resource and/or [since, until) time range"""
+        filters = {}
+        if user_id is not None:
+            filters["user"] = self.users.lookup(user_id)
+        if resource_id is not None:
+            filters["resource"] = self.resources.lookup(resource_id)
+        if since is not None:
+            filters[f"{time_column}__ge"] = to_micros(since)
+        if until is not None:
+            filters[f"{time_column}__lt"] = to_micros(until)
+        if -1 in (filters.get("user"), filters.get("resource")):
+            filters = {"user": -1}      # unknown id: matches nothing
+        return log.scan(columns, **filters)
+
+    def rating_summary(self, resource_id: str) -> Tuple[float, int]:
+        """Average rating and count for a resource (vectorized)"""
+        ratings = self.scan(self.ratings, resource_id=resource_id, columns=["rating"])["rating"]
+        if not len(ratings):
+            return 0.0, 0
+        return round(float(ratings.mean()), 2), int(len(ratings))
+
+    def nbytes(self) -> int:
+        """Bytes held by the column arrays"""
+        return self.views.nbytes() + self.downloads.nbytes() + self.ratings.nbytes()
@@ -0,0 +1,285 @@
+"""
+Admission Control
+Per-client rate limiting and load shedding in front of the API
+
+Two checks run before a request reaches any route:
+
+1. Token buckets. A request with a verified identity (scope["user"], set
+   by the session-token authentication middleware added after this one, see
+   session_tokens.py) takes from that user's bucket, so users sharing an
+   address (campus NAT, a proxy) do not share a limit. Anonymous requests
+   take from their client IP's bucket, which is `ip_factor` times larger.
+   Client-supplied ids (X-User-Id, a body user_id) are never used as keys,
+   because a client could rotate them for a fresh bucket per request; new
+   identities come from registration and login, which cost more and are
+   themselves limited per IP. Buckets refill at a fixed rate up to a burst
+   size, and each request takes its endpoint's cost (generating
+   recommendations costs far more than reading a resource). An empty bucket
+   answers 429 with Retry-After.
+
+2. Global concurrency. At most `max_concurrency` requests run at once; the
+   rest wait in a FIFO queue. A request that would wait longer than
+   `max_queue_seconds` is shed with 503 and Retry-After instead, so overload
+   turns into fast rejections rather than growing latency for everyone.
+   The wait is estimated from the queue length and recent service times on
+   arrival, and enforced with a timeout while queued.
+
+Buckets live in fixed-size flat arrays addressed by key hash (two candidate
+slots per key, the least recently used one is recycled), so memory does not
+grow with the number of clients. With several uvicorn workers every worker
+enforces its own limits.
+
+Streaming responses (file downloads) are rate limited but do not take a
+concurrency slot: a slow client would hold it for the whole transfer and
+skew the service-time estimate used for shedding.
+
+Behind a reverse proxy every request arrives from the proxy's address.
+List the proxies in TRUSTED_PROXIES (comma-separated, default 127.0.0.1):
+for requests from them the client IP is taken from X-Forwarded-For, the
+rightmost entry that is not itself a trusted proxy (uvicorn's
+ProxyHeadersMiddleware, installed outermost by the app). X-Forwarded-For
+from any other peer is ignored, since clients can write anything there.
+Run uvicorn itself with --no-proxy-headers so only that list applies.
+
+The middleware can only shed requests that reach it. uvloop accepts about
+one connection per loop iteration while handlers keep the loop busy, which
+leaves the backlog in the kernel's listen queue, out of sight; run uvicorn
+with the asyncio loop so queued requests arrive here.
+"""
+
+import asyncio
+import math
+import time
+from array import array
+from collections import deque
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+SERVICE_TIME_SMOOTHING = 0.05      # EWMA weight of the newest request duration
+
+EndpointCosts = Dict[Tuple[str, str], float]   # (method, path or "/prefix/") -> tokens
+
+# ============================================================================
+# TOKEN BUCKETS
+# ============================================================================
+
+class TokenBucketTable:
+    """Fixed number of token buckets in flat arrays (2-way hashed, LRU slot recycled)"""
+
+    def __init__(self, slots: int = 65536):
+        size = 1 << max(slots - 1, 1).bit_length()
+        self.mask = size - 1
+        self.keys = array("Q", bytes(8 * size))        # 0 = empty slot
+        self.tokens = array("d", bytes(8 * size))
+        self.stamps = array("d", bytes(8 * size))      # last use (monotonic seconds)
+        self.evictions = 0
+
+    def take(self, key: str, cost: float, rate: float, burst: float, now: float) -> float:
+        """Take `cost` tokens from the key's bucket.
+
+        Returns 0.0 when the request is allowed, else the seconds until the
+        bucket will hold enough tokens.
+        """
+        fingerprint = (hash(key) & 0xFFFFFFFFFFFFFFFF) or 1
+        first, second = fingerprint & self.mask, (fingerprint >> 32) & self.mask
+        if self.keys[first] == fingerprint:
+            slot = first
+        elif self.keys[second] == fingerprint:
+            slot = second
+        else:
+            slot = first if self.stamps[first] <= self.stamps[second] else second
+            self.evictions += self.keys[slot] != 0
+            self.keys[slot] = fingerprint
+            self.tokens[slot] = burst
+            self.stamps[slot] = now
+
+        cost = min(cost, burst)
+        tokens = min(burst, self.tokens[slot] + (now - self.stamps[slot]) * rate)
+        self.stamps[slot] = now
+        if tokens >= cost:
+            self.tokens[slot] = tokens - cost
+            return 0.0
+        self.tokens[slot] = tokens
+        return (cost - tokens) / rate
+
+    def nbytes(self) -> int:
+        return sum(a.itemsize * len(a) for a in (self.keys, self.tokens, self.stamps))
+
+# ============================================================================
+# CONCURRENCY LIMIT
+# ============================================================================
+
+class ConcurrencyLimiter:
+    """Bounded number of in-flight requests with a time-limited FIFO queue"""
+
+    def __init__(self, max_concurrency: int, max_queue_seconds: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue_seconds = max_queue_seconds
+        self.in_flight = 0
+        self.queued = 0
+        self.service_time = 0.0                        # EWMA of request duration (seconds)
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def expected_wait(self) -> float:
+        """Queue time a request arriving now should expect"""
+        return (self.queued + 1) * self.service_time / self.max_concurrency
+
+    async def acquire(self) -> Tuple[Optional[str], float]:
+        """Wait for a slot.
+
+        Returns (None, seconds queued) once admitted, or (shed reason,
+        seconds expected/spent in the queue) when the request is shed.
+        """
+        if self.in_flight < self.max_concurrency and not self.queued:
+            self.in_flight += 1
+            return None, 0.0
+
+        expected = self.expected_wait()
+        if expected > self.max_queue_seconds:
+            return "expected_wait", expected
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(waiter, self.max_queue_seconds)
+        except asyncio.TimeoutError:
+            return "queue_timeout", time.monotonic() - started
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()                          # handed a slot while being cancelled
+            raise
+        finally:
+            self.queued -= 1
+        return None, time.monotonic() - started
+
+    def release(self, duration: Optional[float] = None):
+        """Free a slot (handing it straight to the next waiter) and record the request duration"""
+        if duration is not None:
+            self.service_time += SERVICE_TIME_SMOOTHING * (duration - self.service_time)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+
+class AdmissionControl:
+    """Rate limits, endpoint costs and the concurrency limit shared by the middleware"""
+
+    def __init__(self, rate_per_second: float = 10.0, burst: float = 40.0, ip_factor: float = 4.0,
+                 max_concurrency: int = 64, max_queue_seconds: float = 0.5,
+                 bucket_slots: int = 65536, endpoint_costs: Optional[EndpointCosts] = None,
+                 exempt_paths: Tuple[str, ...] = (), streaming_suffixes: Tuple[str, ...] = ()):
+        self.rate, self.burst = rate_per_second, burst
+        self.ip_rate, self.ip_burst = rate_per_second * ip_factor, burst * ip_factor
+        self.buckets = TokenBucketTable(bucket_slots)
+        self.limiter = ConcurrencyLimiter(max_concurrency, max_queue_seconds)
+        self.exact_costs = {key: cost for key, cost in (endpoint_costs or {}).items() if not key[1].endswith("/")}
+        self.prefix_costs = [(key, cost) for key, cost in (endpoint_costs or {}).items() if key[1].endswith("/")]
+        self.exempt_paths = set(exempt_paths)
+        self.streaming_suffixes = tuple(streaming_suffixes)
+        self.counters = {
+            "accepted": 0, "rate_limited_user": 0, "rate_limited_ip": 0,
+            "shed_expected_wait": 0, "shed_queue_timeout": 0, "queued": 0,
+        }
+        self.max_queue_wait = 0.0
+
+    def cost(self, method: str, path: str) -> float:
+        """Tokens a request takes: exact route, then longest matching prefix, else 1"""
+        cost = self.exact_costs.get((method, path))
+        if cost is not None:
+            return cost
+        best, length = 1.0, 0
+        for (prefix_method, prefix), prefix_cost in self.prefix_costs:
+            if prefix_method == method and path.startswith(prefix) and len(prefix) > length:
+                best, length = prefix_cost, len(prefix)
+        return best
+
+    def check_rate(self, ip: str, principal: Optional[str], cost: float) -> Tuple[Optional[str], float]:
+        """(limited scope or None, retry-after seconds): per user when authenticated, else per IP"""
+        now = time.monotonic()
+        if principal:
+            wait = self.buckets.take(f"user:{principal}", cost, self.rate, self.burst, now)
+            return ("user", wait) if wait else (None, 0.0)
+        wait = self.buckets.take(f"ip:{ip}", cost, self.ip_rate, self.ip_burst, now)
+        return ("ip", wait) if wait else (None, 0.0)
+
+    def stats(self) -> dict:
+        limiter = self.limiter
+        return {
+            **self.counters,
+            "in_flight": limiter.in_flight,
+            "queue_length": limiter.queued,
+            "max_concurrency": limiter.max_concurrency,
+            "service_time_ms": round(limiter.service_time * 1000, 2),
+            "expected_wait_ms": round(limiter.expected_wait() * 1000, 2),
+            "max_queue_wait_ms": round(self.max_queue_wait * 1000, 2),
+            "bucket_slots": self.buckets.mask + 1,
+            "bucket_evictions": self.buckets.evictions,
+            "bucket_memory_bytes": self.buckets.nbytes(),
+        }
+
+def _retry_after(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+class AdmissionControlMiddleware:
+    """ASGI middleware applying an AdmissionControl to every HTTP request"""
+
+    def __init__(self, app: Callable, control: AdmissionControl):
+        self.app = app
+        self.control = control
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.control.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+
+        control = self.control
+        ip = (scope.get("client") or ("",))[0] or "unknown"     # None when X-Forwarded-For lists only proxies
+
+        limited, wait = control.check_rate(ip, _principal(scope), control.cost(scope["method"], scope["path"]))
+        if limited:
+            control.counters[f"rate_limited_{limited}"] += 1
+            response = JSONResponse({"detail": "Rate limit exceeded"}, status_code=429, headers=_retry_after(wait))
+            await response(scope, receive, send)
+            return
+
+        if scope["path"].endswith(control.streaming_suffixes):
+            control.counters["accepted"] += 1
+            await self.app(scope, receive, send)
+            return
+
+        shed, waited = await control.limiter.acquire()
+        if shed:
+            control.counters[f"shed_{shed}"] += 1
+            response = JSONResponse({"detail": "Server overloaded, retry later"}, status_code=503,
+                                    headers=_retry_after(waited))
+            await response(scope, receive, send)
+            return
+
+        control.counters["accepted"] += 1
+        if waited:
+            control.counters["queued"] += 1
+            control.max_queue_wait = max(control.max_queue_wait, waited)
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            control.limiter.release(time.monotonic() - started)
+
+def _principal(scope) -> Optional[str]:
+    """Identity of the user the authentication middleware put in scope["user"], if authenticated"""
+    user = scope.get("user")
+    if user is None or not getattr(user, "is_authenticated", False):
+        return None
+    try:
+        return str(user.identity)
+    except NotImplementedError:           # starlette's SimpleUser only has a display name
+        return user.display_name or None
@@ -0,0 +1,106 @@
+"""
+Recommendation Re-ranking Bandit
+Online LinUCB over resource_type+difficulty arms, learned from feedback
+
+Each arm keeps the sufficient statistics of a ridge regression of reward
+(click) on the context x = (1, profile score):
+
+    A = ridge * I + sum(x x^T)      b = sum(reward * x)
+
+A feedback event adds one observation in O(1); re-ranking a candidate list
+scores each candidate with its arm's upper confidence bound
+
+    theta^T x + alpha * sqrt(x^T A^-1 x)
+
+With no feedback every arm has theta = 0, so candidates keep their profile
+score order. Contexts are 2-d, so everything is closed-form plain-float
+arithmetic: no matrix library and no randomness, which keeps WAL replay
+deterministic.
+"""
+
+import math
+from typing import Any, Dict, List, Tuple
+
+DEFAULT_ALPHA = 0.5
+DEFAULT_RIDGE = 1.0
+
+def arm_key(resource_type: str, difficulty_level: str) -> str:
+    """Arm of a resource, e.g. 'pdf|beginner'"""
+    return f"{resource_type}|{difficulty_level}"
+
+def feedback_reward(was_clicked: bool, was_helpful: Any = None) -> float:
+    """Reward of one feedback: a click counts unless the user marked it unhelpful"""
+    return 1.0 if was_clicked and was_helpful is not False else 0.0
+
+class RecommendationBandit:
+    """Per-arm LinUCB statistics: [a11, a12, a22, b1, b2, feedback count, reward sum]"""
+
+    def __init__(self, alpha: float = DEFAULT_ALPHA, ridge: float = DEFAULT_RIDGE):
+        self.alpha = alpha
+        self.ridge = ridge
+        self.arms: Dict[str, List[float]] = {}
+
+    def _arm(self, arm: str) -> List[float]:
+        stats = self.arms.get(arm)
+        if stats is None:
+            stats = self.arms[arm] = [self.ridge, 0.0, self.ridge, 0.0, 0.0, 0, 0.0]
+        return stats
+
+    def update(self, arm: str, score: float, reward: float):
+        """Add one observation (context score, reward) to an arm"""
+        s = self._arm(arm)
+        s[0] += 1.0
+        s[1] += score
+        s[2] += score * score
+        s[3] += reward
+        s[4] += reward * score
+        s[5] += 1
+        s[6] += reward
+
+    def adjust(self, arm: str, score: float, reward_delta: float):
+        """Change the reward of an observation already counted (feedback was resubmitted)"""
+        s = self._arm(arm)
+        s[3] += reward_delta
+        s[4] += reward_delta * score
+        s[6] += reward_delta
+
+    def _solve(self, arm: str) -> Tuple[float, float, float, float, float, float]:
+        """theta = A^-1 b, plus A's entries and determinant"""
+        stats = self.arms.get(arm)
+        a11, a12, a22, b1, b2 = stats[:5] if stats else (self.ridge, 0.0, self.ridge, 0.0, 0.0)
+        det = a11 * a22 - a12 * a12
+        return (a22 * b1 - a12 * b2) / det, (a11 * b2 - a12 * b1) / det, a11, a12, a22, det
+
+    def ucb(self, arm: str, score: float) -> float:
+        """Upper confidence bound of the click probability for a candidate"""
+        return self._ucb(self._solve(arm), score)
+
+    def _ucb(self, solved: tuple, score: float) -> float:
+        theta1, theta2, a11, a12, a22, det = solved
+        variance = (a22 - 2.0 * a12 * score + a11 * score * score) / det
+        return theta1 + theta2 * score + self.alpha * math.sqrt(max(variance, 0.0))
+
+    def rerank(self, candidates: List[Tuple[float, str, Any]]) -> List[Tuple[float, float, str, Any]]:
+        """Order (profile score, arm, payload) candidates by UCB, best first.
+
+        Returns (ucb, profile score, arm, payload) tuples; ties keep the
+        incoming order.
+        """
+        solved = {arm: self._solve(arm) for _, arm, _ in candidates}
+        scored = [(self._ucb(solved[arm], score), -i, score, arm, payload)
+                  for i, (score, arm, payload) in enumerate(candidates)]
+        scored.sort(key=lambda c: (c[0], c[1]), reverse=True)
+        return [(ucb, score, arm, payload) for ucb, _, score, arm, payload in scored]
+
+    def stats(self) -> Dict[str, dict]:
+        """Feedback count, observed click-through rate and fitted model per arm"""
+        result = {}
+        for arm, s in sorted(self.arms.items()):
+            theta1, theta2 = self._solve(arm)[:2]
+            result[arm] = {
+                "feedback_count": int(s[5]),
+                "click_through_rate": round(s[6] / s[5], 4) if s[5] else None,
+                "intercept": round(theta1, 4),
+                "score_weight": round(theta2, 4),
+            }
+        return result
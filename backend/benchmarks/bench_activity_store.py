@@ -0,0 +1,102 @@
+"""
+Benchmark: memory and scan speed of the columnar activity store
+
+Loads N synthetic view events into the old layout (one dict per row keyed
+by view_id) and into ActivityStore, each in a fresh process, and reports
+the RSS growth plus the time of a by-user, by-resource and time-range scan.
+
+Usage (from backend/):
+    python benchmarks/bench_activity_store.py --rows 1000000
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+USERS = 5_000
+RESOURCES = 20_000
+DEVICES = ["desktop", "mobile", "tablet"]
+START = datetime(2024, 1, 1)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def events(rows: int):
+    for i in range(rows):
+        yield (str(uuid.UUID(int=i)), f"user-{i % USERS}", f"resource-{(i * 7) % RESOURCES}",
+               START + timedelta(seconds=i * 3), i % 600, DEVICES[i % 3], f"session-{i // 20}")
+
+
+def run_dicts(rows: int):
+    table = {}
+    before = rss_mb()
+    for view_id, user, resource, timestamp, duration, device, session in events(rows):
+        table[view_id] = {
+            "view_id": view_id, "user_id": user, "resource_id": resource,
+            "view_timestamp": timestamp.isoformat(), "view_duration_seconds": duration,
+            "device_type": device, "session_id": session
+        }
+    memory = rss_mb() - before
+
+    since, until = (START + timedelta(days=1)).isoformat(), (START + timedelta(days=2)).isoformat()
+    timings = [
+        timed(lambda: [r for r in table.values() if r["user_id"] == "user-42"]),
+        timed(lambda: [r for r in table.values() if r["resource_id"] == "resource-42"]),
+        timed(lambda: [r for r in table.values() if since <= r["view_timestamp"] < until]),
+    ]
+    report("dict rows", memory, timings)
+
+
+def run_columnar(rows: int):
+    from activity_store import ActivityStore
+
+    store = ActivityStore()
+    before = rss_mb()
+    for event in events(rows):
+        store.log_view(*event)
+    memory = rss_mb() - before
+
+    since, until = START + timedelta(days=1), START + timedelta(days=2)
+    timings = [
+        timed(lambda: store.scan(store.views, user_id="user-42")),
+        timed(lambda: store.scan(store.views, resource_id="resource-42")),
+        timed(lambda: store.scan(store.views, since=since, until=until)),
+    ]
+    report("columnar", memory, timings)
+
+
+def timed(scan) -> tuple:
+    started = time.perf_counter()
+    result = scan()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return len(result["row"]) if isinstance(result, dict) else len(result), elapsed_ms
+
+
+def report(name: str, memory: float, timings: list):
+    scans = "  ".join(f"{hits:>6} hits {ms:>8.2f} ms" for hits, ms in timings)
+    print(f"{name:<10} {memory:>9.1f} MB   {scans}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--single", choices=["dicts", "columnar"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        (run_dicts if args.single == "dicts" else run_columnar)(args.rows)
+        sys.exit(0)
+
+    print(f"{args.rows:,} view events; scans: by user | by resource | one-day range")
+    print(f"{'layout':<10} {'memory':>12}")
+    for mode in ("dicts", "columnar"):
+        subprocess.run([sys.executable, __file__, "--rows", str(args.rows), "--single", mode], check=True)
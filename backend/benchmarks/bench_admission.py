@@ -0,0 +1,179 @@
+"""
+Benchmark: load shedding under overload
+
+Serves an endpoint that costs a fixed amount of event-loop CPU per request
+from a uvicorn subprocess and drives it over HTTP with open-loop Poisson
+arrivals at a multiple of its capacity, once without and once with
+AdmissionControlMiddleware. Reports goodput, shed rate and the
+latency of successful requests; without shedding the queue (and every
+client's latency) keeps growing for as long as the overload lasts.
+
+Also reports the middleware's own overhead per admitted request, measured
+by calling it directly around a trivial ASGI app.
+
+Usage (from backend/):
+    python benchmarks/bench_admission.py --service-ms 10 --overload 2 --seconds 5
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import httpx
+import numpy as np
+import uvicorn
+from fastapi import FastAPI
+from starlette.middleware.authentication import AuthenticationMiddleware
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from admission import AdmissionControl, AdmissionControlMiddleware
+from session_tokens import BearerTokenBackend, SessionTokens
+
+
+def build_app(service_seconds: float, control: AdmissionControl = None) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/work")
+    async def work():
+        await asyncio.sleep(0)               # yield once, like a handler awaiting a repository
+        deadline = time.perf_counter() + service_seconds
+        while time.perf_counter() < deadline:
+            pass
+        return {"ok": True}
+
+    if control is not None:
+        app.add_middleware(AdmissionControlMiddleware, control=control)
+    return app
+
+
+def serve(port: int, service_seconds: float, max_queue_seconds: float, loop: str):
+    control = None
+    if max_queue_seconds:
+        control = AdmissionControl(rate_per_second=1e9, burst=1e9, max_concurrency=4,
+                                   max_queue_seconds=max_queue_seconds)
+    app = build_app(service_seconds, control)
+
+    @app.get("/stats")
+    async def stats():
+        return control.stats() if control else {}
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", loop=loop)
+
+
+async def request(port: int, payload: bytes) -> int:
+    """POST over a fresh connection with raw asyncio streams (keeps the client cheap)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(payload)
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    return int(status_line.split()[1])
+
+
+async def drive(port: int, rate: float, seconds: float) -> dict:
+    latencies, statuses = [], []
+    rng = random.Random(1)
+
+    for _ in range(100):                        # wait for the server to start
+        try:
+            await request(port, b"GET /stats HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n")
+            break
+        except OSError:
+            await asyncio.sleep(0.1)
+
+    async def one(payload: bytes):
+        started = time.perf_counter()
+        status = await request(port, payload)
+        statuses.append(status)
+        if status == 200:
+            latencies.append(time.perf_counter() - started)
+
+    tasks, started = [], time.perf_counter()
+    next_arrival = started
+    while next_arrival - started < seconds:
+        await asyncio.sleep(max(next_arrival - time.perf_counter(), 0))
+        payload = b"POST /work HTTP/1.1\r\nHost: bench\r\nContent-Length: 0\r\nConnection: close\r\n\r\n"
+        tasks.append(asyncio.create_task(one(payload)))
+        next_arrival += rng.expovariate(rate)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}") as client:
+        counters = (await client.get("/stats")).json()
+
+    ok = statuses.count(200)
+    return {
+        "sent": len(statuses), "ok": ok, "shed": statuses.count(503), "limited": statuses.count(429),
+        "goodput": ok / elapsed, "elapsed": elapsed,
+        "p50": np.percentile(latencies, 50) * 1000 if latencies else 0.0,
+        "p99": np.percentile(latencies, 99) * 1000 if latencies else 0.0,
+        "counters": counters,
+    }
+
+
+async def overhead(requests: int) -> float:
+    """Mean time the middleware adds per admitted request (session-token check and per-user bucket)"""
+    body = json.dumps({"user_id": "user-1", "limit": 10}).encode()
+    headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    tokens = SessionTokens(b"bench-secret")
+    authorization = [(b"authorization", f"Bearer {tokens.issue(f'user-{i}')}".encode()) for i in range(1000)]
+
+    async def endpoint(scope, receive, send):
+        await receive()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        pass
+
+    middleware = AuthenticationMiddleware(
+        AdmissionControlMiddleware(endpoint, AdmissionControl(rate_per_second=1e9, burst=1e9)),
+        backend=BearerTokenBackend(tokens))
+    results = []
+    for app in (endpoint, middleware) * 2:
+        started = time.perf_counter()
+        for i in range(requests):
+            scope = {"type": "http", "method": "POST", "path": "/work", "headers": headers + [authorization[i % 1000]],
+                     "client": (f"10.0.{i % 250}.1", 5000)}
+            await app(scope, receive, send)
+        results.append((time.perf_counter() - started) / requests)
+    return (results[3] - results[2]) * 1e6
+
+
+async def main(service_ms: float, overload: float, seconds: float, max_queue_ms: float, port: int, loop: str):
+    capacity = 1000.0 / service_ms
+    rate = capacity * overload
+    print(f"capacity ~{capacity:.0f} req/s, offered {rate:.0f} req/s for {seconds:.0f}s ({loop} event loop)")
+    for name, max_queue in [("no admission control", 0.0),
+                            (f"admission control (max queue {max_queue_ms:.0f} ms)", max_queue_ms / 1000)]:
+        server = multiprocessing.Process(target=serve, args=(port, service_ms / 1000, max_queue, loop),
+                                         daemon=True)
+        server.start()
+        try:
+            r = await drive(port, rate, seconds)
+        finally:
+            server.terminate()
+            server.join()
+        print(f"{name:<42} ok {r['ok']:>6,}  shed {r['shed']:>6,}  goodput {r['goodput']:>6.0f}/s  "
+              f"latency p50 {r['p50']:>7.0f} ms  p99 {r['p99']:>7.0f} ms")
+        if r["counters"]:
+            print(f"  counters: {r['counters']}")
+    print(f"middleware overhead: {await overhead(50000):.1f} us/request")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service-ms", type=float, default=10.0, help="CPU time per request")
+    parser.add_argument("--overload", type=float, default=2.0, help="offered load / capacity")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--max-queue-ms", type=float, default=100.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--loop", default="asyncio", help="uvicorn event loop (asyncio or uvloop)")
+    args = parser.parse_args()
+    asyncio.run(main(args.service_ms, args.overload, args.seconds, args.max_queue_ms, args.port, args.loop))
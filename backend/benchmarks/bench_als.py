@@ -0,0 +1,90 @@
+"""
+Benchmark: collaborative model training cost vs users x resources
+
+Trains implicit-feedback ALS on synthetic interactions for a grid of sizes
+(each user touches `--per-user` resources drawn from a few taste clusters)
+and reports, per size:
+
+  train        wall-clock seconds of train_model_version (the worker-process job)
+  peak         peak Python/NumPy allocation while training (tracemalloc)
+  factors      bytes of the mmap'd user + resource factor files
+  load         time to map a version and build its lookups (before the swap)
+  top-k        p50 / p99 latency of one user's top-10 from the mapped factors
+
+Usage (from backend/):
+    python benchmarks/bench_als.py --users 1000,10000,100000 --resources 1000,10000 --per-user 20
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from factor_model import DEFAULT_ALPHA, DEFAULT_FACTORS, DEFAULT_ITERATIONS, DEFAULT_REGULARIZATION, \
+    FactorModel, train_model_version
+
+
+def synthetic(n_users: int, n_items: int, per_user: int, clusters: int = 20, seed: int = 0):
+    """Each user draws resources from its cluster's slice of the catalogue (80%) or anywhere"""
+    rng = np.random.default_rng(seed)
+    user = np.repeat(np.arange(n_users, dtype=np.int32), per_user)
+    span = max(n_items // clusters, 1)
+    home = (user % clusters) * span
+    item = np.where(rng.random(len(user)) < 0.8, home + rng.integers(0, span, len(user)),
+                    rng.integers(0, n_items, len(user))).astype(np.int32) % n_items
+    weight = 0.2 + 0.8 * rng.random(len(user))
+    return user, item, weight
+
+
+def measure(directory: str, n_users: int, n_items: int, per_user: int, factors: int, iterations: int):
+    user, item, weight = synthetic(n_users, n_items, per_user)
+    params = {"factors": factors, "iterations": iterations,
+              "regularization": DEFAULT_REGULARIZATION, "alpha": DEFAULT_ALPHA}
+    stats = train_model_version(directory, f"{n_users}x{n_items}", user, item, weight,
+                                [f"u{i}" for i in range(n_users)], [f"r{i}" for i in range(n_items)],
+                                np.zeros(0, np.int64), params)
+
+    started = time.perf_counter()
+    model = FactorModel(os.path.join(directory, f"als-{stats['version']}"))
+    load = time.perf_counter() - started
+
+    rng = np.random.default_rng(1)
+    latencies = []
+    for row in rng.integers(0, n_users, 500):
+        started = time.perf_counter()
+        model.top_k(f"u{row}", 10)
+        latencies.append(time.perf_counter() - started)
+    return stats, load, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def main(users: list, resources: list, per_user: int, factors: int, iterations: int):
+    directory = tempfile.mkdtemp(prefix="bench-als-")
+    print(f"{per_user} interactions per user, {factors} factors, {iterations} iterations")
+    print(f"{'users':>9} {'resources':>9} {'interactions':>12} {'train':>9} {'peak':>10} "
+          f"{'factors':>10} {'load':>9} {'top-k p50':>10} {'p99':>9}")
+    try:
+        for n_users in users:
+            for n_items in resources:
+                stats, load, p50, p99 = measure(directory, n_users, n_items, per_user, factors, iterations)
+                print(f"{n_users:>9,} {n_items:>9,} {stats['interactions']:>12,} {stats['train_seconds']:>8.2f}s "
+                      f"{stats['peak_training_bytes'] / 1e6:>7.1f} MB {stats['factor_bytes'] / 1e6:>7.1f} MB "
+                      f"{load * 1e3:>7.1f}ms {p50 * 1e6:>8.0f}us {p99 * 1e6:>7.0f}us")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="1000,10000,100000")
+    parser.add_argument("--resources", default="1000,10000")
+    parser.add_argument("--per-user", type=int, default=20)
+    parser.add_argument("--factors", type=int, default=DEFAULT_FACTORS)
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    args = parser.parse_args()
+    main([int(n) for n in args.users.split(",")], [int(n) for n in args.resources.split(",")],
+         args.per_user, args.factors, args.iterations)
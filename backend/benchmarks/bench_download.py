@@ -0,0 +1,182 @@
+"""
+Benchmark: download throughput against static file servers
+
+Uploads one large file through the app, then fetches it with curl from
+three servers on the same machine:
+
+  app download     GET /api/cqrs/resources/{id}/download (full app stack)
+  StaticFiles      Starlette's StaticFiles serving the same stored object
+  sendfile()       minimal asyncio server, loop.sendfile() of the whole file
+                   (zero-copy ceiling, no HTTP framework at all)
+
+Reports MB/s for sequential whole-file downloads and for concurrent
+downloads, plus a ranged request and a client that disconnects part way
+(checks that neither one counts as a download).
+
+Usage (from backend/):
+    python benchmarks/bench_download.py --size-mb 256 --rounds 5 --concurrency 4
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def serve_app(port: int, upload_dir: str, loop: str):
+    os.environ.update(STATE_DIR="", UPLOAD_DIR=upload_dir, RATE_LIMIT_PER_SECOND="1e9", RATE_LIMIT_BURST="1e9")
+    sys.stdout = open(os.devnull, "w")
+    import uvicorn
+    import cqrs_eda_implementation as app
+    uvicorn.run(app.app, host="127.0.0.1", port=port, log_level="warning", loop=loop)
+
+
+def serve_static(port: int, directory: str, loop: str):
+    import uvicorn
+    from starlette.applications import Starlette
+    from starlette.routing import Mount
+    from starlette.staticfiles import StaticFiles
+    app = Starlette(routes=[Mount("/static", StaticFiles(directory=directory))])
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", loop=loop)
+
+
+def serve_sendfile(port: int, path: str):
+    size = os.path.getsize(path)
+
+    class Protocol(asyncio.Protocol):
+        def connection_made(self, transport):
+            self.transport = transport
+            self.buffer = b""
+
+        def data_received(self, data):
+            self.buffer += data
+            if b"\r\n\r\n" in self.buffer:
+                asyncio.ensure_future(self.respond())
+
+        async def respond(self):
+            self.transport.write(f"HTTP/1.1 200 OK\r\nContent-Length: {size}\r\n"
+                                 f"Content-Type: application/octet-stream\r\nConnection: close\r\n\r\n".encode())
+            with open(path, "rb") as f:
+                await asyncio.get_running_loop().sendfile(self.transport, f)
+            self.transport.close()
+
+    async def main():
+        server = await asyncio.get_running_loop().create_server(Protocol, "127.0.0.1", port)
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def wait_until_up(url: str):
+    for _ in range(100):
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+def curl(url: str) -> float:
+    """Download a URL to /dev/null, returns bytes/second"""
+    out = subprocess.run(["curl", "-s", "-o", "/dev/null", "-w", "%{speed_download}", url],
+                         check=True, capture_output=True, text=True).stdout
+    return float(out.replace(",", "."))
+
+
+def measure(url: str, rounds: int, concurrency: int, size: int) -> tuple:
+    sequential = statistics.median(curl(url) for _ in range(rounds))
+    started = time.perf_counter()
+    procs = [subprocess.Popen(["curl", "-s", "-o", "/dev/null", url]) for _ in range(concurrency)]
+    for proc in procs:
+        proc.wait()
+    aggregate = concurrency * size / (time.perf_counter() - started)
+    return sequential / 1e6, aggregate / 1e6
+
+
+def disconnect_after(port: int, path: str, read_bytes: int):
+    """Read part of a download, then drop the connection"""
+    async def run():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path}?user_id=bench HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+        await reader.readexactly(read_bytes)
+        writer.close()
+    asyncio.run(run())
+
+
+def main(size_mb: int, rounds: int, concurrency: int, loop: str):
+    work = tempfile.mkdtemp(prefix="bench-download-")
+    upload_dir = os.path.join(work, "uploads")
+    size = size_mb * 1024 * 1024
+    source = os.path.join(work, "lecture.mp4")
+    with open(source, "wb") as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(1024 * 1024))
+
+    servers = []
+    try:
+        servers.append(multiprocessing.Process(target=serve_app, args=(8871, upload_dir, loop), daemon=True))
+        servers[-1].start()
+        wait_until_up("http://127.0.0.1:8871/")
+        with httpx.Client(base_url="http://127.0.0.1:8871", timeout=600) as client:
+            user_id = client.post("/api/cqrs/auth/register", json={
+                "username": "bench", "email": "bench@example.com", "password": "x", "full_name": "Bench"
+            }).json()["data"]["user_id"]
+            with open(source, "rb") as f:
+                resource = client.post("/api/cqrs/resources/upload", data={
+                    "title": "Lecture", "description": "week 1", "resource_type": "video",
+                    "difficulty_level": "beginner", "uploader_user_id": user_id
+                }, files={"file": ("lecture.mp4", f, "video/mp4")}).json()["data"]
+        checksum = resource["checksum"]
+        stored = os.path.join(upload_dir, "objects", checksum[:2], checksum)
+
+        servers.append(multiprocessing.Process(target=serve_static, args=(8872, os.path.dirname(stored), loop),
+                                               daemon=True))
+        servers.append(multiprocessing.Process(target=serve_sendfile, args=(8873, stored), daemon=True))
+        for server in servers[1:]:
+            server.start()
+        wait_until_up("http://127.0.0.1:8872/")
+        wait_until_up("http://127.0.0.1:8873/")
+
+        download = f"http://127.0.0.1:8871{resource['file_url']}"
+        print(f"{size_mb} MB file, {rounds} sequential rounds (median), {concurrency} concurrent, {loop} loop")
+        print(f"{'server':<16} {'sequential':>12} {'concurrent':>12}")
+        for name, url in [("app download", download),
+                          ("StaticFiles", f"http://127.0.0.1:8872/static/{checksum}"),
+                          ("sendfile()", "http://127.0.0.1:8873/")]:
+            sequential, aggregate = measure(url, rounds, concurrency, size)
+            print(f"{name:<16} {sequential:>8.0f} MB/s {aggregate:>8.0f} MB/s")
+
+        ranged = httpx.get(download, headers={"Range": "bytes=1048576-2097151"})
+        print(f"\nrange request: {ranged.status_code} {ranged.headers['content-range']} "
+              f"({len(ranged.content):,} bytes)")
+
+        disconnect_after(8871, resource["file_url"], 4 * 1024 * 1024)
+        time.sleep(1)
+        details = httpx.get(f"http://127.0.0.1:8871/api/cqrs/resources/{resource['resource_id']}").json()["data"]
+        print(f"download_count after {rounds + concurrency} full downloads, 1 range and 1 aborted: "
+              f"{details['download_count']}")
+    finally:
+        for server in servers:
+            server.terminate()
+            server.join()
+        subprocess.run(["rm", "-rf", work])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--loop", default="asyncio", help="uvicorn event loop (asyncio or uvloop)")
+    args = parser.parse_args()
+    main(args.size_mb, args.rounds, args.concurrency, args.loop)
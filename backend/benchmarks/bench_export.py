@@ -0,0 +1,107 @@
+"""
+Benchmark: Parquet export throughput and event-loop impact
+
+Fills the activity store and event log with synthetic rows, runs a full
+export and then an incremental one, and reports rows/sec per table plus the
+worst event-loop stall seen by a 10 ms ticker while the export runs.
+
+Usage (from backend/):
+    python benchmarks/bench_export.py --views 1000000 --events 200000 --recommendations 1000000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ["STATE_DIR"] = ""
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import cqrs_eda_implementation as app
+from exporter import build_exporter
+
+START = datetime(2024, 1, 1)
+
+
+def populate(views: int, events: int, recommendations: int = 0):
+    store = app.activity_store
+    table = app.recommendations_generated_db
+    offset = len(table)
+    for i in range(offset, offset + recommendations):
+        table[str(uuid.UUID(int=i))] = {
+            "recommendation_id": str(uuid.UUID(int=i)), "user_id": f"user-{i % 5000}",
+            "resource_id": f"resource-{(i * 11) % 20000}", "algorithm_used": "hybrid",
+            "confidence_score": 0.5, "reason": "Matches your interests",
+            "generated_at": (START + timedelta(seconds=i * 2)).isoformat(), "position": i % 10,
+        }
+    for i in range(views):
+        store.log_view(str(uuid.UUID(int=i)), f"user-{i % 5000}", f"resource-{(i * 7) % 20000}",
+                       START + timedelta(seconds=i * 3), i % 600, "desktop", f"session-{i // 20}")
+    for i in range(views // 50):
+        store.add_rating(str(uuid.UUID(int=i)), f"user-{i % 5000}", f"resource-{i % 20000}",
+                         1 + i % 5, "great" if i % 3 == 0 else "", START + timedelta(seconds=i * 150))
+    for i in range(events):
+        app.event_bus.event_log.append(app.Event(
+            event_id=str(uuid.UUID(int=i)), event_type="ResourceViewedEvent",
+            timestamp=(START + timedelta(seconds=i * 15)).isoformat(),
+            data={"user_id": f"user-{i % 5000}", "resource_id": f"resource-{i % 20000}",
+                  "view_duration_seconds": i % 600}))
+
+
+async def ticker(stalls: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        stalls.append(time.perf_counter() - started - 0.01)
+
+
+async def timed_export(exporter):
+    stalls, stop = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(stalls, stop))
+    started = time.perf_counter()
+    written = await exporter.export()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await tick
+    return written, elapsed, max(stalls, default=0.0) * 1000
+
+
+async def main(views: int, events: int, recommendations: int, batch_rows: int):
+    populate(views, events, recommendations)
+    out = tempfile.mkdtemp(prefix="ssr-export-")
+    try:
+        exporter = build_exporter(out, app.activity_store, app.recommendations_generated_db,
+                                  app.event_bus.event_log, batch_rows)
+        written, elapsed, stall = await timed_export(exporter)
+        total = sum(written.values())
+        print(f"full export: {total:,} rows in {elapsed:.2f}s = {total / elapsed:,.0f} rows/s "
+              f"(max loop stall {stall:.1f} ms)")
+        for name, rows in written.items():
+            print(f"  {name:<28} {rows:>10,} rows")
+        size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(out) for f in files)
+        print(f"  {size / 1e6:.1f} MB on disk")
+
+        populate(views // 100, events // 100, recommendations // 100)
+        written, elapsed, stall = await timed_export(exporter)
+        total = sum(written.values())
+        print(f"incremental export: {total:,} new rows in {elapsed:.2f}s (max loop stall {stall:.1f} ms)")
+    finally:
+        shutil.rmtree(out, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--views", type=int, default=1_000_000)
+    parser.add_argument("--events", type=int, default=200_000)
+    parser.add_argument("--recommendations", type=int, default=200_000)
+    parser.add_argument("--batch-rows", type=int, default=65536)
+    args = parser.parse_args()
+    asyncio.run(main(args.views, args.events, args.recommendations, args.batch_rows))
@@ -0,0 +1,121 @@
+"""
+Benchmark: near-duplicate detection insert/query cost
+
+Uploads synthetic resources (title + description drawn from a Zipf-like
+vocabulary) through the same signature -> query -> add path as
+UploadResourceCommandHandler. Every tenth upload re-uses an earlier
+resource's text with 2% of its words changed. Runs inside an event loop,
+yielding after every upload, so sorted-array merges run in a worker thread
+as they do in the app (add max is the longest event-loop stall of an
+insert). Reports per-step cost as
+the index grows, recall on the planted duplicates, false matches, index
+memory, and a brute-force comparison against every stored signature.
+
+Usage (from backend/):
+    python benchmarks/bench_near_duplicates.py --resources 1000000
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from near_duplicates import NearDuplicateIndex
+
+VOCABULARY = [f"term{i}" for i in range(50_000)]
+CUM_WEIGHTS = list(itertools.accumulate(1.0 / (rank + 10) for rank in range(len(VOCABULARY))))
+DUPLICATE_EVERY = 10
+
+
+def make_text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=words))
+
+
+def near_copy(rng: random.Random, text: str) -> str:
+    words = text.split()
+    for _ in range(max(len(words) // 50, 1)):
+        words[rng.randrange(len(words))] = rng.choice(VOCABULARY)
+    return " ".join(words)
+
+
+def percentile(values: list, p: float) -> float:
+    return float(np.percentile(values, p)) * 1e6 if values else 0.0
+
+
+async def main(resources: int, words: int, checkpoints: int):
+    rng = random.Random(7)
+    index = NearDuplicateIndex()
+    texts, source, root = [], {}, {}      # root: first upload of each duplicate cluster
+    step = max(resources // checkpoints, 1)
+    sign, query, add = [], [], []
+    found = missed = false_matches = 0
+    started = time.perf_counter()
+
+    print(f"{'indexed':>10} {'signature':>10} {'query p50':>10} {'query p99':>10} {'add mean':>10} {'add max':>10}")
+    for i in range(resources):
+        if i >= DUPLICATE_EVERY and i % DUPLICATE_EVERY == 0:
+            original = rng.randrange(i)
+            source[i] = original
+            root[i] = root.get(original, original)
+            text = near_copy(rng, texts[original])
+        else:
+            text = make_text(rng, words)
+        texts.append(text)
+
+        t0 = time.perf_counter()
+        signature = index.signature(text)
+        t1 = time.perf_counter()
+        matches = index.query(signature)
+        t2 = time.perf_counter()
+        index.add(str(i), signature)
+        t3 = time.perf_counter()
+        await asyncio.sleep(0)                # the next request; a merge finishes in the background
+        sign.append(t1 - t0)
+        query.append(t2 - t1)
+        add.append(t3 - t2)
+
+        ids = {int(resource_id) for resource_id, _ in matches}
+        if i in source:
+            found += source[i] in ids
+            missed += source[i] not in ids
+        false_matches += sum(root.get(j, j) != root.get(i, i) for j in ids)
+
+        if (i + 1) % step == 0:
+            print(f"{i + 1:>10,} {np.mean(sign) * 1e6:>8.0f}us {percentile(query, 50):>8.0f}us "
+                  f"{percentile(query, 99):>8.0f}us {np.mean(add) * 1e6:>8.1f}us {max(add) * 1e3:>8.1f}ms")
+            sign, query, add = [], [], []
+
+    elapsed = time.perf_counter() - started
+    index.merge()
+    print(f"\n{resources:,} uploads in {elapsed:.0f}s ({resources / elapsed:,.0f}/s end to end)")
+    print(f"planted duplicates found: {found:,} / {found + missed:,} ({found / max(found + missed, 1):.1%})")
+    print(f"matches that were not planted duplicates: {false_matches:,}")
+    print(f"index memory: {index.nbytes() / 1e6:.0f} MB ({index.nbytes() / resources:.0f} bytes/resource)")
+
+    # Brute force: compare a signature against every stored signature
+    probes = [index.signature(texts[rng.randrange(resources)]) for _ in range(100)]
+    t0 = time.perf_counter()
+    for probe in probes:
+        index.query(probe)
+    lsh = (time.perf_counter() - t0) / len(probes)
+    t0 = time.perf_counter()
+    for probe in probes[:10]:
+        for block in index._blocks:
+            ((block == probe.astype(np.uint16)).mean(axis=1) >= index.threshold).nonzero()
+    brute = (time.perf_counter() - t0) / 10
+    print(f"query at {resources:,}: LSH {lsh * 1e6:.0f}us vs brute-force scan {brute * 1e3:.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resources", type=int, default=1_000_000)
+    parser.add_argument("--words", type=int, default=100, help="words per title + description")
+    parser.add_argument("--checkpoints", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.resources, args.words, args.checkpoints))
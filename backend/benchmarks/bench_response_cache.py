@@ -0,0 +1,115 @@
+"""
+Benchmark: cached detail queries vs assembling every response
+
+Uploads N resources, then reads resource details through the full ASGI
+app (middleware, routing, handler, serialization) four ways:
+
+  assembled      the previous endpoint: assemble the record, QueryResult,
+                 FastAPI validation and JSON encoding on every read
+  cache miss     the cached endpoint right after the resource changed
+  cache hit      the cached endpoint, body sent from the cache
+  304            the cached endpoint with a matching If-None-Match
+
+Usage (from backend/):
+    python benchmarks/bench_response_cache.py --resources 10000 --reads 20000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+os.environ.setdefault("STATE_DIR", "")
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "1e9")
+os.environ.setdefault("RATE_LIMIT_BURST", "1e9")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import cqrs_eda_implementation as app
+
+
+@app.app.get("/bench/assembled/{resource_id}")
+async def assembled(resource_id: str):
+    return app.QueryResult(success=True, data=await app.assemble_resource_details(resource_id))
+
+
+async def populate(resources: int):
+    with contextlib.redirect_stdout(io.StringIO()):
+        user = await app.RegisterUserCommandHandler.handle(app.RegisterUserCommand(
+            username="bench", email="bench@example.com", password="x", full_name="Bench"))
+        user_id = user.data["user_id"]
+        ids = []
+        for i in range(resources):
+            resource = await app.UploadResourceCommandHandler.handle(app.UploadResourceCommand(
+                title=f"Resource {i}", description=f"notes number {i} on topic {i % 97}",
+                resource_type="pdf", difficulty_level="beginner",
+                uploader_user_id=user_id, file_name=f"r{i}.pdf"))
+            ids.append(resource.data["resource_id"])
+    return ids
+
+
+async def get(path: str, headers: list) -> tuple:
+    """One GET through the ASGI app; returns (status, ETag, body)"""
+    scope = {"type": "http", "http_version": "1.1", "method": "GET", "path": path, "raw_path": path.encode(),
+             "root_path": "", "scheme": "http", "query_string": b"", "headers": headers,
+             "client": ("127.0.0.1", 5000), "server": ("bench", 80)}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app.app(scope, receive, send)
+    start = sent[0]
+    etag = dict(start["headers"]).get(b"etag")
+    return start["status"], etag, b"".join(m.get("body", b"") for m in sent[1:])
+
+
+async def measure(name: str, ids: list, reads: int, path: str, before=None, conditional: dict = None):
+    rng = random.Random(3)
+    latencies, status = [], None
+    for _ in range(reads):
+        resource_id = rng.choice(ids)
+        headers = [(b"if-none-match", conditional[resource_id])] if conditional else []
+        if before:
+            before(resource_id)
+        started = time.perf_counter()
+        status, _, _ = await get(path.format(resource_id), headers)
+        latencies.append(time.perf_counter() - started)
+    print(f"{name:<12} status {status}  mean {np.mean(latencies) * 1e6:>7.1f}us  "
+          f"p50 {np.percentile(latencies, 50) * 1e6:>7.1f}us  p99 {np.percentile(latencies, 99) * 1e6:>7.1f}us")
+
+
+async def main(resources: int, reads: int):
+    started = time.perf_counter()
+    ids = await populate(resources)
+    print(f"uploaded {resources:,} resources in {time.perf_counter() - started:.1f}s")
+
+    # Same bytes either way
+    _, _, legacy = await get(f"/bench/assembled/{ids[0]}", [])
+    _, _, cached = await get(f"/api/cqrs/resources/{ids[0]}", [])
+    assert legacy == cached, (legacy, cached)
+
+    await measure("assembled", ids, reads, "/bench/assembled/{}")
+    await measure("cache miss", ids, reads, "/api/cqrs/resources/{}",
+                  before=lambda rid: app.response_cache.bump(("resource", rid)))
+    etags = {}
+    for resource_id in ids:                                  # warm every entry
+        etags[resource_id] = (await get(f"/api/cqrs/resources/{resource_id}", []))[1]
+    await measure("cache hit", ids, reads, "/api/cqrs/resources/{}")
+    await measure("304", ids, reads, "/api/cqrs/resources/{}", conditional=etags)
+    print(f"cache: {app.response_cache.summary()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resources", type=int, default=10_000)
+    parser.add_argument("--reads", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.resources, args.reads))
@@ -0,0 +1,115 @@
+"""
+Benchmark: cold restart time from snapshot + WAL
+
+Builds a state directory holding N activity rows plus a WAL tail, then
+restarts in a fresh process and reports how long recovery takes. Also
+times a background snapshot (a separate process rebuilding the snapshot
+from the previous one plus a WAL tail) and how long it holds the event loop.
+
+Usage (from backend/):
+    python benchmarks/bench_restart.py --rows 1000000 --wal 10000
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def build(state_dir: str, rows: int, wal: int):
+    os.environ["STATE_DIR"] = state_dir
+    import cqrs_eda_implementation as app
+
+    async def run():
+        await app.state_store.recover()
+        with contextlib.redirect_stdout(io.StringIO()):
+            user = await app.RegisterUserCommandHandler.handle(app.RegisterUserCommand(
+                username="bench", email="bench@example.com", password="x", full_name="Bench"))
+            user_id = user.data["user_id"]
+            resource = await app.UploadResourceCommandHandler.handle(app.UploadResourceCommand(
+                title="Bench", description="", resource_type="pdf", difficulty_level="beginner",
+                uploader_user_id=user_id, file_name="bench.pdf"))
+            resource_id = resource.data["resource_id"]
+
+        started = time.perf_counter()
+        timestamp = app.now()
+        for i in range(rows):
+            app.activity_store.log_view(f"{i:032x}", user_id, resource_id, timestamp,
+                                        i % 600, "desktop", "bench")
+        print(f"populated {rows:,} rows in {time.perf_counter() - started:.2f}s")
+
+        started = time.perf_counter()
+        app.state_store.snapshot(background=False)
+        size = os.path.getsize(os.path.join(state_dir, "snapshot.bin"))
+        print(f"snapshot written in {time.perf_counter() - started:.2f}s ({size / 1e6:.1f} MB)")
+
+        async def wal_tail():
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(wal):
+                    await app.LogResourceViewCommandHandler.handle(app.LogResourceViewCommand(
+                        user_id=user_id, resource_id=resource_id, view_duration_seconds=60, session_id="tail"))
+
+        await wal_tail()
+        started = time.perf_counter()
+        app.state_store.snapshot()
+        cut = time.perf_counter()
+        ok = await app.state_store.wait_for_snapshot()
+        size = os.path.getsize(os.path.join(state_dir, "snapshot.bin"))
+        print(f"background snapshot over {wal:,} WAL commands: event loop held {(cut - started) * 1e3:.1f} ms, "
+              f"written in {time.perf_counter() - started:.2f}s ({size / 1e6:.1f} MB, ok={ok})")
+
+        await wal_tail()
+        app.state_store.close()
+        print(f"wrote WAL tail of {wal:,} commands")
+
+    asyncio.run(run())
+
+
+def restart(state_dir: str):
+    started = time.perf_counter()
+    os.environ["STATE_DIR"] = state_dir
+    with contextlib.redirect_stdout(io.StringIO()):
+        import cqrs_eda_implementation as app
+    imported = time.perf_counter()
+
+    async def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return await app.state_store.recover()
+
+    stats = asyncio.run(run())
+    recovered = time.perf_counter()
+    print(f"import: {imported - started:.3f}s")
+    print(f"recover: {recovered - imported:.3f}s {stats}")
+    print(f"ready to serve after {recovered - started:.3f}s")
+
+    started = time.perf_counter()
+    durations = app.activity_store.scan(app.activities_views_db, columns=["duration"])["duration"]
+    print(f"first full scan of activities_views ({len(durations):,} rows, mapped from the snapshot): "
+          f"{time.perf_counter() - started:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--wal", type=int, default=10_000)
+    parser.add_argument("--restart-only", metavar="STATE_DIR")
+    args = parser.parse_args()
+
+    if args.restart_only:
+        restart(args.restart_only)
+        sys.exit(0)
+
+    state_dir = tempfile.mkdtemp(prefix="ssr-bench-")
+    try:
+        build(state_dir, args.rows, args.wal)
+        subprocess.run([sys.executable, __file__, "--restart-only", state_dir], check=True)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
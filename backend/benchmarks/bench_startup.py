@@ -0,0 +1,161 @@
+"""
+Benchmark: startup time, liveness and readiness
+
+1. Import profile: runs `python -X importtime -c "import cqrs_eda_implementation"`
+   in a fresh interpreter and lists the slowest top-level imports
+   (cumulative, including their own dependencies). With --max-import-ms the
+   script exits with status 1 when the app import exceeds the budget, so a
+   new eager heavy import fails CI instead of slowing every start.
+
+2. Time to live / ready: builds a state directory (snapshot plus a WAL tail
+   of --wal-views views), starts uvicorn on it and polls, from process
+   spawn:
+     live          GET /api/health/live answers 200
+     ready         GET /api/health/ready answers 200 (state recovered)
+     first query   GET /api/cqrs/events sent as soon as the server is live
+                   (held by the readiness gate, answered once ready)
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py --views 200000 --wal-views 20000 --max-import-ms 3000
+"""
+
+import argparse
+import contextlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND)
+
+
+def import_profile(top: int) -> float:
+    """Print the slowest top-level imports of the app module; returns the total in ms"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import cqrs_eda_implementation"],
+                            cwd=BACKEND, capture_output=True, text=True, env=dict(os.environ, STATE_DIR=""))
+    rows = []
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", line)
+        if match and len(match.group(3)) <= 3:             # the app and its direct imports
+            rows.append((int(match.group(2)) / 1000, match.group(4), len(match.group(3)) > 1))
+    total = next(ms for ms, name, _ in rows if name == "cqrs_eda_implementation")
+    print(f"import cqrs_eda_implementation: {total:.0f} ms")
+    for ms, name, _ in sorted((r for r in rows if r[2]), reverse=True)[:top]:
+        print(f"  {ms:>8.1f} ms  {name}")
+    return total
+
+
+def build_state(state_dir: str, views: int, wal_views: int):
+    """Snapshot with `views` views, then `wal_views` more views in the WAL"""
+    script = f"""
+import asyncio, contextlib, io, os, sys
+sys.path.insert(0, {BACKEND!r})
+os.environ["STATE_DIR"] = {state_dir!r}
+with contextlib.redirect_stdout(io.StringIO()):
+    import cqrs_eda_implementation as app
+
+async def main():
+    with contextlib.redirect_stdout(io.StringIO()):
+        await app.state_store.recover()
+        users = [(await app.RegisterUserCommandHandler.handle(app.RegisterUserCommand(
+            username=f"u{{i}}", email=f"u{{i}}@example.com", password="x", full_name="U"))).data["user_id"]
+            for i in range(200)]
+        resources = [(await app.UploadResourceCommandHandler.handle(app.UploadResourceCommand(
+            title=f"Resource {{i}}", description=f"notes {{i}} on topic {{i % 31}}", resource_type="pdf",
+            difficulty_level="beginner", uploader_user_id=users[0], file_name=f"r{{i}}.pdf"))).data["resource_id"]
+            for i in range(500)]
+        day = app.now()
+        for i in range({views}):                       # bulk history, straight into the columnar log
+            app.activity_store.log_view(app.new_id(), users[i % 200], resources[i * 7 % 500], day, 120,
+                                        "desktop", "s")
+        app.state_store.snapshot()
+        await app.state_store.wait_for_snapshot()
+        for i in range({wal_views}):
+            await app.LogResourceViewCommandHandler.handle(app.LogResourceViewCommand(
+                user_id=users[i % 200], resource_id=resources[i % 500], view_duration_seconds=60,
+                session_id="s"))
+    app.state_store.close()
+
+asyncio.run(main())
+"""
+    subprocess.run([sys.executable, "-c", script], check=True)
+
+
+def time_to_ready(state_dir: str, port: int) -> dict:
+    env = dict(os.environ, STATE_DIR=state_dir, MODEL_DIR=os.path.join(state_dir, "models"),
+               RATE_LIMIT_PER_SECOND="1e9", RATE_LIMIT_BURST="1e9")
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "cqrs_eda_implementation:app",
+                               "--port", str(port), "--log-level", "warning"],
+                              cwd=BACKEND, env=env, stdout=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    marks = {}
+    try:
+        with httpx.Client(timeout=60) as client:
+            while "live" not in marks:
+                with contextlib.suppress(httpx.HTTPError):
+                    if client.get(f"{base}/api/health/live").status_code == 200:
+                        marks["live"] = time.perf_counter() - started
+                time.sleep(0.005)
+
+            def first_query():
+                status = client.get(f"{base}/api/cqrs/events").status_code
+                marks["first query"] = time.perf_counter() - started
+                marks["first query status"] = status
+
+            query = threading.Thread(target=first_query)
+            query.start()
+            while client.get(f"{base}/api/health/ready").status_code != 200:
+                time.sleep(0.005)
+            marks["ready"] = time.perf_counter() - started
+            query.join()
+            marks["report"] = client.get(f"{base}/api/health/ready").json()
+    finally:
+        server.terminate()
+        server.wait()
+    return marks
+
+
+def main(views: int, wal_views: int, top: int, max_import_ms: float, port: int):
+    total = import_profile(top)
+
+    work = tempfile.mkdtemp(prefix="bench-startup-")
+    try:
+        state_dir = os.path.join(work, "state")
+        started = time.perf_counter()
+        build_state(state_dir, views, wal_views)
+        print(f"\nstate: {views:,} views in the snapshot, {wal_views:,} in the WAL "
+              f"(built in {time.perf_counter() - started:.1f}s)")
+        marks = time_to_ready(state_dir, port)
+        print(f"  live         {marks['live'] * 1e3:>8.0f} ms after spawn")
+        print(f"  ready        {marks['ready'] * 1e3:>8.0f} ms")
+        print(f"  first query  {marks['first query'] * 1e3:>8.0f} ms (status {marks['first query status']})")
+        report = marks["report"]
+        for name, component in report["components"].items():
+            print(f"    {name:<20} {component['state']:<8} {component['seconds'] * 1e3:>8.1f} ms"
+                  f"{'' if component['required'] else '  (optional)'}")
+        print(f"    imports: {report['import_seconds']}")
+    finally:
+        shutil.rmtree(work)
+
+    if max_import_ms and total > max_import_ms:
+        print(f"\nFAIL: app import took {total:.0f} ms, budget {max_import_ms:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--views", type=int, default=200_000)
+    parser.add_argument("--wal-views", type=int, default=20_000)
+    parser.add_argument("--top", type=int, default=12)
+    parser.add_argument("--max-import-ms", type=float, default=0, help="fail above this app import time")
+    parser.add_argument("--port", type=int, default=8874)
+    args = parser.parse_args()
+    main(args.views, args.wal_views, args.top, args.max_import_ms, args.port)
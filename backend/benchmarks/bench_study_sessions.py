@@ -0,0 +1,81 @@
+"""
+Benchmark: study-session aggregation throughput, memory and query latency
+
+Streams synthetic views (--users users studying in waves, each wave being a
+session of a few views spread over a few minutes, with breaks longer than
+the inactivity gap in between) through StudySessionStore.record_view and
+reports:
+
+  ingest       views per second through record_view
+  open         open sessions at the end (bounded by the users active within
+               one gap, not by the history)
+  records      closed sessions and bytes of their columnar rows
+  progress     p50 / p99 latency of one user's 7-day progress query
+
+Usage (from backend/):
+    python benchmarks/bench_study_sessions.py --users 10000 --days 30
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from activity_store import ActivityStore
+from study_sessions import StudySessionStore
+
+
+def stream(users: int, days: int, views_per_session: int, seed: int = 0):
+    """Views in time order: every user studies once a day at a random hour"""
+    rng = np.random.default_rng(seed)
+    day_start = 1_700_000_000 - 1_700_000_000 % 86400
+    for day in range(days):
+        starts = day_start + day * 86400 + rng.integers(0, 86400 - 3600, users)
+        user = np.repeat(np.arange(users), views_per_session)
+        at = np.repeat(starts, views_per_session) + np.tile(np.arange(views_per_session) * 180, users)
+        for i in np.argsort(at, kind="stable"):
+            yield int(user[i]), day, int(at[i])
+
+
+def main(users: int, days: int, views_per_session: int, resources: int):
+    activity = ActivityStore()
+    store = StudySessionStore(activity)
+    peak_open = 0
+    count = 0
+    started = time.perf_counter()
+    for user, day, at in stream(users, days, views_per_session):
+        store.record_view(f"u{user}", f"s{user}-{day}", f"r{(user * 31 + count) % resources}", at, 180,
+                          "mobile" if user % 3 == 0 else "desktop")
+        count += 1
+        if count % 10_000 == 0:
+            peak_open = max(peak_open, len(store.open))
+    ingest = time.perf_counter() - started
+    stats = store.stats()
+    print(f"{users:,} users x {days} days, {views_per_session} views per session")
+    print(f"  ingest    {count:,} views in {ingest:.2f}s ({count / ingest:,.0f} views/s)")
+    print(f"  open      {stats['open_sessions']:,} at the end, {peak_open:,} peak")
+    print(f"  records   {stats['closed_sessions']:,} sessions, {stats['session_resource_rows']:,} resource rows, "
+          f"{stats['record_bytes'] / 1e6:.1f} MB")
+
+    end = store.watermark + 1
+    rng = np.random.default_rng(1)
+    latencies = []
+    for user in rng.integers(0, users, 500):
+        started = time.perf_counter()
+        store.progress(f"u{user}", end - 7 * 86400, end, lambda resource_id: [resource_id[-1]])
+        latencies.append(time.perf_counter() - started)
+    print(f"  progress  p50 {np.percentile(latencies, 50) * 1e3:.2f} ms, "
+          f"p99 {np.percentile(latencies, 99) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--views-per-session", type=int, default=5)
+    parser.add_argument("--resources", type=int, default=5_000)
+    args = parser.parse_args()
+    main(args.users, args.days, args.views_per_session, args.resources)
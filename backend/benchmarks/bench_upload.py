@@ -0,0 +1,69 @@
+"""
+Benchmark: memory and throughput of streaming uploads
+
+Feeds synthetic multipart bodies of increasing size through the same
+parser the upload endpoint uses. Each size runs in a fresh process that
+reports MB/s and its peak RSS; peak memory should stay flat as files grow.
+
+Usage (from backend/):
+    python benchmarks/bench_upload.py --sizes-mb 1 10 100 500
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import resource
+import subprocess
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from file_storage import ContentStore, parse_streaming_upload
+
+BOUNDARY = "benchboundary"
+NETWORK_CHUNK = 64 * 1024
+
+
+async def body(size_bytes: int):
+    yield (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nBench\r\n"
+           f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bench.bin\"\r\n"
+           f"Content-Type: application/octet-stream\r\n\r\n").encode()
+    block = os.urandom(NETWORK_CHUNK)
+    sent = 0
+    while sent < size_bytes:
+        piece = block[:min(NETWORK_CHUNK, size_bytes - sent)]
+        sent += len(piece)
+        yield piece
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def run(size_mb: int):
+    root = tempfile.mkdtemp(prefix="ssr-upload-")
+    store = ContentStore(root, max_upload_bytes=1 << 40)
+    headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+    try:
+        started = time.perf_counter()
+        _, stored = await parse_streaming_upload(headers, body(size_mb * 1024 * 1024), store)
+        store.claim(stored.staged_path, stored.checksum)
+        elapsed = time.perf_counter() - started
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{size_mb:>6}MB {peak_rss_mb:>9.1f} MB {size_mb / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        asyncio.run(run(args.single))
+    else:
+        print(f"{'size':>8} {'peak RSS':>12} {'MB/s':>8}")
+        for size_mb in args.sizes_mb:
+            subprocess.run([sys.executable, __file__, "--single", str(size_mb)], check=True)
@@ -0,0 +1,187 @@
+"""
+Benchmark: throughput of the CQRS endpoints vs. number of uvicorn workers
+
+For each worker count, starts a state owner plus `uvicorn --workers N`
+(STATE_MODE=worker), then drives a request mix from several load-generator
+processes and reports requests per second. The 1-worker row runs in
+STATE_MODE=local as the baseline.
+
+    --mix writes   register/upload/view/rate/generate commands (run by the owner)
+    --mix reads    90% queries (resource/user details, analytics, study
+                   progress) answered by the workers' read replicas, 10% views
+
+It also reports the CPU time of the owner and of the workers: the owner's
+share is the serial part of the deployment, which bounds the speedup that
+more cores can give (1 / owner share). Scaling itself needs free cores:
+run with more CPUs than workers + load generators.
+
+Usage (from backend/):
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --seconds 10 --mix reads
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Tuple
+
+import httpx
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, BACKEND)
+
+
+async def drive(base_url: str, seconds: float, concurrency: int, seed: int, mix: str) -> int:
+    rng = random.Random(seed)
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        email = f"bench-{seed}-{time.time_ns()}@example.com"
+        r = await client.post("/api/cqrs/auth/register", json={
+            "username": "bench", "email": email, "password": "x", "full_name": "Bench"})
+        user_id = r.json()["data"]["user_id"]
+        resources = []
+        for i in range(5):
+            r = await client.post("/api/cqrs/resources/upload", data={
+                "title": f"R{i}", "description": "bench", "resource_type": "pdf",
+                "difficulty_level": "beginner", "uploader_user_id": user_id, "file_name": "r.pdf"})
+            resources.append(r.json()["data"]["resource_id"])
+
+        deadline = time.monotonic() + seconds
+        done = 0
+
+        async def read(op: float, rid: str):
+            if op < 0.35:
+                await client.get(f"/api/cqrs/resources/{rid}")
+            elif op < 0.55:
+                await client.get(f"/api/cqrs/users/{user_id}")
+            elif op < 0.75:
+                await client.get(f"/api/cqrs/analytics/resources/{rid}")
+            elif op < 0.9:
+                await client.get(f"/api/cqrs/users/{user_id}/study-progress")
+            else:
+                await client.post(f"/api/cqrs/resources/{rid}/view", json={
+                    "user_id": user_id, "resource_id": rid, "view_duration_seconds": 60, "session_id": "s"})
+
+        async def loop(n: int):
+            nonlocal done
+            while time.monotonic() < deadline:
+                op = rng.random()
+                rid = rng.choice(resources)
+                if mix == "reads":
+                    await read(op, rid)
+                elif op < 0.5:
+                    await client.post(f"/api/cqrs/resources/{rid}/view", json={
+                        "user_id": user_id, "resource_id": rid, "view_duration_seconds": 60, "session_id": "s"})
+                elif op < 0.7:
+                    await client.post(f"/api/cqrs/resources/{rid}/rate", json={
+                        "user_id": user_id, "resource_id": rid, "rating_value": 4})
+                elif op < 0.85:
+                    await client.post("/api/cqrs/recommendations/generate", json={"user_id": user_id, "limit": 5})
+                elif op < 0.95:
+                    await client.post("/api/cqrs/resources/upload", data={
+                        "title": "R", "description": "bench", "resource_type": "video",
+                        "difficulty_level": "advanced", "uploader_user_id": user_id, "file_name": "r.mp4"})
+                else:
+                    await client.post("/api/cqrs/auth/register", json={
+                        "username": "b", "email": f"b{seed}-{n}-{done}@example.com", "password": "x", "full_name": "B"})
+                done += 1
+
+        await asyncio.gather(*(loop(n) for n in range(concurrency)))
+        return done
+
+
+def _client_process(args):
+    return asyncio.run(drive(*args))
+
+
+def wait_ready(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(base_url + "/api/health/ready", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def cpu_seconds(pid: int, children: bool = False) -> float:
+    """User + system CPU time of a process (and its direct children) from /proc"""
+    pids = [pid]
+    if children:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(child) for child in f.read().split()]
+    total = 0
+    for p in pids:
+        with open(f"/proc/{p}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        total += int(fields[11]) + int(fields[12])
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def run(workers: int, port: int, seconds: float, clients: int, concurrency: int, mix: str,
+        replicas: bool) -> Tuple[float, float, float]:
+    state_dir = tempfile.mkdtemp(prefix="ssr-bench-")
+    socket_path = os.path.join(state_dir, "state.sock")
+    env = dict(os.environ, STATE_DIR=os.path.join(state_dir, "state"), STATE_SOCKET=socket_path,
+               STATE_REPLICAS=str(replicas).lower(), RATE_LIMIT_PER_SECOND="1e9", RATE_LIMIT_BURST="1e9",
+               PYTHONUNBUFFERED="1")
+    devnull = subprocess.DEVNULL
+    owner = None
+    if workers > 1:
+        owner = subprocess.Popen([sys.executable, "state_owner.py", "cqrs_eda_implementation", socket_path],
+                                 cwd=BACKEND, env=dict(env, STATE_MODE="owner"), stdout=devnull)
+        while not os.path.exists(socket_path):
+            time.sleep(0.05)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "cqrs_eda_implementation:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND, env=dict(env, STATE_MODE="worker" if workers > 1 else "local"), stdout=devnull)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        wait_ready(base_url)
+        owner_cpu = cpu_seconds(owner.pid) if owner else 0.0
+        worker_cpu = cpu_seconds(server.pid, children=True)
+        with multiprocessing.Pool(clients) as pool:
+            started = time.monotonic()
+            counts = pool.map(_client_process, [(base_url, seconds, concurrency, i, mix) for i in range(clients)])
+            elapsed = time.monotonic() - started
+        owner_cpu = (cpu_seconds(owner.pid) if owner else 0.0) - owner_cpu
+        worker_cpu = cpu_seconds(server.pid, children=True) - worker_cpu
+        return sum(counts) / elapsed, owner_cpu, worker_cpu
+    finally:
+        server.terminate()
+        server.wait()
+        if owner:
+            owner.terminate()
+            owner.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--clients", type=int, default=os.cpu_count() or 1,
+                        help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="in-flight requests per client")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mix", choices=("reads", "writes"), default="reads")
+    parser.add_argument("--no-replicas", action="store_true", help="forward queries to the owner as well")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.clients} load generators x {args.concurrency} connections, "
+          f"{args.mix} mix, replicas {'off' if args.no_replicas else 'on'}")
+    print(f"{'workers':>7} {'req/s':>10} {'speedup':>8} {'owner CPU':>10} {'worker CPU':>11} {'owner share':>12}")
+    baseline = None
+    for workers in args.workers:
+        rps, owner_cpu, worker_cpu = run(workers, args.port, args.seconds, args.clients, args.concurrency,
+                                         args.mix, not args.no_replicas)
+        baseline = baseline or rps
+        share = owner_cpu / (owner_cpu + worker_cpu) if owner_cpu + worker_cpu else 0.0
+        print(f"{workers:>7} {rps:>10.1f} {rps / baseline:>7.2f}x {owner_cpu:>9.2f}s {worker_cpu:>10.2f}s "
+              f"{share:>11.0%}")
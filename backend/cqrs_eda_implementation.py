@@ -3,14 +3,42 @@ CQRS+EDA Implementation for Smart Study Resource Recommender
 Assignment 3 - Part 4
 """
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form, status
+import time
+_IMPORT_STARTED = time.perf_counter()   # import time of this module and its dependencies (see readiness.py)
+
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Header, Request, Response, status
+from fastapi.responses import JSONResponse
+from starlette.middleware.authentication import AuthenticationMiddleware
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 from pydantic import BaseModel, EmailStr
-from typing import Dict, List, Optional, Any
-from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime, timedelta
 from enum import Enum
-import uuid
+import os
 import asyncio
+import contextvars
+import hmac
+import mimetypes
+import secrets
 from collections import defaultdict
+import numpy as np
+
+from interest_profiles import InterestProfileStore, view_weight, rating_weight
+from activity_store import ActivityStore, ColumnarLog
+from persistence import StateStore, LazyTable, LazySequence, new_id, now, now_iso, recorded_value, is_replaying
+from state_owner import STATE_MODE, READ_REPLICAS, follow_owner, replicated, routed, spawn_owner
+from idempotency import IdempotencyCache
+from file_storage import ContentStore, FileDownload, parse_streaming_upload, analyze_file, read_text_sample
+from near_duplicates import NearDuplicateIndex
+from admission import AdmissionControl, AdmissionControlMiddleware
+from session_tokens import SessionTokens, BearerTokenBackend, authentication_error
+from response_cache import ResponseCache, etag_matches
+from bandit import RecommendationBandit, arm_key, feedback_reward
+from ranking import rank_resources
+from factor_model import CollaborativeModel, interaction_weights
+from readiness import Readiness, ReadinessGateMiddleware, lazy_import, record_import
+from rollups import RollupStore, GRANULARITIES, to_epoch, from_epoch
+from study_sessions import StudySessionStore
 
 # ============================================================================
 # MODELS AND DATA STRUCTURES
@@ -44,7 +72,10 @@ class EventBus:
     
     def __init__(self):
         self.subscribers: Dict[str, List] = defaultdict(list)
-        self.event_log: List[Event] = []
+        self.event_log: LazySequence = LazySequence(
+            decode=lambda row: Event(event_id=row[0], event_type=row[1], timestamp=row[2], data=row[3]),
+            encode=lambda e: (e.event_id, e.event_type, e.timestamp, e.data)
+        )
     
     def subscribe(self, event_type: str, handler):
         """Subscribe a handler to an event type"""
@@ -80,20 +111,155 @@ users_preferences_db: Dict[str, dict] = {}
 resources_metadata_db: Dict[str, dict] = {}
 resources_content_db: Dict[str, dict] = {}
 resources_stats_db: Dict[str, dict] = {}
+stored_files_db: Dict[str, dict] = {}                  # checksum -> stored file (content-addressed)
 
-# Activity domain tables
-activities_views_db: Dict[str, dict] = {}
-activities_downloads_db: Dict[str, dict] = {}
-activities_ratings_db: Dict[str, dict] = {}
+# Activity domain tables (append-only columnar logs, see activity_store.py)
+activity_store = ActivityStore()
+activities_views_db: ColumnarLog = activity_store.views
+activities_downloads_db: ColumnarLog = activity_store.downloads
+activities_ratings_db: ColumnarLog = activity_store.ratings
 
 # Recommendation domain tables
-recommendations_generated_db: Dict[str, dict] = {}
+recommendations_generated_db: Dict[str, dict] = LazyTable()
+recommendations_feedback_db: Dict[str, dict] = {}
 
 # Tag domain tables
 tags_master_db: Dict[str, dict] = {}
 mapping_resource_tags_db: Dict[str, dict] = {}
 mapping_user_interests_db: Dict[str, dict] = {}
 
+# Lookup indexes (keep event handlers O(1) instead of scanning tables)
+users_preferences_index: Dict[str, str] = {}           # user_id -> preference_id
+tags_name_index: Dict[str, str] = {}                   # tag_name -> tag_id
+user_interests_index: Dict[tuple, str] = {}            # (user_id, tag_id) -> mapping_id
+resources_content_index: Dict[str, str] = {}           # resource_id -> content_id
+resource_duplicates_index: Dict[str, List[str]] = {}   # canonical resource_id -> near-duplicate resource_ids
+recommendations_feedback_index: Dict[str, str] = {}    # recommendation_id -> feedback_id
+downloads_counted_index: Dict[str, str] = {}           # "client|resource_id" -> last counted download (ISO), oldest first
+
+# MinHash/LSH index of uploaded resources (see near_duplicates.py)
+near_duplicate_index = NearDuplicateIndex(threshold=float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8")))
+
+# Minute/hour/day engagement counters per resource and per user (see rollups.py)
+activity_rollups = RollupStore()
+
+# Views grouped into study sessions, closed after an inactivity gap (see study_sessions.py)
+study_sessions = StudySessionStore(
+    activity_store,
+    gap_seconds=int(float(os.getenv("STUDY_SESSION_GAP_MINUTES", "30")) * 60),
+    max_open=int(os.getenv("STUDY_SESSION_MAX_OPEN", "100000"))
+)
+
+# Online re-ranking of recommendation candidates, learned from feedback (see bandit.py)
+recommendation_bandit = RecommendationBandit(alpha=float(os.getenv("BANDIT_ALPHA", "0.5")))
+
+# Implicit-feedback ALS factors for algorithm="collaborative", trained in a worker process (see factor_model.py)
+def collaborative_training_data():
+    """Views and ratings as (user, resource, weight) codes, duplicates excluded.
+
+    Runs on the loop and only captures row counts and id lists; the returned
+    builder concatenates the columns in a worker thread. Rows below the
+    captured counts are never moved (a re-rating only overwrites its value).
+    """
+    views, ratings = activity_store.views, activity_store.ratings
+    n_views, n_ratings = len(views), len(ratings)
+    user_ids = list(activity_store.users.values)
+    resources = activity_store.resources
+    resource_ids = list(resources.values)
+    duplicates = [resources.lookup(resource_id) for resource_id, resource in resources_metadata_db.items()
+                  if resource.get("duplicate_of")]
+
+    def build():
+        view_rows = views.slice(0, n_views)
+        rating_rows = ratings.slice(0, n_ratings)
+        view_weights, rating_weights = interaction_weights(view_rows["duration"], rating_rows["rating"])
+        return (
+            np.concatenate([view_rows["user"], rating_rows["user"]]),
+            np.concatenate([view_rows["resource"], rating_rows["resource"]]),
+            np.concatenate([view_weights, rating_weights]),
+            user_ids,
+            resource_ids,
+            np.array([code for code in duplicates if code >= 0], dtype=np.int64),
+        )
+    return build
+
+collaborative_model = CollaborativeModel(
+    os.getenv("MODEL_DIR", "state/models"),
+    collaborative_training_data,
+    factors=int(os.getenv("ALS_FACTORS", "32")),
+    iterations=int(os.getenv("ALS_ITERATIONS", "10")),
+)
+
+# Decayed per-user interest vectors (read model for recommendation scoring)
+interest_profiles = InterestProfileStore()
+
+# Uploaded files, stored once per SHA-256 (see file_storage.py)
+content_store = ContentStore(
+    os.getenv("UPLOAD_DIR", "uploads"),
+    max_upload_bytes=int(os.getenv("MAX_UPLOAD_MB", "512")) * 1024 * 1024
+)
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")     # prefix of file_url download links
+# Range transfers reaching the end of a file count as one download per client in this window
+DOWNLOAD_DEDUPE_WINDOW = timedelta(minutes=float(os.getenv("DOWNLOAD_DEDUPE_MINUTES", "30")))
+
+# Serialized detail-query responses, invalidated by events (see response_cache.py)
+response_cache = ResponseCache(max_bytes=int(os.getenv("RESPONSE_CACHE_MB", "64")) * 1024 * 1024)
+
+# Completed/in-flight command results by Idempotency-Key (lives with the state owner)
+idempotency_cache = IdempotencyCache(
+    max_entries=int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "100000")),
+    ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+)
+
+# ============================================================================
+# PERSISTENCE (Snapshot + WAL, see persistence.py)
+# ============================================================================
+
+# Off unless STATE_DIR is set
+state_store = StateStore(
+    os.getenv("STATE_DIR", ""),
+    snapshot_interval=float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "300")),
+    fsync=os.getenv("WAL_FSYNC", "false").lower() == "true",
+    module="cqrs_eda_implementation"
+)
+
+for _name, _table in [
+    ("users_auth", users_auth_db), ("users_profile", users_profile_db),
+    ("users_preferences", users_preferences_db), ("resources_metadata", resources_metadata_db),
+    ("resources_content", resources_content_db), ("resources_stats", resources_stats_db),
+    ("stored_files", stored_files_db), ("resources_content_index", resources_content_index),
+    ("resource_duplicates_index", resource_duplicates_index),
+    ("recommendations_generated", recommendations_generated_db),
+    ("recommendations_feedback", recommendations_feedback_db),
+    ("recommendations_feedback_index", recommendations_feedback_index),
+    ("downloads_counted_index", downloads_counted_index),
+    ("tags_master", tags_master_db), ("mapping_resource_tags", mapping_resource_tags_db),
+    ("mapping_user_interests", mapping_user_interests_db),
+    ("users_preferences_index", users_preferences_index), ("tags_name_index", tags_name_index),
+    ("user_interests_index", user_interests_index),
+]:
+    state_store.register_table(_name, _table)
+state_store.register_sequence("event_log", event_bus.event_log)
+state_store.register_state(
+    "interest_profiles",
+    lambda: (interest_profiles.profiles, interest_profiles.resource_features),
+    lambda state: (interest_profiles.profiles.update(state[0]),
+                   interest_profiles.resource_features.update(state[1]))
+)
+state_store.register_state("activity_rollups", activity_rollups.dump, activity_rollups.load)
+state_store.register_state("study_sessions", study_sessions.dump, study_sessions.load)
+state_store.register_state("near_duplicate_index", near_duplicate_index.dump, near_duplicate_index.load)
+state_store.register_state(
+    "recommendation_bandit",
+    lambda: recommendation_bandit.arms,
+    lambda state: recommendation_bandit.arms.update(state)
+)
+state_store.register_state(
+    "activity_store",
+    lambda: activity_store,
+    lambda state: activity_store.restore(state)
+)
+
 # ============================================================================
 # REPOSITORIES (Data Access Layer)
 # ============================================================================
@@ -109,15 +275,15 @@ class UserRepository:
             "email": email,
             "password_hash": password,  # In production: bcrypt hash
             "role": role,
-            "created_at": datetime.now().isoformat(),
-            "last_login": datetime.now().isoformat()
+            "created_at": now_iso(),
+            "last_login": now_iso()
         }
         return users_auth_db[user_id]
     
     @staticmethod
     async def create_user_profile(user_id: str, username: str, full_name: str):
         """Create user profile record"""
-        profile_id = str(uuid.uuid4())
+        profile_id = new_id()
         users_profile_db[profile_id] = {
             "profile_id": profile_id,
             "user_id": user_id,
@@ -125,14 +291,14 @@ class UserRepository:
             "full_name": full_name,
             "bio": "",
             "avatar_url": "",
-            "updated_at": datetime.now().isoformat()
+            "updated_at": now_iso()
         }
         return users_profile_db[profile_id]
     
     @staticmethod
     async def create_user_preferences(user_id: str):
         """Create default user preferences"""
-        pref_id = str(uuid.uuid4())
+        pref_id = new_id()
         users_preferences_db[pref_id] = {
             "preference_id": pref_id,
             "user_id": user_id,
@@ -140,10 +306,18 @@ class UserRepository:
             "preferred_subjects": [],
             "difficulty_level": "beginner",
             "study_time_preference": "evening",
-            "created_at": datetime.now().isoformat()
+            "created_at": now_iso(),
+            "updated_at": now_iso()
         }
+        users_preferences_index[user_id] = pref_id
         return users_preferences_db[pref_id]
     
+    @staticmethod
+    async def get_user_preferences(user_id: str) -> Optional[dict]:
+        """Get user preferences"""
+        pref_id = users_preferences_index.get(user_id)
+        return users_preferences_db.get(pref_id) if pref_id else None
+    
     @staticmethod
     async def user_exists(user_id: str) -> bool:
         """Check if user exists"""
@@ -153,13 +327,19 @@ class UserRepository:
     async def email_exists(email: str) -> bool:
         """Check if email already registered"""
         return any(u["email"] == email for u in users_auth_db.values())
+    
+    @staticmethod
+    async def find_user_by_email(email: str) -> Optional[dict]:
+        """Auth record of the user registered with this email"""
+        return next((u for u in users_auth_db.values() if u["email"] == email), None)
 
 class ResourceRepository:
     """Repository for resource data operations"""
     
     @staticmethod
     async def create_resource_metadata(resource_id: str, title: str, description: str,
-                                      resource_type: str, difficulty: str, uploader_id: str):
+                                      resource_type: str, difficulty: str, uploader_id: str,
+                                      file_size_mb: float = 0.0, duplicate_of: Optional[str] = None):
         """Create resource metadata record"""
         resources_metadata_db[resource_id] = {
             "resource_id": resource_id,
@@ -167,31 +347,57 @@ class ResourceRepository:
             "description": description,
             "resource_type": resource_type,
             "difficulty_level": difficulty,
-            "file_size_mb": 2.5,  # Mock value
-            "upload_timestamp": datetime.now().isoformat(),
-            "uploader_user_id": uploader_id
+            "file_size_mb": file_size_mb,
+            "upload_timestamp": now_iso(),
+            "uploader_user_id": uploader_id,
+            "duplicate_of": duplicate_of
         }
+        if duplicate_of:
+            resource_duplicates_index.setdefault(duplicate_of, []).append(resource_id)
         return resources_metadata_db[resource_id]
     
     @staticmethod
-    async def create_resource_content(resource_id: str, file_path: str, file_url: str):
+    async def find_near_duplicates(signature: Optional[Any]) -> Tuple[Optional[str], List[dict]]:
+        """Canonical resource and near-duplicate matches for a MinHash signature"""
+        if signature is None:
+            return None, []
+        matches = near_duplicate_index.query(signature)
+        if not matches:
+            return None, []
+        best = matches[0][0]
+        canonical = resources_metadata_db[best].get("duplicate_of") or best
+        return canonical, [{"resource_id": rid, "similarity": sim} for rid, sim in matches]
+    
+    @staticmethod
+    async def create_resource_content(resource_id: str, file_path: str, file_url: Optional[str],
+                                      mime_type: str, page_count: Optional[int] = None,
+                                      checksum: Optional[str] = None, file_name: str = ""):
         """Create resource content record"""
-        content_id = str(uuid.uuid4())
+        content_id = new_id()
         resources_content_db[content_id] = {
             "content_id": content_id,
             "resource_id": resource_id,
             "file_path": file_path,
             "file_url": file_url,
-            "mime_type": "application/pdf",
-            "page_count": 45,  # Mock value
-            "storage_location": "local"
+            "file_name": file_name,
+            "mime_type": mime_type,
+            "page_count": page_count,
+            "storage_location": "local",
+            "checksum": checksum
         }
+        resources_content_index[resource_id] = content_id
         return resources_content_db[content_id]
     
+    @staticmethod
+    async def get_resource_content(resource_id: str) -> Optional[dict]:
+        """Get resource content record"""
+        content_id = resources_content_index.get(resource_id)
+        return resources_content_db.get(content_id) if content_id else None
+    
     @staticmethod
     async def create_resource_stats(resource_id: str):
         """Initialize resource statistics"""
-        stat_id = str(uuid.uuid4())
+        stat_id = new_id()
         resources_stats_db[stat_id] = {
             "stat_id": stat_id,
             "resource_id": resource_id,
@@ -200,8 +406,8 @@ class ResourceRepository:
             "favorite_count": 0,
             "average_rating": 0.0,
             "rating_count": 0,
-            "last_accessed": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
+            "last_accessed": now_iso(),
+            "updated_at": now_iso()
         }
         return resources_stats_db[stat_id]
     
@@ -224,59 +430,238 @@ class ResourceRepository:
         for stats in resources_stats_db.values():
             if stats["resource_id"] == resource_id:
                 stats["view_count"] += 1
-                stats["last_accessed"] = datetime.now().isoformat()
-                stats["updated_at"] = datetime.now().isoformat()
+                stats["last_accessed"] = now_iso()
+                stats["updated_at"] = now_iso()
+                return stats
+    
+    @staticmethod
+    async def update_download_count(resource_id: str):
+        """Increment download count"""
+        for stats in resources_stats_db.values():
+            if stats["resource_id"] == resource_id:
+                stats["download_count"] += 1
+                stats["last_accessed"] = now_iso()
+                stats["updated_at"] = now_iso()
                 return stats
 
+def guess_mime_type(file_name: str, declared_type: str = "") -> str:
+    """Best MIME type before the file has been sniffed"""
+    if declared_type and declared_type != "application/octet-stream":
+        return declared_type
+    return mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+
+class FileRepository:
+    """Repository for stored (content-addressed) files"""
+    
+    @staticmethod
+    async def find_canonical_resource(checksum: str) -> Optional[str]:
+        """Canonical resource of the first upload with identical content, if any"""
+        record = stored_files_db.get(checksum)
+        for resource_id in (record or {}).get("resource_ids", []):
+            resource = resources_metadata_db.get(resource_id)
+            if resource is not None:
+                return resource.get("duplicate_of") or resource_id
+        return None
+    
+    @staticmethod
+    async def register_file(checksum: str, size_bytes: int, file_name: str,
+                            declared_type: str, resource_id: str) -> Tuple[dict, bool]:
+        """Attach a stored file to a resource
+
+        Returns the file record and whether identical content was already stored.
+        """
+        record = stored_files_db.get(checksum)
+        if record:
+            record["resource_ids"].append(resource_id)
+            return record, True
+        
+        stored_files_db[checksum] = {
+            "checksum": checksum,
+            "file_path": content_store.object_path(checksum),
+            "size_bytes": size_bytes,
+            "mime_type": guess_mime_type(file_name, declared_type),
+            "page_count": None,
+            "analyzed": False,
+            "file_name": file_name,
+            "resource_ids": [resource_id],
+            "stored_at": now_iso()
+        }
+        return stored_files_db[checksum], False
+
 class ActivityRepository:
     """Repository for activity tracking"""
     
     @staticmethod
     async def log_view(user_id: str, resource_id: str, duration: int, device: str, session: str):
         """Log a view event"""
-        view_id = str(uuid.uuid4())
-        activities_views_db[view_id] = {
+        view_id = new_id()
+        timestamp = now()
+        activity_store.log_view(view_id, user_id, resource_id, timestamp, duration, device, session)
+        return {
             "view_id": view_id,
             "user_id": user_id,
             "resource_id": resource_id,
-            "view_timestamp": datetime.now().isoformat(),
+            "view_timestamp": timestamp.isoformat(),
             "view_duration_seconds": duration,
             "device_type": device,
             "session_id": session
         }
-        return activities_views_db[view_id]
     
     @staticmethod
-    async def log_rating(user_id: str, resource_id: str, rating: int, review: str):
-        """Log a rating"""
-        rating_id = str(uuid.uuid4())
-        activities_ratings_db[rating_id] = {
-            "rating_id": rating_id,
+    async def log_download(user_id: str, resource_id: str, size: int, success: bool, ip_address: str):
+        """Log a download"""
+        download_id = new_id()
+        timestamp = now()
+        activity_store.log_download(download_id, user_id, resource_id, timestamp, size, success, ip_address)
+        return {
+            "download_id": download_id,
             "user_id": user_id,
             "resource_id": resource_id,
-            "rating_value": rating,
-            "review_text": review,
-            "rated_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
+            "download_timestamp": timestamp.isoformat(),
+            "file_size_downloaded": size,
+            "download_success": success,
+            "ip_address": ip_address
         }
-        return activities_ratings_db[rating_id]
+    
+    @staticmethod
+    async def count_download_once(client: str, resource_id: str) -> bool:
+        """True unless the client had a download of the resource counted within DOWNLOAD_DEDUPE_WINDOW"""
+        timestamp = now()
+        cutoff = (timestamp - DOWNLOAD_DEDUPE_WINDOW).isoformat()
+        while downloads_counted_index:                 # oldest first: drop expired entries
+            oldest = next(iter(downloads_counted_index))
+            if downloads_counted_index[oldest] >= cutoff:
+                break
+            del downloads_counted_index[oldest]
+        key = f"{client}|{resource_id}"
+        if key in downloads_counted_index:
+            return False
+        downloads_counted_index[key] = timestamp.isoformat()
+        return True
+    
+    @staticmethod
+    async def log_rating(user_id: str, resource_id: str, rating: int, review: str) -> Tuple[dict, bool]:
+        """Log a rating (one per user per resource; re-rating updates it in place)
+
+        Returns the rating record and whether it was newly created.
+        """
+        row = activity_store.find_rating(user_id, resource_id)
+        if row is not None:
+            activity_store.update_rating(row, rating, review, now())
+            return activity_store.rating_record(row), False
+        
+        row = activity_store.add_rating(new_id(), user_id, resource_id, rating, review, now())
+        return activity_store.rating_record(row), True
+    
+    @staticmethod
+    async def get_rating(user_id: str, resource_id: str) -> Optional[dict]:
+        """Get a user's rating of a resource"""
+        row = activity_store.find_rating(user_id, resource_id)
+        return activity_store.rating_record(row) if row is not None else None
     
     @staticmethod
     async def get_ratings_for_resource(resource_id: str) -> List[dict]:
         """Get all ratings for a resource"""
-        return [r for r in activities_ratings_db.values() if r["resource_id"] == resource_id]
+        rows = activity_store.scan(activities_ratings_db, resource_id=resource_id, columns=[])["row"]
+        return [activity_store.rating_record(int(row)) for row in rows]
     
     @staticmethod
     async def calculate_average_rating(resource_id: str) -> tuple:
-        """Calculate average rating and count"""
-        ratings = await ActivityRepository.get_ratings_for_resource(resource_id)
-        if not ratings:
-            return 0.0, 0
+        """Calculate average rating and count (vectorized over the rating column)"""
+        return activity_store.rating_summary(resource_id)
+
+class RecommendationRepository:
+    """Repository for generated recommendations and their feedback"""
+    
+    @staticmethod
+    async def get_recommendation(recommendation_id: str) -> Optional[dict]:
+        """Get a generated recommendation"""
+        return recommendations_generated_db.get(recommendation_id)
+    
+    @staticmethod
+    async def save_feedback(recommendation_id: str, user_id: str, was_clicked: bool,
+                            was_helpful: Optional[bool], feedback_type: str,
+                            feedback_text: str) -> Tuple[dict, Optional[dict]]:
+        """Store feedback (one per recommendation; resubmitting replaces it)
+
+        Returns the feedback record and a copy of the one it replaced, if any.
+        """
+        feedback_id = recommendations_feedback_index.get(recommendation_id)
+        previous = dict(recommendations_feedback_db[feedback_id]) if feedback_id else None
+        feedback_id = feedback_id or new_id()
+        recommendations_feedback_db[feedback_id] = {
+            "feedback_id": feedback_id,
+            "recommendation_id": recommendation_id,
+            "user_id": user_id,
+            "was_clicked": was_clicked,
+            "was_helpful": was_helpful,
+            "feedback_type": feedback_type,
+            "feedback_text": feedback_text,
+            "submitted_at": now_iso()
+        }
+        recommendations_feedback_index[recommendation_id] = feedback_id
+        return recommendations_feedback_db[feedback_id], previous
+
+class TagRepository:
+    """Repository for tags and tag mappings"""
+    
+    @staticmethod
+    async def get_or_create_tag(tag_name: str, category: str = "subject") -> dict:
+        """Get a tag by name, creating it on first use"""
+        tag_id = tags_name_index.get(tag_name)
+        if tag_id:
+            return tags_master_db[tag_id]
         
-        total = sum(r["rating_value"] for r in ratings)
-        count = len(ratings)
-        average = round(total / count, 2)
-        return average, count
+        tag_id = new_id()
+        tags_master_db[tag_id] = {
+            "tag_id": tag_id,
+            "tag_name": tag_name,
+            "category": category,
+            "usage_count": 0,
+            "created_at": now_iso()
+        }
+        tags_name_index[tag_name] = tag_id
+        return tags_master_db[tag_id]
+    
+    @staticmethod
+    async def tag_resource(resource_id: str, tag_name: str, assigned_by: str, confidence: float = 1.0):
+        """Assign a tag to a resource"""
+        tag = await TagRepository.get_or_create_tag(tag_name)
+        tag["usage_count"] += 1
+        
+        mapping_id = new_id()
+        mapping_resource_tags_db[mapping_id] = {
+            "mapping_id": mapping_id,
+            "resource_id": resource_id,
+            "tag_id": tag["tag_id"],
+            "assigned_at": now_iso(),
+            "assigned_by_user_id": assigned_by,
+            "confidence": confidence
+        }
+        return mapping_resource_tags_db[mapping_id]
+    
+    @staticmethod
+    async def upsert_user_interest(user_id: str, tag_name: str, interest_level: str, interacted_at: str):
+        """Create or refresh a user's interest in a tag"""
+        tag = await TagRepository.get_or_create_tag(tag_name)
+        mapping_id = user_interests_index.get((user_id, tag["tag_id"]))
+        if mapping_id:
+            mapping = mapping_user_interests_db[mapping_id]
+            mapping["interest_level"] = interest_level
+            mapping["last_interaction"] = interacted_at
+            return mapping
+        
+        mapping_id = new_id()
+        mapping_user_interests_db[mapping_id] = {
+            "mapping_id": mapping_id,
+            "user_id": user_id,
+            "tag_id": tag["tag_id"],
+            "interest_level": interest_level,
+            "added_at": interacted_at,
+            "last_interaction": interacted_at
+        }
+        user_interests_index[(user_id, tag["tag_id"])] = mapping_id
+        return mapping_user_interests_db[mapping_id]
 
 # ============================================================================
 # EVENT HANDLERS
@@ -296,15 +681,43 @@ async def handle_resource_uploaded(event: Event):
 
 async def handle_resource_viewed(event: Event):
     """Handle ResourceViewedEvent"""
-    print(f"  → Updating user preferences based on view")
     print(f"  → Triggering recommendation refresh")
-    print(f"  → Logging engagement metrics")
+    activity_rollups.record(
+        to_epoch(event.timestamp),
+        [("resource", event.data["resource_id"]), ("user", event.data["user_id"])],
+        views=1, view_seconds=event.data.get("view_duration_seconds", 0)
+    )
+    print(f"  → Rolled up engagement metrics")
+
+async def track_study_session(event: Event):
+    """Add the view to its study session (closes sessions idle for longer than the gap)"""
+    study_sessions.record_view(
+        event.data["user_id"], event.data["session_id"], event.data["resource_id"],
+        to_epoch(event.timestamp), event.data.get("view_duration_seconds", 0),
+        event.data.get("device_type", "desktop")
+    )
+
+async def handle_resource_downloaded(event: Event):
+    """Handle ResourceDownloadedEvent"""
+    if not event.data["counted"]:
+        return
+    scopes = [("resource", event.data["resource_id"])]
+    if event.data.get("user_id"):
+        scopes.append(("user", event.data["user_id"]))
+    activity_rollups.record(to_epoch(event.timestamp), scopes, downloads=1)
+    print(f"  → Rolled up download metrics")
 
 async def handle_resource_rated(event: Event):
     """Handle ResourceRatedEvent"""
     print(f"  → Notifying resource owner of new rating")
-    print(f"  → Updating recommendation scores")
-    print(f"  → Logging rating analytics")
+    previous = event.data.get("previous_rating_value")
+    activity_rollups.record(
+        to_epoch(event.timestamp),
+        [("resource", event.data["resource_id"]), ("user", event.data["user_id"])],
+        rating_sum=event.data["rating_value"] - (previous or 0),
+        rating_count=0 if event.data.get("is_update") else 1
+    )
+    print(f"  → Rolled up rating analytics")
 
 async def handle_recommendations_generated(event: Event):
     """Handle RecommendationsGeneratedEvent"""
@@ -312,12 +725,143 @@ async def handle_recommendations_generated(event: Event):
     print(f"  → Sending notification to user")
     print(f"  → Logging recommendation metrics")
 
+# ----------------------------------------------------------------------------
+# Interest profile updater (keeps users_preferences / mapping_user_interests current)
+# ----------------------------------------------------------------------------
+
+async def register_resource_features(event: Event):
+    """Record which profile features a new resource carries"""
+    interest_profiles.register_resource(
+        event.data["resource_id"],
+        event.data.get("resource_type", ""),
+        event.data.get("difficulty_level", ""),
+        event.data.get("auto_tags", [])
+    )
+
+async def apply_profile_interaction(user_id: str, resource_id: str, weight: float, timestamp: str,
+                                    replaces: Optional[Tuple[float, str]] = None):
+    """Fold one interaction into the user's profile and preference tables
+    (replaces = (weight, timestamp) of an earlier interaction it supersedes)"""
+    at = datetime.fromisoformat(timestamp).timestamp()
+    if replaces:
+        shares = interest_profiles.replace_interaction(
+            user_id, resource_id, replaces[0], datetime.fromisoformat(replaces[1]).timestamp(), weight, now=at
+        )
+    else:
+        shares = interest_profiles.record_interaction(user_id, resource_id, weight, now=at)
+    if not shares:
+        return
+    
+    now = timestamp
+    for key, share in shares.items():
+        group, value = key.split(":", 1)
+        if group == "tag":
+            await TagRepository.upsert_user_interest(
+                user_id, value, InterestProfileStore.interest_level(share), now
+            )
+    
+    prefs = await UserRepository.get_user_preferences(user_id)
+    if prefs:
+        prefs["preferred_subjects"] = interest_profiles.get_leaders(user_id, "tag")
+        difficulties = interest_profiles.get_leaders(user_id, "difficulty")
+        if difficulties:
+            prefs["difficulty_level"] = difficulties[0]
+        prefs["updated_at"] = now
+
+async def update_profile_on_view(event: Event):
+    """Update the viewer's interest profile"""
+    weight = view_weight(event.data.get("view_duration_seconds", 0))
+    await apply_profile_interaction(event.data["user_id"], event.data["resource_id"], weight, event.timestamp)
+    print(f"  → Updated interest profile for user {event.data['user_id']}")
+
+async def update_profile_on_rating(event: Event):
+    """Update the rater's interest profile (a re-rating replaces the earlier rating's weight)"""
+    data = event.data
+    weight = rating_weight(data["rating_value"])
+    replaces = None
+    if data.get("is_update"):
+        if data["previous_rating_value"] == data["rating_value"]:
+            return
+        replaces = (rating_weight(data["previous_rating_value"]), data.get("previous_rated_at") or event.timestamp)
+    await apply_profile_interaction(data["user_id"], data["resource_id"], weight, event.timestamp, replaces)
+    print(f"  → Updated interest profile for user {event.data['user_id']}")
+
+async def update_bandit_on_feedback(event: Event):
+    """Fold recommendation feedback into the re-ranking bandit"""
+    previous = event.data.get("previous_reward")
+    if previous is None:
+        recommendation_bandit.update(event.data["arm"], event.data["confidence_score"], event.data["reward"])
+    elif previous != event.data["reward"]:
+        recommendation_bandit.adjust(event.data["arm"], event.data["confidence_score"],
+                                     event.data["reward"] - previous)
+    print(f"  → Updated re-ranking bandit arm {event.data['arm']}")
+
+async def invalidate_cached_responses(event: Event):
+    """Bump the versions of the entities an event changed (drops their cached responses)"""
+    data = event.data
+    if event.event_type == "UserRegisteredEvent":
+        response_cache.bump(("user", data["user_id"]))
+    elif event.event_type == "ResourceContentAnalyzedEvent":
+        for resource_id in data["resource_ids"]:
+            response_cache.bump(("resource", resource_id))
+    else:
+        response_cache.bump(("resource", data["resource_id"]))
+        if data.get("duplicate_of"):
+            response_cache.bump(("resource", data["duplicate_of"]))
+
+# ----------------------------------------------------------------------------
+# Content analysis (MIME sniffing, page count) off the request path
+# ----------------------------------------------------------------------------
+
+analysis_tasks: Dict[str, asyncio.Task] = {}           # checksum -> running analysis
+
+async def analyze_uploaded_content(event: Event):
+    """Schedule content analysis for a newly stored file"""
+    if is_replaying():
+        return                      # the result is journaled; unfinished ones are swept after recovery
+    schedule_content_analysis(stored_files_db.get(event.data.get("checksum") or ""))
+
+def schedule_content_analysis(record: Optional[dict]):
+    if record is None or record["analyzed"] or record["checksum"] in analysis_tasks:
+        return
+    # a fresh context: the analysis is its own command, not part of the upload that scheduled it
+    task = asyncio.create_task(apply_content_analysis(record), context=contextvars.Context())
+    analysis_tasks[record["checksum"]] = task
+    task.add_done_callback(lambda _: analysis_tasks.pop(record["checksum"], None))
+    print(f"  → Scheduled content analysis for {record['checksum'][:12]}")
+
+async def apply_content_analysis(record: dict):
+    """Analyze a stored file in a worker thread and record the result as a command"""
+    try:
+        result = await asyncio.to_thread(analyze_file, record["file_path"], record["file_name"])
+    except OSError as e:
+        print(f" Content analysis failed for {record['checksum'][:12]}: {str(e)}")
+        return
+    await ApplyContentAnalysisCommandHandler.handle(ApplyContentAnalysisCommand(checksum=record["checksum"], **result))
+
+def resume_content_analysis() -> int:
+    """Schedule analysis of stored files whose result never made it into the journal"""
+    pending = [record for record in stored_files_db.values() if not record["analyzed"]]
+    for record in pending:
+        schedule_content_analysis(record)
+    return len(pending)
+
 # Subscribe event handlers
 event_bus.subscribe("UserRegisteredEvent", handle_user_registered)
+event_bus.subscribe("ResourceUploadedEvent", register_resource_features)
 event_bus.subscribe("ResourceUploadedEvent", handle_resource_uploaded)
+event_bus.subscribe("ResourceUploadedEvent", analyze_uploaded_content)
+event_bus.subscribe("ResourceViewedEvent", update_profile_on_view)
 event_bus.subscribe("ResourceViewedEvent", handle_resource_viewed)
+event_bus.subscribe("ResourceViewedEvent", track_study_session)
+event_bus.subscribe("ResourceRatedEvent", update_profile_on_rating)
 event_bus.subscribe("ResourceRatedEvent", handle_resource_rated)
+event_bus.subscribe("ResourceDownloadedEvent", handle_resource_downloaded)
 event_bus.subscribe("RecommendationsGeneratedEvent", handle_recommendations_generated)
+event_bus.subscribe("RecommendationFeedbackEvent", update_bandit_on_feedback)
+for _event_type in ("UserRegisteredEvent", "ResourceUploadedEvent", "ResourceViewedEvent", "ResourceRatedEvent",
+                    "ResourceDownloadedEvent", "ResourceContentAnalyzedEvent"):
+    event_bus.subscribe(_event_type, invalidate_cached_responses)
 
 # ============================================================================
 # COMMAND HANDLERS
@@ -335,6 +879,9 @@ class RegisterUserCommandHandler:
     """Handler for user registration command"""
     
     @staticmethod
+    @routed
+    @idempotency_cache.idempotent
+    @state_store.journaled
     async def handle(command: RegisterUserCommand) -> CommandResult:
         print(f"\n Executing RegisterUserCommand for {command.email}")
         
@@ -343,7 +890,7 @@ class RegisterUserCommandHandler:
             raise HTTPException(status_code=400, detail="Email already registered")
         
         # 2. Generate user_id
-        user_id = str(uuid.uuid4())
+        user_id = new_id()
         
         # 3. Create user records (low-cohesion: 3 separate tables)
         await UserRepository.create_user_auth(user_id, command.email, command.password, command.role)
@@ -352,9 +899,9 @@ class RegisterUserCommandHandler:
         
         # 4. Publish event
         event = Event(
-            event_id=str(uuid.uuid4()),
+            event_id=new_id(),
             event_type="UserRegisteredEvent",
-            timestamp=datetime.now().isoformat(),
+            timestamp=now_iso(),
             data={
                 "user_id": user_id,
                 "email": command.email,
@@ -380,11 +927,17 @@ class UploadResourceCommand(BaseModel):
     difficulty_level: str
     uploader_user_id: str
     file_name: str
+    checksum: Optional[str] = None          # SHA-256 of the streamed file, if one was uploaded
+    file_size_bytes: Optional[int] = None
+    content_type: str = ""                  # client-declared MIME type
 
 class UploadResourceCommandHandler:
     """Handler for resource upload command"""
     
     @staticmethod
+    @routed
+    @idempotency_cache.idempotent
+    @state_store.journaled
     async def handle(command: UploadResourceCommand) -> CommandResult:
         print(f"\n📝 Executing UploadResourceCommand: {command.title}")
         
@@ -392,50 +945,139 @@ class UploadResourceCommandHandler:
         if not await UserRepository.user_exists(command.uploader_user_id):
             raise HTTPException(status_code=404, detail="User not found")
         
-        # 2. Generate resource_id
-        resource_id = str(uuid.uuid4())
+        # 2. Find duplicates: identical bytes first, then near-duplicates by text content
+        #    (file read off the loop; metadata alone never links two resources)
+        content_text = ""
+        exact_duplicate_of = None
+        if command.checksum:
+            exact_duplicate_of = await FileRepository.find_canonical_resource(command.checksum)
+            try:
+                content_text = await asyncio.to_thread(
+                    read_text_sample, content_store.object_path(command.checksum), command.file_name
+                )
+            except OSError:
+                pass
+        signature = near_duplicate_index.content_signature(content_text, command.title, command.description)
+        duplicate_of, near_duplicates = await ResourceRepository.find_near_duplicates(signature)
+        if exact_duplicate_of:
+            duplicate_of = exact_duplicate_of
+            print(f"  → Identical content to {duplicate_of}")
+        elif duplicate_of:
+            print(f"  → Near-duplicate of {duplicate_of} (similarity {near_duplicates[0]['similarity']})")
+        
+        # 3. Generate resource_id
+        resource_id = new_id()
         
-        # 3. Create resource records (low-cohesion: 3 separate tables)
+        # 4. Attach the streamed file (identical content is stored once)
+        file_path = f"/uploads/{command.file_name}"
+        mime_type = guess_mime_type(command.file_name, command.content_type)
+        page_count, deduplicated = None, False
+        if command.checksum:
+            stored, deduplicated = await FileRepository.register_file(
+                command.checksum, command.file_size_bytes or 0, command.file_name,
+                command.content_type, resource_id
+            )
+            file_path, mime_type, page_count = stored["file_path"], stored["mime_type"], stored["page_count"]
+        
+        # 5. Create resource records (low-cohesion: 3 separate tables) and index the signature
         await ResourceRepository.create_resource_metadata(
             resource_id, command.title, command.description,
-            command.resource_type, command.difficulty_level, command.uploader_user_id
+            command.resource_type, command.difficulty_level, command.uploader_user_id,
+            file_size_mb=round((command.file_size_bytes or 0) / (1024 * 1024), 2),
+            duplicate_of=duplicate_of
         )
+        if signature is not None:
+            near_duplicate_index.add(resource_id, signature)
         
-        file_url = f"https://cdn.example.com/{command.file_name}"
-        await ResourceRepository.create_resource_content(resource_id, f"/uploads/{command.file_name}", file_url)
+        file_url = f"{PUBLIC_BASE_URL}/api/cqrs/resources/{resource_id}/download" if command.checksum else None
+        await ResourceRepository.create_resource_content(
+            resource_id, file_path, file_url, mime_type, page_count, command.checksum, command.file_name
+        )
         await ResourceRepository.create_resource_stats(resource_id)
         
-        # 4. Auto-generate tags (simplified)
+        # 6. Auto-generate tags (simplified)
         auto_tags = ["mathematics", "study-guide", "beginner"]
+        for tag_name in auto_tags:
+            await TagRepository.tag_resource(resource_id, tag_name, command.uploader_user_id, confidence=0.8)
         print(f"  → Auto-generated tags: {auto_tags}")
         
-        # 5. Publish event
+        # 7. Publish event
         event = Event(
-            event_id=str(uuid.uuid4()),
+            event_id=new_id(),
             event_type="ResourceUploadedEvent",
-            timestamp=datetime.now().isoformat(),
+            timestamp=now_iso(),
             data={
                 "resource_id": resource_id,
                 "title": command.title,
+                "resource_type": command.resource_type,
+                "difficulty_level": command.difficulty_level,
                 "uploader_user_id": command.uploader_user_id,
-                "auto_tags": auto_tags
+                "auto_tags": auto_tags,
+                "checksum": command.checksum,
+                "deduplicated": deduplicated,
+                "duplicate_of": duplicate_of,
+                "near_duplicates": [match["resource_id"] for match in near_duplicates]
             }
         )
         await event_bus.publish(event)
         
-        # 6. Return result
+        # 8. Return result
         return CommandResult(
             success=True,
             data={
                 "resource_id": resource_id,
                 "title": command.title,
                 "file_url": file_url,
+                "file_size_bytes": command.file_size_bytes or 0,
+                "checksum": command.checksum,
+                "deduplicated": deduplicated,
+                "duplicate_of": duplicate_of,
+                "near_duplicates": near_duplicates,
                 "auto_generated_tags": auto_tags
             },
             events_published=["ResourceUploadedEvent"],
             message="Resource uploaded successfully"
         )
 
+class ApplyContentAnalysisCommand(BaseModel):
+    """Command to record the content analysis of a stored file (issued by apply_content_analysis)"""
+    checksum: str
+    mime_type: Optional[str] = None
+    page_count: Optional[int] = None
+
+class ApplyContentAnalysisCommandHandler:
+    """Handler for content analysis results (journaled, so replay needs no file access)"""
+    
+    @staticmethod
+    @state_store.journaled
+    async def handle(command: ApplyContentAnalysisCommand) -> CommandResult:
+        # 1. Update the stored file and every resource that uses it
+        record = stored_files_db.get(command.checksum)
+        if record is None:
+            raise HTTPException(status_code=404, detail="Stored file not found")
+        result = {"mime_type": command.mime_type, "page_count": command.page_count}
+        record.update(result, analyzed=True)
+        for resource_id in record["resource_ids"]:
+            content = await ResourceRepository.get_resource_content(resource_id)
+            if content:
+                content.update(result)
+        
+        # 2. Publish event
+        await event_bus.publish(Event(
+            event_id=new_id(),
+            event_type="ResourceContentAnalyzedEvent",
+            timestamp=now_iso(),
+            data={"checksum": command.checksum, "resource_ids": list(record["resource_ids"]), **result}
+        ))
+        
+        # 3. Return result
+        return CommandResult(
+            success=True,
+            data={"checksum": command.checksum, **result},
+            events_published=["ResourceContentAnalyzedEvent"],
+            message="Content analysis recorded"
+        )
+
 class LogResourceViewCommand(BaseModel):
     """Command to log a resource view"""
     user_id: str
@@ -448,6 +1090,9 @@ class LogResourceViewCommandHandler:
     """Handler for logging resource views"""
     
     @staticmethod
+    @routed
+    @idempotency_cache.idempotent
+    @state_store.journaled
     async def handle(command: LogResourceViewCommand) -> CommandResult:
         print(f"\n📝 Executing LogResourceViewCommand for resource {command.resource_id}")
         
@@ -469,13 +1114,16 @@ class LogResourceViewCommandHandler:
         
         # 4. Publish event
         event = Event(
-            event_id=str(uuid.uuid4()),
+            event_id=new_id(),
             event_type="ResourceViewedEvent",
-            timestamp=datetime.now().isoformat(),
+            timestamp=now_iso(),
             data={
                 "view_id": view_record["view_id"],
                 "user_id": command.user_id,
                 "resource_id": command.resource_id,
+                "view_duration_seconds": command.view_duration_seconds,
+                "device_type": command.device_type,
+                "session_id": command.session_id,
                 "new_view_count": updated_stats["view_count"] if updated_stats else 1
             }
         )
@@ -493,6 +1141,74 @@ class LogResourceViewCommandHandler:
             message="View logged successfully"
         )
 
+class LogResourceDownloadCommand(BaseModel):
+    """Command to log a finished (or interrupted) resource download"""
+    resource_id: str
+    user_id: Optional[str] = None
+    file_size_downloaded: int
+    download_success: bool
+    reached_end_of_file: bool = False       # the transfer included the file's last byte
+    whole_file: bool = False                # the transfer covered the file from its first byte to its last
+    ip_address: str = ""
+
+class LogResourceDownloadCommandHandler:
+    """Handler for logging resource downloads (runs after the transfer, off the download path)"""
+    
+    @staticmethod
+    @routed
+    @idempotency_cache.idempotent
+    @state_store.journaled
+    async def handle(command: LogResourceDownloadCommand) -> CommandResult:
+        print(f"\n📝 Executing LogResourceDownloadCommand for resource {command.resource_id}")
+        
+        # 1. Validate resource exists (anonymous downloads are counted but not logged per user)
+        if not await ResourceRepository.resource_exists(command.resource_id):
+            raise HTTPException(status_code=404, detail="Resource not found")
+        user_id = command.user_id if command.user_id and await UserRepository.user_exists(command.user_id) else None
+        
+        # 2. Log download event
+        download_record = None
+        if user_id:
+            download_record = await ActivityRepository.log_download(
+                user_id, command.resource_id, command.file_size_downloaded,
+                command.download_success, command.ip_address
+            )
+        
+        # 3. Update stats (separate table, NO JOIN): a whole-file transfer counts; a range that ends
+        #    the file (a resumed download, or a media player/PDF viewer seeking) counts at most once
+        #    per client and resource within DOWNLOAD_DEDUPE_WINDOW
+        counted = False
+        if command.download_success and (command.whole_file or command.reached_end_of_file):
+            counted = await ActivityRepository.count_download_once(
+                user_id or f"ip:{command.ip_address}", command.resource_id
+            ) or command.whole_file
+        stats = await ResourceRepository.update_download_count(command.resource_id) if counted else None
+        
+        # 4. Publish event
+        event = Event(
+            event_id=new_id(),
+            event_type="ResourceDownloadedEvent",
+            timestamp=now_iso(),
+            data={
+                "download_id": download_record["download_id"] if download_record else None,
+                "user_id": user_id,
+                "resource_id": command.resource_id,
+                "file_size_downloaded": command.file_size_downloaded,
+                "download_success": command.download_success,
+                "counted": counted,
+                "new_download_count": stats["download_count"] if stats else None
+            }
+        )
+        await event_bus.publish(event)
+        
+        # 5. Return result
+        return CommandResult(
+            success=True,
+            data=event.data,
+            events_published=["ResourceDownloadedEvent"],
+            message="Download logged successfully"
+        )
+
 class RateResourceCommand(BaseModel):
     """Command to rate a resource"""
     user_id: str
@@ -504,6 +1220,9 @@ class RateResourceCommandHandler:
     """Handler for rating resources"""
     
     @staticmethod
+    @routed
+    @idempotency_cache.idempotent
+    @state_store.journaled
     async def handle(command: RateResourceCommand) -> CommandResult:
         print(f"\n Executing RateResourceCommand: {command.rating_value} stars")
         
@@ -517,8 +1236,9 @@ class RateResourceCommandHandler:
         if not await ResourceRepository.resource_exists(command.resource_id):
             raise HTTPException(status_code=404, detail="Resource not found")
         
-        # 2. Log rating
-        rating_record = await ActivityRepository.log_rating(
+        # 2. Log rating (natural key: one rating per user per resource)
+        previous = await ActivityRepository.get_rating(command.user_id, command.resource_id)
+        rating_record, created = await ActivityRepository.log_rating(
             command.user_id, command.resource_id, command.rating_value, command.review_text
         )
         
@@ -530,18 +1250,21 @@ class RateResourceCommandHandler:
         if stats:
             stats["average_rating"] = avg_rating
             stats["rating_count"] = rating_count
-            stats["updated_at"] = datetime.now().isoformat()
+            stats["updated_at"] = now_iso()
         
         # 5. Publish event
         event = Event(
-            event_id=str(uuid.uuid4()),
+            event_id=new_id(),
             event_type="ResourceRatedEvent",
-            timestamp=datetime.now().isoformat(),
+            timestamp=now_iso(),
             data={
                 "rating_id": rating_record["rating_id"],
                 "user_id": command.user_id,
                 "resource_id": command.resource_id,
                 "rating_value": command.rating_value,
+                "is_update": not created,
+                "previous_rating_value": previous["rating_value"] if previous else None,
+                "previous_rated_at": previous["updated_at"] if previous else None,
                 "new_average": avg_rating,
                 "rating_count": rating_count
             }
@@ -560,7 +1283,7 @@ class RateResourceCommandHandler:
                 }
             },
             events_published=["ResourceRatedEvent"],
-            message="Rating submitted successfully"
+            message="Rating submitted successfully" if created else "Rating updated successfully"
         )
 
 class GenerateRecommendationsCommand(BaseModel):
@@ -573,6 +1296,9 @@ class GenerateRecommendationsCommandHandler:
     """Handler for generating recommendations"""
     
     @staticmethod
+    @routed
+    @idempotency_cache.idempotent
+    @state_store.journaled
     async def handle(command: GenerateRecommendationsCommand) -> CommandResult:
         print(f"\n Executing GenerateRecommendationsCommand for user {command.user_id}")
         
@@ -580,22 +1306,36 @@ class GenerateRecommendationsCommandHandler:
         if not await UserRepository.user_exists(command.user_id):
             raise HTTPException(status_code=404, detail="User not found")
         
-        # 2. Fetch user preferences (simplified)
-        print(f"  → Fetching user preferences...")
-        print(f"  → Fetching user activity history...")
+        # 2. Rank (see ranking.py): collaborative filtering by the latest ALS factors (recorded,
+        #    so replay sees the model output the request saw) or the user's interest profile for
+        #    users the model does not know yet; near-duplicates collapse into their canonical
+        #    resource and the feedback bandit re-ranks the candidates
+        print(f"  → Ranking with {command.algorithm} candidates and the re-ranking bandit...")
+        algorithm_used, ranked = rank_resources(
+            command.user_id, command.limit, command.algorithm, resources_metadata_db,
+            interest_profiles, recommendation_bandit,
+            lambda user_id, k: recorded_value(lambda: collaborative_model.top_k(user_id, k))
+        )
         
-        # 3. Generate recommendations (simplified algorithm)
+        # 3. Store the recommendations
         recommendations = []
-        for resource_id, resource in list(resources_metadata_db.items())[:command.limit]:
-            rec_id = str(uuid.uuid4())
-            confidence_score = 0.85  # Mock score
+        for resource_id, score, matched in ranked:
+            resource = resources_metadata_db[resource_id]
+            rec_id = new_id()
+            confidence_score = round(score, 4)
+            if algorithm_used == "collaborative":
+                reason = "Users with similar activity also studied this"
+            elif matched:
+                reason = f"Based on your interest in {matched.split(':', 1)[1]}"
+            else:
+                reason = f"Based on your interest in {resource['resource_type']}"
             
             recommendations.append({
                 "recommendation_id": rec_id,
                 "resource_id": resource_id,
                 "title": resource["title"],
                 "confidence_score": confidence_score,
-                "reason": f"Based on your interest in {resource['resource_type']}"
+                "reason": reason
             })
             
             # Store recommendation
@@ -603,22 +1343,22 @@ class GenerateRecommendationsCommandHandler:
                 "recommendation_id": rec_id,
                 "user_id": command.user_id,
                 "resource_id": resource_id,
-                "algorithm_used": command.algorithm,
+                "algorithm_used": algorithm_used,
                 "confidence_score": confidence_score,
-                "reason": f"Based on your interest in {resource['resource_type']}",
-                "generated_at": datetime.now().isoformat(),
+                "reason": reason,
+                "generated_at": now_iso(),
                 "position": len(recommendations)
             }
         
         # 4. Publish event
         event = Event(
-            event_id=str(uuid.uuid4()),
+            event_id=new_id(),
             event_type="RecommendationsGeneratedEvent",
-            timestamp=datetime.now().isoformat(),
+            timestamp=now_iso(),
             data={
                 "user_id": command.user_id,
                 "recommendations_count": len(recommendations),
-                "algorithm_used": command.algorithm
+                "algorithm_used": algorithm_used
             }
         )
         await event_bus.publish(event)
@@ -629,13 +1369,82 @@ class GenerateRecommendationsCommandHandler:
             data={
                 "user_id": command.user_id,
                 "recommendations_count": len(recommendations),
-                "algorithm_used": command.algorithm,
+                "algorithm_used": algorithm_used,
                 "recommendations": recommendations
             },
             events_published=["RecommendationsGeneratedEvent"],
             message="Recommendations generated successfully"
         )
 
+class SubmitRecommendationFeedbackCommand(BaseModel):
+    """Command to record feedback on a generated recommendation"""
+    recommendation_id: str
+    user_id: str
+    was_clicked: bool
+    was_helpful: Optional[bool] = None
+    feedback_type: str = "neutral"
+    feedback_text: str = ""
+
+FEEDBACK_TYPES = {"positive", "negative", "neutral", "irrelevant"}
+
+class SubmitRecommendationFeedbackCommandHandler:
+    """Handler for recommendation feedback"""
+    
+    @staticmethod
+    @routed
+    @idempotency_cache.idempotent
+    @state_store.journaled
+    async def handle(command: SubmitRecommendationFeedbackCommand) -> CommandResult:
+        print(f"\n Executing SubmitRecommendationFeedbackCommand for {command.recommendation_id}")
+        
+        # 1. Validate
+        if command.feedback_type not in FEEDBACK_TYPES:
+            raise HTTPException(status_code=400, detail=f"feedback_type must be one of {sorted(FEEDBACK_TYPES)}")
+        
+        recommendation = await RecommendationRepository.get_recommendation(command.recommendation_id)
+        if not recommendation:
+            raise HTTPException(status_code=404, detail="Recommendation not found")
+        
+        if recommendation["user_id"] != command.user_id:
+            raise HTTPException(status_code=403, detail="Recommendation belongs to another user")
+        
+        # 2. Store feedback (natural key: one per recommendation)
+        feedback, previous = await RecommendationRepository.save_feedback(
+            command.recommendation_id, command.user_id, command.was_clicked,
+            command.was_helpful, command.feedback_type, command.feedback_text
+        )
+        
+        # 3. Publish event (the bandit learns from it)
+        resource = resources_metadata_db.get(recommendation["resource_id"], {})
+        event = Event(
+            event_id=new_id(),
+            event_type="RecommendationFeedbackEvent",
+            timestamp=now_iso(),
+            data={
+                "feedback_id": feedback["feedback_id"],
+                "recommendation_id": command.recommendation_id,
+                "user_id": command.user_id,
+                "resource_id": recommendation["resource_id"],
+                "arm": arm_key(resource.get("resource_type", ""), resource.get("difficulty_level", "")),
+                "confidence_score": recommendation["confidence_score"],
+                "reward": feedback_reward(command.was_clicked, command.was_helpful),
+                "previous_reward": (feedback_reward(previous["was_clicked"], previous["was_helpful"])
+                                    if previous else None)
+            }
+        )
+        await event_bus.publish(event)
+        
+        # 4. Return result
+        return CommandResult(
+            success=True,
+            data={
+                "feedback_id": feedback["feedback_id"],
+                "recommendation_id": command.recommendation_id
+            },
+            events_published=["RecommendationFeedbackEvent"],
+            message="Feedback recorded" if previous is None else "Feedback updated"
+        )
+
 # ============================================================================
 # FASTAPI APPLICATION
 # ============================================================================
@@ -646,6 +1455,137 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Probes answer even while the app is overloaded or warming up
+HEALTH_PATHS = ("/api/health", "/api/health/live", "/api/health/ready")
+
+# Per-client token buckets (cost per endpoint) and a global concurrency limit (see admission.py)
+ENDPOINT_COSTS = {
+    ("POST", "/api/cqrs/auth/register"): 10,
+    ("POST", "/api/cqrs/auth/login"): 10,
+    ("POST", "/api/cqrs/recommendations/generate"): 10,
+    ("POST", "/api/cqrs/recommendations/model/train"): 40,
+    ("POST", "/api/cqrs/resources/upload"): 5,
+    ("GET", "/api/cqrs/analytics/"): 2,
+    ("GET", "/api/cqrs/events"): 2,
+}
+admission_control = AdmissionControl(
+    rate_per_second=float(os.getenv("RATE_LIMIT_PER_SECOND", "10")),
+    burst=float(os.getenv("RATE_LIMIT_BURST", "40")),
+    ip_factor=float(os.getenv("RATE_LIMIT_IP_FACTOR", "4")),
+    max_concurrency=int(os.getenv("MAX_CONCURRENT_REQUESTS", "64")),
+    max_queue_seconds=float(os.getenv("MAX_QUEUE_MS", "500")) / 1000,
+    bucket_slots=int(os.getenv("RATE_LIMIT_BUCKETS", "65536")),
+    endpoint_costs=ENDPOINT_COSTS,
+    exempt_paths=("/", "/docs", "/redoc", "/openapi.json", "/api/cqrs/admission") + HEALTH_PATHS,
+    streaming_suffixes=("/download",)
+)
+app.add_middleware(AdmissionControlMiddleware, control=admission_control)
+
+# Signed session tokens from register/login identify users (see session_tokens.py);
+# added after admission control so it sees scope["user"]. Workers must share SESSION_SECRET.
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+if not SESSION_SECRET:
+    print("  → SESSION_SECRET not set: using a random secret, tokens end with this process")
+    SESSION_SECRET = secrets.token_hex(32)
+session_tokens = SessionTokens(SESSION_SECRET.encode(),
+                               ttl_seconds=float(os.getenv("SESSION_TTL_HOURS", "24")) * 3600)
+app.add_middleware(AuthenticationMiddleware, backend=BearerTokenBackend(session_tokens), on_error=authentication_error)
+# uvloop leaves queued connections in the kernel backlog, where admission control cannot shed them
+UVICORN_LOOP = os.getenv("UVICORN_LOOP", "asyncio")
+
+# Heavy dependencies imported on first use (pyarrow only when exporting)
+exporter_module = lazy_import("exporter")
+
+# Startup work runs as warm-up components after the server is up; API requests
+# wait for the required ones (see readiness.py)
+readiness = Readiness()
+# added last, so it runs before admission control: held requests take no concurrency slot
+app.add_middleware(
+    ReadinessGateMiddleware,
+    readiness=readiness,
+    max_wait_seconds=float(os.getenv("READINESS_MAX_WAIT_SECONDS", "30")),
+    exempt_paths=("/", "/docs", "/redoc", "/openapi.json") + HEALTH_PATHS
+)
+# Outermost: client addresses from X-Forwarded-For, only when the peer is a trusted proxy
+# (see admission.py); an empty TRUSTED_PROXIES keys rate limits on the peer address
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "127.0.0.1")
+if TRUSTED_PROXIES:
+    app.add_middleware(ProxyHeadersMiddleware, trusted_hosts=TRUSTED_PROXIES)
+
+@readiness.component("state")
+async def recover_state():
+    """Load the latest snapshot, replay the WAL tail and start periodic snapshots/session expiry"""
+    if STATE_MODE == "worker":
+        # read replica: the owner's snapshot plus its command journal (see state_owner.py)
+        stats = await follow_owner(state_store)
+    else:
+        stats = await state_store.recover()
+        if stats:
+            print(f" Restored state: {stats}")
+            resumed = resume_content_analysis()
+            if resumed:
+                print(f"  → Resumed content analysis for {resumed} stored files")
+            app.state.snapshot_task = asyncio.create_task(state_store.run_periodic_snapshots())
+    app.state.session_expiry_task = asyncio.create_task(
+        study_sessions.run_periodic(60.0, lambda: to_epoch(datetime.now().isoformat()))
+    )
+    return stats
+
+@readiness.component("near_duplicates", required=False)
+async def warm_near_duplicates():
+    """Dummy signature + query: first-call setup of the MinHash/LSH path"""
+    signature = near_duplicate_index.signature("warm up the near duplicate index with a sample query")
+    near_duplicate_index.query(signature)
+    return {"indexed": len(near_duplicate_index)}
+
+@readiness.component("collaborative_model", required=False)
+async def warm_collaborative_model():
+    """Map the newest factors, page them in with a dummy top-k and schedule retraining"""
+    if STATE_MODE == "worker":
+        return None  # recommendations are generated (and the model trained) in the state owner
+    model = await collaborative_model.load_latest()
+    if model:
+        print(f" Loaded collaborative model {model['version']}")
+        await asyncio.to_thread(collaborative_model.warm_up)
+    train_interval = float(os.getenv("ALS_TRAIN_INTERVAL_SECONDS", "3600"))
+    if train_interval > 0:
+        app.state.training_task = asyncio.create_task(collaborative_model.run_periodic(train_interval))
+    return {"version": model["version"] if model else None}
+
+@readiness.component("exporter", required=False)
+async def start_exporter():
+    """Periodic Parquet exports (imports pyarrow) when EXPORT_DIR is set"""
+    export_dir = os.getenv("EXPORT_DIR")
+    if not export_dir or STATE_MODE == "worker":
+        return {"enabled": False}
+    exporter = exporter_module.build_exporter(export_dir, activity_store, recommendations_generated_db,
+                                              event_bus.event_log)
+    app.state.export_task = asyncio.create_task(
+        exporter.run_periodic(float(os.getenv("EXPORT_INTERVAL_SECONDS", "3600")))
+    )
+    return {"enabled": True}
+
+@app.on_event("startup")
+async def restore_state():
+    """Start the warm-up (state recovery, indexes, models) without blocking server startup"""
+    if STATE_MODE == "worker" and not READ_REPLICAS:
+        return  # the state owner process holds the only copy of the stores
+    app.state.warm_up_task = asyncio.create_task(readiness.warm_up())
+    if STATE_MODE == "owner":
+        await readiness.wait_ready()  # workers start forwarding as soon as the owner's socket is up
+
+@app.on_event("shutdown")
+async def flush_state():
+    """Flush the WAL so no acknowledged command is lost"""
+    warm_up_task = getattr(app.state, "warm_up_task", None)
+    if warm_up_task:
+        await warm_up_task
+    if download_log_tasks:
+        await asyncio.gather(*download_log_tasks)
+    await state_store.wait_for_snapshot()
+    state_store.close()
+    collaborative_model.close()
+
 # ============================================================================
 # API ENDPOINTS
 # ============================================================================
@@ -658,6 +1598,7 @@ async def root():
         "use_cases_implemented": 5,
         "endpoints": [
             "POST /api/cqrs/auth/register",
+            "POST /api/cqrs/auth/login",
             "POST /api/cqrs/resources/upload",
             "POST /api/cqrs/resources/{resource_id}/view",
             "POST /api/cqrs/resources/{resource_id}/rate",
@@ -665,46 +1606,148 @@ async def root():
         ]
     }
 
+@app.get("/api/health/live")
+async def liveness():
+    """Liveness: the process is up and its event loop responds (never waits for warm-up)"""
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+@app.get("/api/health/ready")
+@replicated
+async def readiness_check():
+    """Readiness: per-component warm-up state and timings; 503 until the required ones are ready"""
+    report = readiness.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+@app.get("/api/health")
+@replicated
+async def health_check():
+    """Health check endpoint"""
+    return {
+        "status": "healthy" if readiness.is_ready else "starting",
+        "timestamp": datetime.now().isoformat(),
+        "users_registered": len(users_auth_db),
+        "resources_uploaded": len(resources_metadata_db),
+    }
+
+# Every command endpoint accepts an optional Idempotency-Key header: retries with the
+# same key get the first CommandResult back without executing again (see idempotency.py)
+
 # Use Case 1: User Registration
 @app.post("/api/cqrs/auth/register", response_model=CommandResult, status_code=status.HTTP_201_CREATED)
-async def register_user(command: RegisterUserCommand):
+async def register_user(command: RegisterUserCommand,
+                        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """
     Use Case 1: Register a new user with event-driven notifications
     
     CQRS: Command creates user records across 3 tables
     EDA: Publishes UserRegisteredEvent for async processing
+    
+    The response carries a session token; send it as `Authorization: Bearer <token>`.
     """
-    return await RegisterUserCommandHandler.handle(command)
+    result = await RegisterUserCommandHandler.handle(command, idempotency_key=idempotency_key)
+    token = session_tokens.issue(result.data["user_id"])
+    return result.model_copy(update={"data": {**result.data, "session_token": token}})
+
+class LoginRequest(BaseModel):
+    """Credentials for a new session token"""
+    email: EmailStr
+    password: str
+
+@replicated
+async def authenticate_user(email: str, password: str) -> str:
+    """user_id for matching credentials, else 401"""
+    user = await UserRepository.find_user_by_email(email)
+    if user is None or not hmac.compare_digest(user["password_hash"].encode(), password.encode()):
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    return user["user_id"]
+
+@app.post("/api/cqrs/auth/login", response_model=QueryResult)
+async def login(request: LoginRequest):
+    """Issue a session token for a registered user"""
+    user_id = await authenticate_user(request.email, request.password)
+    return QueryResult(success=True, data={"user_id": user_id, "session_token": session_tokens.issue(user_id)})
 
 # Use Case 2: Resource Upload
-@app.post("/api/cqrs/resources/upload", response_model=CommandResult, status_code=status.HTTP_201_CREATED)
-async def upload_resource(
-    title: str = Form(...),
-    description: str = Form(...),
-    resource_type: str = Form(...),
-    difficulty_level: str = Form(...),
-    uploader_user_id: str = Form(...),
-    file_name: str = Form(...)
-):
+UPLOAD_FORM_FIELDS = ["title", "description", "resource_type", "difficulty_level", "uploader_user_id"]
+
+@app.post(
+    "/api/cqrs/resources/upload", response_model=CommandResult, status_code=status.HTTP_201_CREATED,
+    openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "required": UPLOAD_FORM_FIELDS,
+        "properties": {
+            **{name: {"type": "string"} for name in UPLOAD_FORM_FIELDS},
+            "file": {"type": "string", "format": "binary"},
+            "file_name": {"type": "string", "description": "Used when no file part is sent"}
+        }
+    }}}}}
+)
+async def upload_resource(request: Request,
+                          idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """
     Use Case 2: Upload resource with auto-tagging
     
+    The file part is streamed to storage in fixed-size chunks and hashed on the way,
+    so memory use does not grow with file size. MIME type and page count are
+    extracted in the background after the upload completes.
+    
     CQRS: Command creates resource records across 3 tables
     EDA: Publishes ResourceUploadedEvent for tag generation and notifications
     """
-    command = UploadResourceCommand(
-        title=title,
-        description=description,
-        resource_type=resource_type,
-        difficulty_level=difficulty_level,
-        uploader_user_id=uploader_user_id,
-        file_name=file_name
-    )
-    return await UploadResourceCommandHandler.handle(command)
+    stored, claimed = None, False
+    try:
+        if request.headers.get("content-type", "").startswith("multipart/form-data"):
+            fields, stored = await parse_streaming_upload(request.headers, request.stream(), content_store)
+        else:
+            fields = dict(await request.form())
+        
+        missing = [name for name in UPLOAD_FORM_FIELDS if not fields.get(name)]
+        if not stored and not fields.get("file_name"):
+            missing.append("file")
+        if missing:
+            raise HTTPException(status_code=422, detail=f"Missing form fields: {', '.join(missing)}")
+        
+        if stored:
+            await claim_upload(stored.staged_path, stored.checksum)
+            claimed = True
+        
+        command = UploadResourceCommand(
+            title=fields["title"],
+            description=fields["description"],
+            resource_type=fields["resource_type"],
+            difficulty_level=fields["difficulty_level"],
+            uploader_user_id=fields["uploader_user_id"],
+            file_name=fields.get("file_name") or stored.file_name,
+            checksum=stored.checksum if stored else None,
+            file_size_bytes=stored.size_bytes if stored else None,
+            content_type=stored.declared_content_type if stored else ""
+        )
+        return await UploadResourceCommandHandler.handle(command, idempotency_key=idempotency_key)
+    finally:
+        # a rejected upload (unknown uploader, invalid fields) leaves no record: drop its object
+        if claimed:
+            await release_upload(stored.checksum)
+        elif stored:
+            await asyncio.to_thread(content_store.discard, stored)
+
+# Object ownership is decided in the state owner: it serializes the claims and
+# releases of all workers, so a rejected upload never removes an object that a
+# concurrent upload of the same content has just deduplicated against.
+
+@routed
+async def claim_upload(staged_path: str, checksum: str) -> bool:
+    """Move a staged upload into the content store; False on a dedupe hit"""
+    return content_store.claim(staged_path, checksum)
+
+@routed
+async def release_upload(checksum: str):
+    """Release a claimed upload once its command finished"""
+    content_store.release(checksum, referenced=checksum in stored_files_db)
 
 # Use Case 3: View Resource
 @app.post("/api/cqrs/resources/{resource_id}/view", response_model=CommandResult)
-async def view_resource(resource_id: str, command: LogResourceViewCommand):
+async def view_resource(resource_id: str, command: LogResourceViewCommand,
+                        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """
     Use Case 3: Log resource view with activity tracking
     
@@ -712,11 +1755,76 @@ async def view_resource(resource_id: str, command: LogResourceViewCommand):
     EDA: Publishes ResourceViewedEvent for analytics and preference updates
     """
     command.resource_id = resource_id
-    return await LogResourceViewCommandHandler.handle(command)
+    return await LogResourceViewCommandHandler.handle(command, idempotency_key=idempotency_key)
+
+# Use Case 3b: Download Resource
+download_log_tasks: set = set()                         # download logs not written yet
+
+@replicated
+async def get_download_target(resource_id: str) -> dict:
+    """Stored file behind a resource"""
+    content = await ResourceRepository.get_resource_content(resource_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Resource not found")
+    stored = stored_files_db.get(content.get("checksum") or "")
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Resource has no stored file")
+    return {
+        "file_path": stored["file_path"],
+        "size_bytes": stored["size_bytes"],
+        "file_name": content.get("file_name") or stored["file_name"],
+        "mime_type": content["mime_type"],
+        "etag": f'"{stored["checksum"]}"'
+    }
+
+def schedule_download_log(command: LogResourceDownloadCommand):
+    """Log a finished download in the background; the transfer never waits for it"""
+    task = asyncio.create_task(log_download(command))
+    download_log_tasks.add(task)
+    task.add_done_callback(download_log_tasks.discard)
+
+async def log_download(command: LogResourceDownloadCommand):
+    try:
+        await LogResourceDownloadCommandHandler.handle(command)
+    except Exception as e:
+        print(f" Error logging download of {command.resource_id}: {str(e)}")
+
+@app.api_route("/api/cqrs/resources/{resource_id}/download", methods=["GET", "HEAD"])
+async def download_resource(resource_id: str, request: Request, user_id: Optional[str] = None,
+                            x_user_id: Optional[str] = Header(None, alias="X-User-Id")):
+    """
+    Use Case 3b: Download a resource's file (Range requests resume downloads and seek in media)
+    
+    The stored file is streamed from disk in large chunks, whole or as one byte range.
+    CQRS: LogResourceDownloadCommand runs after the transfer ends, off the download path
+    EDA: Publishes ResourceDownloadedEvent for download counts and analytics
+    """
+    target = await get_download_target(resource_id)
+    if etag_matches(request.headers.get("if-none-match"), target["etag"]):
+        return Response(status_code=304, headers={"ETag": target["etag"]})
+    
+    def on_complete(bytes_sent: int, completed: bool):
+        schedule_download_log(LogResourceDownloadCommand(
+            resource_id=resource_id,
+            user_id=user_id or x_user_id,
+            file_size_downloaded=bytes_sent,
+            download_success=completed,
+            reached_end_of_file=response.end == target["size_bytes"] - 1,
+            whole_file=response.start == 0 and response.end == target["size_bytes"] - 1,
+            ip_address=request.client.host if request.client else ""
+        ))
+    
+    response = FileDownload(
+        target["file_path"], target["size_bytes"], target["file_name"], target["mime_type"], target["etag"],
+        range_header=request.headers.get("range"), if_range=request.headers.get("if-range"),
+        head=request.method == "HEAD", on_complete=on_complete
+    )
+    return response
 
 # Use Case 4: Rate Resource
 @app.post("/api/cqrs/resources/{resource_id}/rate", response_model=CommandResult)
-async def rate_resource(resource_id: str, command: RateResourceCommand):
+async def rate_resource(resource_id: str, command: RateResourceCommand,
+                        idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """
     Use Case 4: Rate a resource and update statistics
     
@@ -724,26 +1832,48 @@ async def rate_resource(resource_id: str, command: RateResourceCommand):
     EDA: Publishes ResourceRatedEvent for owner notifications and recommendation updates
     """
     command.resource_id = resource_id
-    return await RateResourceCommandHandler.handle(command)
+    return await RateResourceCommandHandler.handle(command, idempotency_key=idempotency_key)
 
 # Use Case 5: Generate Recommendations
 @app.post("/api/cqrs/recommendations/generate", response_model=CommandResult)
-async def generate_recommendations(command: GenerateRecommendationsCommand):
+async def generate_recommendations(command: GenerateRecommendationsCommand,
+                                   idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """
     Use Case 5: Generate personalized recommendations
     
     CQRS: Command executes recommendation algorithm and stores results
     EDA: Publishes RecommendationsGeneratedEvent for caching and notifications
     """
-    return await GenerateRecommendationsCommandHandler.handle(command)
+    return await GenerateRecommendationsCommandHandler.handle(command, idempotency_key=idempotency_key)
+
+@app.post("/api/cqrs/recommendations/{recommendation_id}/feedback", response_model=CommandResult)
+async def submit_recommendation_feedback(recommendation_id: str, command: SubmitRecommendationFeedbackCommand,
+                                         idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """
+    Record whether a recommendation was clicked / helpful
+    
+    CQRS: Command stores feedback in recommendations_feedback
+    EDA: Publishes RecommendationFeedbackEvent; the re-ranking bandit learns from it
+    """
+    command.recommendation_id = recommendation_id
+    return await SubmitRecommendationFeedbackCommandHandler.handle(command, idempotency_key=idempotency_key)
 
 # ============================================================================
 # QUERY ENDPOINTS (Read side)
 # ============================================================================
 
+# @replicated: with several workers each one answers queries from its own read
+# replica of the state (see state_owner.py)
+
 @app.get("/api/cqrs/users/{user_id}")
-async def get_user_profile(user_id: str):
-    """Query: Get user profile (read model)"""
+@replicated
+async def get_user_profile(user_id: str,
+                           if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
+    """Query: Get user profile (read model, served from the response cache)"""
+    return await response_cache.respond(("user", user_id), if_none_match, lambda: assemble_user_profile(user_id))
+
+async def assemble_user_profile(user_id: str) -> Dict[str, Any]:
+    """User profile read model"""
     if not await UserRepository.user_exists(user_id):
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -752,39 +1882,162 @@ async def get_user_profile(user_id: str):
     profile = next((p for p in users_profile_db.values() if p["user_id"] == user_id), None)
     prefs = next((p for p in users_preferences_db.values() if p["user_id"] == user_id), None)
     
-    return QueryResult(
-        success=True,
-        data={
-            "user_id": user_id,
-            "email": auth["email"] if auth else None,
-            "username": profile["username"] if profile else None,
-            "learning_style": prefs["learning_style"] if prefs else None
-        }
-    )
+    return {
+        "user_id": user_id,
+        "email": auth["email"] if auth else None,
+        "username": profile["username"] if profile else None,
+        "learning_style": prefs["learning_style"] if prefs else None
+    }
 
 @app.get("/api/cqrs/resources/{resource_id}")
-async def get_resource_details(resource_id: str):
-    """Query: Get resource details (read model)"""
+@replicated
+async def get_resource_details(resource_id: str,
+                               if_none_match: Optional[str] = Header(None, alias="If-None-Match")):
+    """Query: Get resource details (read model, served from the response cache)"""
+    return await response_cache.respond(("resource", resource_id), if_none_match,
+                                        lambda: assemble_resource_details(resource_id))
+
+async def assemble_resource_details(resource_id: str) -> Dict[str, Any]:
+    """Resource details read model"""
     if not await ResourceRepository.resource_exists(resource_id):
         raise HTTPException(status_code=404, detail="Resource not found")
     
     # Assemble from multiple tables (NO JOIN)
     metadata = resources_metadata_db.get(resource_id)
-    content = next((c for c in resources_content_db.values() if c["resource_id"] == resource_id), None)
+    content = await ResourceRepository.get_resource_content(resource_id)
     stats = await ResourceRepository.get_resource_stats(resource_id)
     
+    return {
+        "resource_id": resource_id,
+        "title": metadata["title"] if metadata else None,
+        "file_url": content["file_url"] if content else None,
+        "duplicate_of": metadata.get("duplicate_of") if metadata else None,
+        "duplicates": resource_duplicates_index.get(resource_id, []),
+        "view_count": stats["view_count"] if stats else 0,
+        "download_count": stats["download_count"] if stats else 0,
+        "average_rating": stats["average_rating"] if stats else 0.0
+    }
+
+@app.get("/api/cqrs/analytics/{scope}/{entity_id}")
+@replicated
+async def get_activity_rollup(scope: str, entity_id: str, granularity: str = "hour",
+                              start: Optional[str] = None, end: Optional[str] = None):
+    """Query: Engagement counters for a resource or user over [start, end) (default: last 7 days)"""
+    scopes = {"resources": "resource", "users": "user"}
+    if scope not in scopes:
+        raise HTTPException(status_code=404, detail="Unknown analytics scope")
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {list(GRANULARITIES)}")
+    
+    try:
+        end_ts = to_epoch(end) if end else to_epoch(now_iso())
+        start_ts = to_epoch(start) if start else end_ts - 7 * 86400
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start/end must be ISO timestamps")
+    if (end_ts - start_ts) / GRANULARITIES[granularity] > 20000:
+        raise HTTPException(status_code=400, detail="Range too long for this granularity")
+    
+    rollup_scope = scopes[scope]
+    series = activity_rollups.series(rollup_scope, entity_id, start_ts, end_ts, granularity)
     return QueryResult(
         success=True,
         data={
-            "resource_id": resource_id,
-            "title": metadata["title"] if metadata else None,
-            "file_url": content["file_url"] if content else None,
-            "view_count": stats["view_count"] if stats else 0,
-            "average_rating": stats["average_rating"] if stats else 0.0
+            "entity_id": entity_id,
+            "granularity": granularity,
+            "totals": activity_rollups.totals(rollup_scope, entity_id, start_ts, end_ts),
+            "buckets": [
+                dict(row, bucket=from_epoch(row["bucket"]))
+                for row in series
+            ]
+        }
+    )
+
+@app.get("/api/cqrs/users/{user_id}/study-progress")
+@replicated
+async def get_study_progress(user_id: str, start: Optional[str] = None, end: Optional[str] = None):
+    """Query: Study sessions of a user ending in [start, end) (default: last 7 days), per day/subject/device"""
+    if not await UserRepository.user_exists(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    try:
+        end_ts = to_epoch(end) if end else to_epoch(now_iso())
+        start_ts = to_epoch(start) if start else end_ts - 7 * 86400
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start/end must be ISO timestamps")
+    
+    # Subjects are the resource's auto tags (tag:<name> features of the interest profiles)
+    def subjects_of(resource_id: str) -> List[str]:
+        return [key[4:] for key in interest_profiles.resource_features.get(resource_id, ()) if key.startswith("tag:")]
+    
+    progress = study_sessions.progress(user_id, start_ts, end_ts, subjects_of)
+    return QueryResult(
+        success=True,
+        data={
+            "user_id": user_id,
+            "start": from_epoch(start_ts),
+            "end": from_epoch(end_ts),
+            **progress,
+            "by_day": [dict(row, day=from_epoch(row["day"])[:10]) for row in progress["by_day"]],
         }
     )
 
+@app.get("/api/cqrs/users/{user_id}/study-sessions")
+@replicated
+async def get_study_sessions(user_id: str, limit: int = 20):
+    """Query: A user's latest study sessions (open ones included), newest first"""
+    if not await UserRepository.user_exists(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    sessions = study_sessions.recent(user_id, min(max(limit, 1), 200))
+    return QueryResult(
+        success=True,
+        data={
+            "user_id": user_id,
+            "sessions": [dict(row, start=from_epoch(row["start"]), end=from_epoch(row["end"])) for row in sessions],
+        }
+    )
+
+@app.get("/api/cqrs/study-sessions")
+@replicated
+async def get_study_session_stats():
+    """Query: Open/closed session counts and record memory of the session processor"""
+    return QueryResult(success=True, data=study_sessions.stats())
+
+@app.get("/api/cqrs/admission")
+async def get_admission_stats():
+    """Query: Rate-limit and load-shedding counters of this worker"""
+    return QueryResult(success=True, data=admission_control.stats())
+
+@app.get("/api/cqrs/cache")
+@replicated
+async def get_response_cache_stats():
+    """Query: Hit/miss/304 counters and memory of the query response cache"""
+    return QueryResult(success=True, data=response_cache.summary())
+
+@app.get("/api/cqrs/recommendations/bandit")
+@replicated
+async def get_bandit_stats():
+    """Query: Feedback counts and fitted click model per re-ranking arm"""
+    return QueryResult(success=True, data={"alpha": recommendation_bandit.alpha,
+                                           "arms": recommendation_bandit.stats()})
+
+@app.get("/api/cqrs/recommendations/model")
+@routed
+async def get_collaborative_model_stats():
+    """Query: Version, size and training time/memory of the served collaborative model"""
+    return QueryResult(success=True, data=collaborative_model.summary())
+
+@app.post("/api/cqrs/recommendations/model/train")
+@routed
+async def train_collaborative_model():
+    """Train a collaborative model version now (in the worker process) and serve it"""
+    if collaborative_model.training:
+        raise HTTPException(status_code=409, detail="Training already in progress")
+    stats = await collaborative_model.train()
+    if stats is None:
+        raise HTTPException(status_code=409, detail="No interactions to train on")
+    return QueryResult(success=True, data=stats)
+
 @app.get("/api/cqrs/events")
+@replicated
 async def get_event_log():
     """Query: Get all published events (for debugging)"""
     return {
@@ -800,6 +2053,8 @@ async def get_event_log():
         ]
     }
 
+record_import(__name__, _IMPORT_STARTED)
+
 # ============================================================================
 # RUN APPLICATION
 # ============================================================================
@@ -826,9 +2081,24 @@ if __name__ == "__main__":
     print(" API Docs: http://localhost:8000/docs")
     print("="*70 + "\n")
     
-    uvicorn.run(
-        "cqrs_eda_implementation:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True
-    )
\ No newline at end of file
+    # WEB_CONCURRENCY > 1: one state owner process + N stateless HTTP workers
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        os.environ.setdefault("SESSION_SECRET", secrets.token_hex(32))   # the same in every worker
+        owner = spawn_owner("cqrs_eda_implementation", os.getenv("STATE_SOCKET", "/tmp/smart-study-cqrs.sock"))
+        os.environ["STATE_MODE"] = "worker"
+        try:
+            uvicorn.run("cqrs_eda_implementation:app", host="0.0.0.0", port=8000, workers=workers, loop=UVICORN_LOOP,
+                        proxy_headers=False)      # TRUSTED_PROXIES applies instead
+        finally:
+            owner.terminate()
+            owner.wait()
+    else:
+        uvicorn.run(
+            "cqrs_eda_implementation:app",
+            host="0.0.0.0",
+            port=8000,
+            loop=UVICORN_LOOP,
+            proxy_headers=False,
+            reload=True
+        )
\ No newline at end of file
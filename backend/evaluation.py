@@ -0,0 +1,466 @@
+"""
+Offline Recommender Evaluation
+Temporal train/test replay of historical interactions with ranking metrics
+
+Interactions before a cutoff (the latest `test_fraction` of events goes to
+the test side) train each algorithm; every user with a test interaction is
+then ranked and scored with precision@k, recall@k, NDCG@k and MAP@k.
+Coverage and latency are reported next to them.
+
+The algorithms are the ones the API serves, ranked by the request path's
+own code (ranking.rank_resources: profile or collaborative candidates,
+near-duplicate collapse, bandit re-ranking) over stores rebuilt from the
+train split. Baselines (popularity) are reported separately.
+
+Metrics are NumPy over blocks of users; with workers > 1 the blocks are
+spread over forked processes.
+
+    python evaluation.py --synthetic --users 5000 --items 2000 --k 10
+    python evaluation.py --export-dir exports --out report.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from bandit import RecommendationBandit
+from factor_model import DEFAULT_ALPHA, DEFAULT_FACTORS, DEFAULT_ITERATIONS, DEFAULT_REGULARIZATION, \
+    FactorModel, train_model_version
+from interest_profiles import InterestProfileStore, rating_weight, view_weight
+from ranking import rank_resources
+
+SCORE_BLOCK_CELLS = 1 << 20      # users per block = this / number of items
+
+# ============================================================================
+# DATASET
+# ============================================================================
+
+class InteractionLog:
+    """Interactions as parallel arrays plus the item features used for scoring"""
+
+    def __init__(self, users: List[str], items: List[str], user: np.ndarray, item: np.ndarray,
+                 timestamp: np.ndarray, weight: np.ndarray, item_type: np.ndarray,
+                 item_difficulty: np.ndarray, item_tags: np.ndarray, n_types: int,
+                 n_difficulties: int, n_tags: int, item_duplicate: Optional[np.ndarray] = None):
+        self.users = users
+        self.items = items
+        self.user = user                    # int32 user index per interaction
+        self.item = item                    # int32 item index per interaction
+        self.timestamp = timestamp          # float64 epoch seconds
+        self.weight = weight                # float64 profile weight (view/rating weight)
+        self.item_type = item_type          # int32 per item
+        self.item_difficulty = item_difficulty
+        self.item_tags = item_tags          # int32 (items x max tags), padded with n_tags
+        self.n_types = n_types
+        self.n_difficulties = n_difficulties
+        self.n_tags = n_tags
+        self.item_duplicate = (np.zeros(len(items), dtype=bool) if item_duplicate is None
+                               else item_duplicate)    # near-duplicate of another item (never served)
+
+    def __len__(self):
+        return len(self.user)
+
+    def subset(self, mask: np.ndarray) -> "InteractionLog":
+        return InteractionLog(self.users, self.items, self.user[mask], self.item[mask], self.timestamp[mask],
+                              self.weight[mask], self.item_type, self.item_difficulty, self.item_tags,
+                              self.n_types, self.n_difficulties, self.n_tags, self.item_duplicate)
+
+class _Codes:
+    """String -> dense index"""
+
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+
+    def __call__(self, value: str) -> int:
+        return self.index.setdefault(value, len(self.index))
+
+    def values(self) -> List[str]:
+        return list(self.index)
+
+def build_log(interactions: List[Tuple[str, str, float, float]],
+              resources: Dict[str, Tuple[str, str, List[str]]],
+              duplicates: Iterable[str] = ()) -> InteractionLog:
+    """Build an InteractionLog from (user, item, epoch seconds, weight) rows,
+    item features {resource_id: (resource_type, difficulty_level, tags)} and
+    the ids of near-duplicate resources"""
+    users, items, types, difficulties, tags = _Codes(), _Codes(), _Codes(), _Codes(), _Codes()
+    for resource_id in resources:
+        items(resource_id)
+    rows = [(users(u), items(i), t, w) for u, i, t, w in interactions if w > 0]
+
+    item_ids = items.values()
+    features = [resources.get(i, ("unknown", "unknown", [])) for i in item_ids]
+    item_type = np.array([types(f[0]) for f in features], dtype=np.int32)
+    item_difficulty = np.array([difficulties(f[1]) for f in features], dtype=np.int32)
+    tag_lists = [[tags(t) for t in dict.fromkeys(f[2])] for f in features]
+    n_tags = len(tags.index)
+    item_tags = np.full((len(item_ids), max([len(t) for t in tag_lists] + [1])), n_tags, dtype=np.int32)
+    for row, tag_list in enumerate(tag_lists):
+        item_tags[row, :len(tag_list)] = tag_list
+
+    duplicates = set(duplicates)
+    item_duplicate = np.array([i in duplicates for i in item_ids], dtype=bool)
+
+    user, item, timestamp, weight = (np.array(c) for c in zip(*rows)) if rows else ([],) * 4
+    return InteractionLog(
+        users.values(), item_ids, np.asarray(user, np.int32), np.asarray(item, np.int32),
+        np.asarray(timestamp, np.float64), np.asarray(weight, np.float64),
+        item_type, item_difficulty, item_tags, len(types.index), len(difficulties.index), n_tags,
+        item_duplicate
+    )
+
+def synthetic_log(n_users: int = 2000, n_items: int = 1000, n_tags: int = 40,
+                  events_per_user: int = 40, days: int = 60, seed: int = 7) -> InteractionLog:
+    """Users with a few favourite tags and a preferred difficulty, picking items by affinity"""
+    rng = np.random.default_rng(seed)
+    types = ["pdf", "video", "slides", "quiz"]
+    difficulties = ["beginner", "intermediate", "advanced"]
+    item_tags = [rng.choice(n_tags, size=rng.integers(1, 4), replace=False) for _ in range(n_items)]
+    item_type = rng.integers(len(types), size=n_items)
+    item_difficulty = rng.integers(len(difficulties), size=n_items)
+    popularity = 1.0 / np.arange(1, n_items + 1) ** 0.6
+    rng.shuffle(popularity)
+
+    tag_matrix = np.zeros((n_items, n_tags))
+    for i, item_tag_list in enumerate(item_tags):
+        tag_matrix[i, item_tag_list] = 1.0
+
+    start = datetime(2024, 1, 1).timestamp()
+    interactions = []
+    for u in range(n_users):
+        favourite = np.zeros(n_tags)
+        favourite[rng.choice(n_tags, size=3, replace=False)] = 1.0
+        affinity = 2.5 * (tag_matrix @ favourite) + 1.0 * (item_difficulty == rng.integers(len(difficulties)))
+        p = popularity * np.exp(affinity)
+        picks = rng.choice(n_items, size=events_per_user, p=p / p.sum())
+        times = np.sort(start + rng.uniform(0, days * 86400, size=events_per_user))
+        durations = rng.integers(10, 900, size=events_per_user)
+        interactions.extend((f"user-{u}", f"resource-{i}", t, view_weight(int(d)))
+                            for i, t, d in zip(picks, times, durations))
+
+    resources = {
+        f"resource-{i}": (types[item_type[i]], difficulties[item_difficulty[i]],
+                          [f"tag-{t}" for t in item_tags[i]])
+        for i in range(n_items)
+    }
+    return build_log(interactions, resources)
+
+def load_export(directory: str) -> InteractionLog:
+    """Load views, ratings and resource features from a Parquet export (see exporter.py)"""
+    import pyarrow.parquet as pq
+
+    def read(table: str, columns: List[str]):
+        path = os.path.join(directory, table)
+        return pq.read_table(path, columns=columns).to_pydict() if os.path.isdir(path) else {c: [] for c in columns}
+
+    views = read("activities_views", ["user_id", "resource_id", "view_timestamp", "view_duration_seconds"])
+    ratings = read("activities_ratings", ["rating_id", "user_id", "resource_id", "rating_value", "updated_at"])
+    events = read("events", ["event_type", "data"])
+
+    resources, duplicates = {}, []
+    for event_type, data in zip(events["event_type"], events["data"]):
+        if event_type == "ResourceUploadedEvent":
+            data = json.loads(data)
+            resources[data["resource_id"]] = (data.get("resource_type", ""), data.get("difficulty_level", ""),
+                                              data.get("auto_tags", []))
+            if data.get("duplicate_of"):
+                duplicates.append(data["resource_id"])
+
+    interactions = [
+        (u, r, t.timestamp(), view_weight(d))
+        for u, r, t, d in zip(views["user_id"], views["resource_id"], views["view_timestamp"],
+                              views["view_duration_seconds"])
+    ]
+    latest = {}      # re-rated rows appear once per export run; keep the newest
+    for rating_id, u, r, value, t in zip(*ratings.values()):
+        if rating_id not in latest or latest[rating_id][2] < t.timestamp():
+            latest[rating_id] = (u, r, t.timestamp(), rating_weight(value))
+    interactions.extend(latest.values())
+    return build_log(interactions, resources, duplicates)
+
+def temporal_split(log: InteractionLog, test_fraction: float = 0.2) -> Tuple[InteractionLog, InteractionLog, float]:
+    """Everything before the cutoff trains, the latest test_fraction of events tests"""
+    cutoff = float(np.quantile(log.timestamp, 1.0 - test_fraction))
+    return log.subset(log.timestamp < cutoff), log.subset(log.timestamp >= cutoff), cutoff
+
+# ============================================================================
+# ALGORITHMS
+# ============================================================================
+
+class ServedRanking:
+    """The API's ranking (ranking.rank_resources) over stores rebuilt from the train split.
+
+    Interest profiles replay the train interactions in time order; the
+    bandit starts without feedback (the logs hold none). A user is ranked
+    like a request with limit = k + the items they saw in training, so k
+    remain when seen items are excluded.
+    """
+    algorithm = "hybrid"
+
+    def __init__(self, train: InteractionLog, now: float):
+        self.log = train
+        self.profiles = InterestProfileStore()
+        self.resources: Dict[str, dict] = {}
+        for i, resource_id in enumerate(train.items):
+            resource_type, difficulty = f"type-{train.item_type[i]}", f"difficulty-{train.item_difficulty[i]}"
+            tags = [f"tag-{t}" for t in train.item_tags[i] if t < train.n_tags]
+            self.profiles.register_resource(resource_id, resource_type, difficulty, tags)
+            self.resources[resource_id] = {"resource_type": resource_type, "difficulty_level": difficulty,
+                                           "duplicate_of": "near-duplicate" if train.item_duplicate[i] else None}
+        for row in np.argsort(train.timestamp, kind="stable"):
+            self.profiles.record_interaction(train.users[train.user[row]], train.items[train.item[row]],
+                                             float(train.weight[row]), now=float(train.timestamp[row]))
+        self.bandit = RecommendationBandit()
+        self.collaborative_top_k = None
+        self.item_index = {resource_id: i for i, resource_id in enumerate(train.items)}
+        pairs = np.unique(train.user.astype(np.int64) * len(train.items) + train.item)
+        self.seen = np.bincount(pairs // max(len(train.items), 1), minlength=len(train.users))
+
+    def scores(self, users: np.ndarray, k: int) -> np.ndarray:
+        """Ranked items get descending scores, everything else -inf"""
+        log = self.log
+        scores = np.full((len(users), len(log.items)), -np.inf)
+        for row, user in enumerate(users):
+            _, ranked = rank_resources(log.users[user], k + int(self.seen[user]), self.algorithm, self.resources,
+                                       self.profiles, self.bandit, self.collaborative_top_k)
+            for position, (resource_id, _, _) in enumerate(ranked):
+                scores[row, self.item_index[resource_id]] = len(ranked) - position
+        return scores
+
+class ServedCollaborative(ServedRanking):
+    """Collaborative candidates from a model version trained and loaded like the served one
+    (factor_model.py); users unknown to the model fall back to the profile ranking"""
+    algorithm = "collaborative"
+
+    def __init__(self, train: InteractionLog, now: float):
+        super().__init__(train, now)
+        directory = tempfile.mkdtemp(prefix="eval-als-")
+        try:
+            params = {"factors": DEFAULT_FACTORS, "iterations": DEFAULT_ITERATIONS,
+                      "regularization": DEFAULT_REGULARIZATION, "alpha": DEFAULT_ALPHA}
+            stats = train_model_version(directory, "eval", train.user, train.item, train.weight, train.users,
+                                        train.items, np.flatnonzero(train.item_duplicate), params)
+            self.model = FactorModel(os.path.join(directory, f"als-{stats['version']}"))   # mmap'd
+        finally:
+            shutil.rmtree(directory)
+        self.collaborative_top_k = self.model.top_k
+
+class PopularModel:
+    """Baseline (not served by the API): the most interacted-with train items for everyone"""
+
+    def __init__(self, train: InteractionLog, now: float):
+        self.popularity = np.bincount(train.item, minlength=len(train.items)).astype(np.float64)
+
+    def scores(self, users: np.ndarray, k: int) -> np.ndarray:
+        return np.broadcast_to(self.popularity, (len(users), len(self.popularity))).copy()
+
+# algorithm value (GenerateRecommendationsCommand.algorithm) -> factory(train, now)
+ALGORITHMS: Dict[str, Callable] = {
+    "hybrid": ServedRanking,
+    "collaborative": ServedCollaborative,
+}
+
+# reference points only, reported under "baselines"
+BASELINES: Dict[str, Callable] = {
+    "popular": PopularModel,
+}
+
+# ============================================================================
+# METRICS
+# ============================================================================
+
+def rank_top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k best items per row, best first"""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+def ranking_metrics(top: np.ndarray, relevant: np.ndarray, k: int,
+                    valid: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """Per-user precision/recall/NDCG/AP at k for top-k lists against a relevance matrix
+    (valid marks the list entries that were actually ranked; the rest never hit)"""
+    hits = np.take_along_axis(relevant, top, axis=1)
+    if valid is not None:
+        hits &= valid
+    hits = hits.astype(np.float64)
+    n_relevant = relevant.sum(axis=1)
+    discounts = 1.0 / np.log2(np.arange(2, top.shape[1] + 2))
+    ideal = np.cumsum(discounts)[np.minimum(n_relevant, top.shape[1]) - 1]
+    precision_at = np.cumsum(hits, axis=1) / np.arange(1, top.shape[1] + 1)
+    return {
+        "precision": hits.sum(axis=1) / k,
+        "recall": hits.sum(axis=1) / n_relevant,
+        "ndcg": (hits * discounts).sum(axis=1) / ideal,
+        "map": (precision_at * hits).sum(axis=1) / np.minimum(n_relevant, k),
+    }
+
+# ============================================================================
+# EVALUATION
+# ============================================================================
+
+_shared: dict = {}     # set before forking so workers inherit the models copy-on-write
+
+def _evaluate_block(args: Tuple[str, np.ndarray]) -> Tuple[str, Dict[str, np.ndarray], np.ndarray, float]:
+    name, users = args
+    model, train, test, k, exclude_seen = (_shared[key] for key in ("models", "train", "test", "k", "exclude_seen"))
+    model = model[name]
+    started = time.perf_counter()
+    scores = model.scores(users, k)
+    if exclude_seen:
+        scores[_block_matrix(users, train)] = -np.inf
+    top = rank_top_k(scores, k)
+    elapsed = time.perf_counter() - started
+    valid = np.isfinite(np.take_along_axis(scores, top, axis=1))     # short lists pad with unranked items
+
+    relevant = _block_matrix(users, test)
+    if exclude_seen:
+        relevant &= ~_block_matrix(users, train)
+    return name, ranking_metrics(top, relevant, k, valid), np.unique(top[valid]), elapsed
+
+def _block_matrix(users: np.ndarray, log: InteractionLog) -> np.ndarray:
+    """Users x items boolean matrix of interactions for a block of users"""
+    position = np.full(len(log.users), -1)
+    position[users] = np.arange(len(users))
+    rows = position[log.user]
+    keep = rows >= 0
+    matrix = np.zeros((len(users), len(log.items)), dtype=bool)
+    matrix[rows[keep], log.item[keep]] = True
+    return matrix
+
+def evaluate(log: InteractionLog, algorithms: Optional[List[str]] = None, k: int = 10,
+             test_fraction: float = 0.2, workers: int = 1, exclude_seen: bool = True,
+             latency_samples: int = 200) -> dict:
+    """Run every algorithm (served ones and baselines) on a temporal split and return the report"""
+    algorithms = algorithms or list(ALGORITHMS) + list(BASELINES)
+    factories = {**ALGORITHMS, **BASELINES}
+    train, test, cutoff = temporal_split(log, test_fraction)
+
+    # Evaluate users that have at least one relevant (new, if exclude_seen) test item
+    candidates = np.unique(test.user)
+    has_relevant = np.zeros(len(candidates), dtype=bool)
+    block = max(1, SCORE_BLOCK_CELLS // max(len(log.items), 1))
+    for start in range(0, len(candidates), block):
+        users = candidates[start:start + block]
+        relevant = _block_matrix(users, test)
+        if exclude_seen:
+            relevant &= ~_block_matrix(users, train)
+        has_relevant[start:start + block] = relevant.any(axis=1)
+    users = candidates[has_relevant]
+
+    models, fit_seconds = {}, {}
+    for name in algorithms:
+        started = time.perf_counter()
+        models[name] = factories[name](train, cutoff)
+        fit_seconds[name] = time.perf_counter() - started
+    _shared.update(models=models, train=train, test=test, k=k, exclude_seen=exclude_seen)
+
+    tasks = [(name, users[start:start + block]) for name in algorithms
+             for start in range(0, len(users), block)]
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            results = pool.map(_evaluate_block, tasks)
+    else:
+        results = [_evaluate_block(task) for task in tasks]
+
+    report_algorithms, report_baselines = {}, {}
+    for name in algorithms:
+        parts = [r for r in results if r[0] == name]
+        metrics = {m: np.concatenate([p[1][m] for p in parts]) if parts else np.zeros(0)
+                   for m in ("precision", "recall", "ndcg", "map")}
+        recommended = np.unique(np.concatenate([p[2] for p in parts])) if parts else np.zeros(0)
+        batch_seconds = sum(p[3] for p in parts)
+        report = report_baselines if name in BASELINES else report_algorithms
+        report[name] = {
+            f"precision@{k}": _mean(metrics["precision"]),
+            f"recall@{k}": _mean(metrics["recall"]),
+            f"ndcg@{k}": _mean(metrics["ndcg"]),
+            f"map@{k}": _mean(metrics["map"]),
+            "coverage": round(len(recommended) / max(len(log.items), 1), 4),
+            "fit_seconds": round(fit_seconds[name], 4),
+            "batch_ms_per_user": round(batch_seconds / max(len(users), 1) * 1000, 4),
+            **_single_user_latency(models[name], users[:latency_samples], train, k, exclude_seen),
+        }
+
+    return {
+        "generated_at": datetime.now().isoformat(),
+        "k": k,
+        "dataset": {"users": len(log.users), "items": len(log.items), "interactions": len(log)},
+        "split": {
+            "cutoff": datetime.fromtimestamp(cutoff).isoformat() if len(log) else None,
+            "train_interactions": len(train),
+            "test_interactions": len(test),
+            "users_evaluated": int(len(users)),
+            "exclude_seen": exclude_seen,
+        },
+        "workers": workers,
+        "algorithms": report_algorithms,
+        "baselines": report_baselines,
+    }
+
+def _single_user_latency(model, users: np.ndarray, train: InteractionLog, k: int, exclude_seen: bool) -> dict:
+    """p50/p95 latency of ranking one user at a time (closest to a request)"""
+    timings = []
+    for user in users:
+        started = time.perf_counter()
+        scores = model.scores(np.array([user]), k)
+        if exclude_seen:
+            scores[_block_matrix(np.array([user]), train)] = -np.inf
+        rank_top_k(scores, k)
+        timings.append(time.perf_counter() - started)
+    if not timings:
+        return {"latency_p50_ms": None, "latency_p95_ms": None}
+    return {
+        "latency_p50_ms": round(float(np.percentile(timings, 50)) * 1000, 3),
+        "latency_p95_ms": round(float(np.percentile(timings, 95)) * 1000, 3),
+    }
+
+def _mean(values: np.ndarray) -> float:
+    return round(float(values.mean()), 4) if len(values) else 0.0
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--synthetic", action="store_true", help="generate a synthetic fixture")
+    source.add_argument("--export-dir", help="Parquet export directory written by exporter.py")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--events-per-user", type=int, default=40)
+    parser.add_argument("--algorithms", nargs="+", choices=list(ALGORITHMS) + list(BASELINES))
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--test-fraction", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--include-seen", action="store_true", help="rank and count items seen in training")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.synthetic:
+        log = synthetic_log(args.users, args.items, events_per_user=args.events_per_user)
+    else:
+        log = load_export(args.export_dir)
+    loaded = time.perf_counter()
+
+    report = evaluate(log, args.algorithms, args.k, args.test_fraction, args.workers, not args.include_seen)
+    report["load_seconds"] = round(loaded - started, 3)
+    report["evaluate_seconds"] = round(time.perf_counter() - loaded, 3)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f" Wrote evaluation report to {args.out}")
+    else:
+        print(text)
@@ -0,0 +1,351 @@
+"""
+Parquet Export
+Streams the activity logs, generated recommendations and event log to
+date-partitioned Parquet files for offline training
+
+Layout of an export directory:
+    <table>/date=YYYY-MM-DD/part-<mark>.parquet    rows exported by one run
+    _export_state.json                               high-water mark per table
+
+Each run exports only what was added after a table's high-water mark
+(row position for append-only logs, updated_at for ratings), in record
+batches of at most batch_rows rows. Files are named after the mark the run
+started from and the marks are saved only after every file is complete,
+so a crashed run is redone over the same file names without duplicates.
+
+Only cheap work runs on the event loop: slicing a batch of column arrays,
+or taking the next batch of keys of a record table from a cursor captured
+once per run. Reading records (and decoding snapshot chunks that were not
+loaded yet), Parquet encoding and writing happen in a worker thread, so
+request handling keeps going while an export runs.
+
+Offline, from a state directory (read-only: the app can keep running):
+    python exporter.py --state-dir state/cqrs --out exports
+In the app: set EXPORT_DIR (and EXPORT_INTERVAL_SECONDS).
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import pickle
+import time
+from itertools import islice
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from activity_store import ActivityStore, ColumnarLog, Interner
+from persistence import LazyTable
+
+STATE_FILE = "_export_state.json"
+DEFAULT_BATCH_ROWS = 65536
+
+# ============================================================================
+# SOURCES
+# ============================================================================
+
+class _StringColumn:
+    """Interner -> Arrow strings, extending a cached dictionary as the interner grows"""
+
+    def __init__(self, interner: Interner):
+        self.interner = interner
+        self.dictionary = pa.array([], pa.string())
+
+    def take(self, codes: np.ndarray) -> pa.Array:
+        known = len(self.dictionary)
+        if len(self.interner) > known:
+            self.dictionary = pa.concat_arrays([self.dictionary, pa.array(self.interner.values[known:], pa.string())])
+        return self.dictionary.take(pa.array(codes))
+
+def _uuids(column: np.ndarray) -> pa.Array:
+    return pa.FixedSizeBinaryArray.from_buffers(pa.binary(16), len(column),
+                                                [None, pa.py_buffer(np.ascontiguousarray(column))])
+
+def _micros(column: np.ndarray) -> pa.Array:
+    return pa.array(column).view(pa.timestamp("us"))
+
+class ExportSource:
+    """One exported table.
+
+    batches() runs on the event loop and only grabs a batch of rows (array
+    slices, immutable records or record keys); to_table() reads and converts
+    a batch to Arrow and runs in the worker thread.
+    """
+    name = ""
+    time_column = ""
+
+    async def batches(self, mark: int, batch_rows: int) -> AsyncIterator[Tuple[Any, int]]:
+        """Yield (batch, high-water mark after the batch)"""
+        raise NotImplementedError
+        yield
+
+    def to_table(self, batch: Any) -> pa.Table:
+        raise NotImplementedError
+
+class ColumnarSource(ExportSource):
+    """An append-only ColumnarLog of the activity store; the mark is a row position"""
+
+    def __init__(self, name: str, time_column: str, log: ColumnarLog,
+                 columns: Dict[str, Tuple[str, Callable]]):
+        self.name, self.time_column, self.log = name, time_column, log
+        self.columns = columns      # output column -> (log column, converter)
+
+    async def batches(self, mark, batch_rows):
+        end = len(self.log)
+        for start in range(mark, end, batch_rows):
+            stop = min(start + batch_rows, end)
+            yield self.log.slice(start, stop), stop
+
+    def to_table(self, batch):
+        return pa.table({name: convert(batch[column]) for name, (column, convert) in self.columns.items()})
+
+class RatingsSource(ColumnarSource):
+    """Ratings changed since the mark (an updated_at in microseconds).
+
+    Re-rated rows are exported again; dedupe on rating_id keeping the latest updated_at.
+    """
+
+    async def batches(self, mark, batch_rows):
+        c = self.log.scan(updated_at__ge=mark + 1)
+        order = np.argsort(c["updated_at"], kind="stable")
+        for start in range(0, len(order), batch_rows):
+            rows = order[start:start + batch_rows]
+            batch = {name: column[rows] for name, column in c.items()}
+            yield batch, int(batch["updated_at"][-1])
+
+class RecordsSource(ExportSource):
+    """Append-only dict table (insertion order) of flat records; the mark is a row position.
+
+    The keys past the mark are captured once per run (a LazyTable restored
+    from a snapshot hands over its still-encoded chunks instead, which are
+    decoded in the worker thread), and each batch is a (dict, keys) pair
+    whose records are looked up in the worker thread. Rows inserted during
+    the run are left for the next one.
+    """
+
+    def __init__(self, name: str, table, schema: pa.Schema, time_column: str):
+        self.name, self.table, self.schema, self.time_column = name, table, schema, time_column
+
+    async def batches(self, mark, batch_rows):
+        if isinstance(self.table, LazyTable):
+            chunks, position, keys = self.table.split_rows(mark)
+            if mark >= position:
+                chunks = []                       # exported by earlier runs
+        else:
+            chunks, position, keys = [], 0, list(islice(self.table.keys(), mark, None))
+        start = 0
+        for chunk in chunks:                      # rows of a restored snapshot not decoded yet
+            rows = await asyncio.to_thread(pickle.loads, chunk)
+            chunk_keys = list(rows)[max(mark - start, 0):]
+            first = max(mark, start)
+            for i in range(0, len(chunk_keys), batch_rows):
+                batch = chunk_keys[i:i + batch_rows]
+                yield (rows, batch), first + i + len(batch)
+            start += len(rows)
+        first = max(mark, position)
+        for i in range(0, len(keys), batch_rows):
+            batch = keys[i:i + batch_rows]
+            yield (self.table, batch), first + i + len(batch)
+
+    def to_table(self, batch: Tuple[dict, list]) -> pa.Table:
+        source, keys = batch
+        return self.rows_to_table([dict.__getitem__(source, key) for key in keys])
+
+    def rows_to_table(self, rows: List[dict]) -> pa.Table:
+        columns = {}
+        for field in self.schema:
+            values = [row.get(field.name) for row in rows]
+            if pa.types.is_timestamp(field.type):
+                columns[field.name] = pa.array(values, pa.string()).cast(field.type)
+            else:
+                columns[field.name] = pa.array(values, field.type)
+        return pa.table(columns, schema=self.schema)
+
+class EventLogSource(RecordsSource):
+    """The event log (a LazySequence of Events); event data is written as a JSON string"""
+
+    def __init__(self, event_log):
+        super().__init__("events", event_log, EVENTS_SCHEMA, "timestamp")
+
+    async def batches(self, mark, batch_rows):
+        end = len(self.table)
+        for start in range(mark, end, batch_rows):
+            events = self.table[start:min(start + batch_rows, end)]
+            yield events, start + len(events)
+
+    def to_table(self, events) -> pa.Table:
+        return self.rows_to_table([
+            {"event_id": e.event_id, "event_type": e.event_type, "timestamp": e.timestamp,
+             "data": json.dumps(e.data, default=str)}
+            for e in events
+        ])
+
+EVENTS_SCHEMA = pa.schema([
+    ("event_id", pa.string()), ("event_type", pa.string()),
+    ("timestamp", pa.timestamp("us")), ("data", pa.string()),
+])
+
+RECOMMENDATIONS_SCHEMA = pa.schema([
+    ("recommendation_id", pa.string()), ("user_id", pa.string()), ("resource_id", pa.string()),
+    ("algorithm_used", pa.string()), ("confidence_score", pa.float64()), ("reason", pa.string()),
+    ("generated_at", pa.timestamp("us")), ("position", pa.int32()),
+])
+
+# ============================================================================
+# EXPORTER
+# ============================================================================
+
+class _PartitionWriter:
+    """One open Parquet file per date partition for the current run"""
+
+    def __init__(self, directory: str, file_name: str, time_column: str):
+        self.directory = directory
+        self.file_name = file_name
+        self.time_column = time_column
+        self.writers: Dict[str, pq.ParquetWriter] = {}
+
+    def write(self, table: pa.Table):
+        dates = pc.strftime(table[self.time_column], "%Y-%m-%d")
+        for date in pc.unique(dates).to_pylist():
+            part = table.filter(pc.equal(dates, date))
+            writer = self.writers.get(date)
+            if writer is None:
+                path = os.path.join(self.directory, f"date={date}", self.file_name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                writer = self.writers[date] = pq.ParquetWriter(path + ".tmp", part.schema, compression="zstd")
+            writer.write_table(part)
+
+    def close(self):
+        for date, writer in self.writers.items():
+            writer.close()
+            path = os.path.join(self.directory, f"date={date}", self.file_name)
+            os.replace(path + ".tmp", path)
+
+    def abort(self):
+        for date, writer in self.writers.items():
+            writer.close()
+            os.remove(os.path.join(self.directory, f"date={date}", self.file_name + ".tmp"))
+
+class ParquetExporter:
+    """Incremental, date-partitioned Parquet export of a set of sources"""
+
+    def __init__(self, directory: str, sources: List[ExportSource], batch_rows: int = DEFAULT_BATCH_ROWS):
+        self.directory = directory
+        self.sources = sources
+        self.batch_rows = batch_rows
+        self._lock = asyncio.Lock()
+
+    def load_marks(self) -> Dict[str, int]:
+        path = os.path.join(self.directory, STATE_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_marks(self, marks: Dict[str, int]):
+        path = os.path.join(self.directory, STATE_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(marks, f, indent=2)
+        os.replace(path + ".tmp", path)
+
+    async def export(self) -> Dict[str, int]:
+        """Export everything past the high-water marks; returns rows written per table"""
+        async with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            marks = self.load_marks()
+            written: Dict[str, int] = {}
+            for source in self.sources:
+                mark = marks.get(source.name, 0)
+                writer = _PartitionWriter(os.path.join(self.directory, source.name),
+                                          f"part-{mark:020d}.parquet", source.time_column)
+                rows = 0
+                try:
+                    async for batch, new_mark in source.batches(mark, self.batch_rows):
+                        rows += await asyncio.to_thread(self._write_batch, writer, source, batch)
+                        marks[source.name] = new_mark
+                    await asyncio.to_thread(writer.close)
+                except BaseException:
+                    writer.abort()
+                    raise
+                written[source.name] = rows
+                self._save_marks(marks)
+            return written
+
+    @staticmethod
+    def _write_batch(writer: _PartitionWriter, source: ExportSource, batch: Any) -> int:
+        table = source.to_table(batch)
+        writer.write(table)
+        return table.num_rows
+
+    async def run_periodic(self, interval: float):
+        """Background task: export every interval seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                started = time.perf_counter()
+                written = await self.export()
+                if any(written.values()):
+                    print(f" Exported {written} in {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                print(f" Export failed: {str(e)}")
+
+def build_exporter(directory: str, store: ActivityStore, recommendations: dict, event_log,
+                   batch_rows: int = DEFAULT_BATCH_ROWS) -> ParquetExporter:
+    """Exporter for the CQRS app's activity logs, recommendations and event log"""
+    users, resources = _StringColumn(store.users), _StringColumn(store.resources)
+    return ParquetExporter(directory, [
+        ColumnarSource("activities_views", "view_timestamp", store.views, {
+            "view_id": ("view_id", _uuids), "user_id": ("user", users.take),
+            "resource_id": ("resource", resources.take), "view_timestamp": ("timestamp", _micros),
+            "view_duration_seconds": ("duration", pa.array),
+            "device_type": ("device", _StringColumn(store.devices).take),
+            "session_id": ("session", _StringColumn(store.sessions).take),
+        }),
+        ColumnarSource("activities_downloads", "download_timestamp", store.downloads, {
+            "download_id": ("download_id", _uuids), "user_id": ("user", users.take),
+            "resource_id": ("resource", resources.take), "download_timestamp": ("timestamp", _micros),
+            "file_size_downloaded": ("size", pa.array), "download_success": ("success", pa.array),
+            "ip_address": ("ip", _StringColumn(store.ips).take),
+        }),
+        RatingsSource("activities_ratings", "updated_at", store.ratings, {
+            "rating_id": ("rating_id", _uuids), "user_id": ("user", users.take),
+            "resource_id": ("resource", resources.take), "rating_value": ("rating", pa.array),
+            "review_text": ("row", lambda rows: pa.array([store.reviews.get(int(r), "") for r in rows], pa.string())),
+            "rated_at": ("rated_at", _micros), "updated_at": ("updated_at", _micros),
+        }),
+        RecordsSource("recommendations_generated", recommendations, RECOMMENDATIONS_SCHEMA, "generated_at"),
+        EventLogSource(event_log),
+    ], batch_rows)
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+async def _main(args) -> Dict[str, int]:
+    os.environ["STATE_DIR"] = args.state_dir
+    os.environ["STATE_MODE"] = "local"
+    with contextlib.redirect_stdout(io.StringIO()):
+        import cqrs_eda_implementation as app
+        await app.state_store.recover(read_only=True)
+    exporter = build_exporter(args.out, app.activity_store, app.recommendations_generated_db,
+                              app.event_bus.event_log, args.batch_rows)
+    return await exporter.export()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--state-dir", default=os.getenv("STATE_DIR"), required=not os.getenv("STATE_DIR"))
+    parser.add_argument("--out", default=os.getenv("EXPORT_DIR", "exports"))
+    parser.add_argument("--batch-rows", type=int, default=DEFAULT_BATCH_ROWS)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    written = asyncio.run(_main(args))
+    elapsed = time.perf_counter() - started
+    total = sum(written.values())
+    print(f" Exported {written} to {args.out} in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
@@ -0,0 +1,335 @@
+"""
+Collaborative Filtering Model
+Implicit-feedback ALS trained in a worker process, served from mmap'd factors
+
+Views and ratings become one implicit-feedback matrix: every (user, resource)
+pair the user interacted with has preference 1 and confidence
+1 + alpha * weight, where weight sums the same view/rating weights the
+interest profiles use. Alternating least squares (Hu, Koren & Volinsky)
+fits user and resource factors; each half-step runs a few conjugate
+gradient iterations per row, warm-started from the previous factors, so a
+step costs O(interactions * factors) instead of a factors^3 solve per row.
+
+The training arrays are assembled in a worker thread from row counts
+captured on the event loop; training runs in a separate process started
+from a forkserver (the event loop never waits for it) and writes each
+model version to its own directory:
+
+    <MODEL_DIR>/als-<version>/user_factors.npy   float32 users x factors
+                              item_factors.npy   float32 resources x factors
+                              seen_indptr.npy    CSR of each user's trained interactions
+                              seen_items.npy
+                              meta.pkl           ids, excluded resources, training stats
+
+The serving process maps the arrays read-only, builds the id lookups in a
+worker thread and then swaps one reference: requests in flight finish on
+the model they started with and no request waits for a load. A user's top-k
+is one matrix-vector product over the mapped resource factors.
+"""
+
+import asyncio
+import os
+import pickle
+import shutil
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_FACTORS = 32
+DEFAULT_ITERATIONS = 10
+DEFAULT_REGULARIZATION = 0.1
+DEFAULT_ALPHA = 10.0
+CG_STEPS = 3                      # conjugate gradient iterations per row and half-step
+BLOCK_INTERACTIONS = 1 << 16      # interactions per block (bounds temporary memory)
+KEEP_VERSIONS = 2                 # model directories kept on disk
+
+# ============================================================================
+# TRAINING (runs in the worker process)
+# ============================================================================
+
+def interaction_weights(view_durations: np.ndarray, rating_values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """view_weight / rating_weight (interest_profiles.py) over whole columns"""
+    views = 0.2 + 0.8 * np.clip(view_durations, 0, 600) / 600
+    ratings = np.maximum(rating_values.astype(np.float64) - 1, 0) / 4 * 2.0
+    return views, ratings
+
+def _csr(rows: np.ndarray, cols: np.ndarray, values: np.ndarray, n_rows: int) -> Tuple[np.ndarray, ...]:
+    """Sort (row, col, value) triples into CSR arrays"""
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n_rows + 1, np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order], values[order]
+
+def _blocks(indptr: np.ndarray):
+    """Row ranges holding about BLOCK_INTERACTIONS interactions each (at least one row)"""
+    n_rows = len(indptr) - 1
+    start = 0
+    while start < n_rows:
+        stop = int(np.searchsorted(indptr, indptr[start] + BLOCK_INTERACTIONS, side="right")) - 1
+        stop = min(max(stop, start + 1), n_rows)
+        yield start, stop
+        start = stop
+
+def _half_step(indptr: np.ndarray, cols: np.ndarray, confidence: np.ndarray,
+               fixed: np.ndarray, solution: np.ndarray, regularization: float):
+    """Update `solution` rows in place: min sum c (1 - x.y)^2 + reg |x|^2 via warm-started CG"""
+    factors = fixed.shape[1]
+    gram = fixed.T @ fixed + regularization * np.eye(factors, dtype=np.float32)
+    for start, stop in _blocks(indptr):
+        lo, hi = indptr[start], indptr[stop]
+        counts = np.diff(indptr[start:stop + 1])
+        rows = np.flatnonzero(counts)                 # rows without interactions stay at 0
+        solution[start:stop][counts == 0] = 0.0
+        if not len(rows):
+            continue
+        owner = np.repeat(np.arange(len(rows)), counts[rows])
+        cells = (owner[:, None] * factors + np.arange(factors)).ravel()
+        y = fixed[cols[lo:hi]]
+        c = confidence[lo:hi]
+
+        def row_sums(values: np.ndarray) -> np.ndarray:
+            """Sum interaction rows per block row (bincount beats add.reduceat on 2-D input)"""
+            sums = np.bincount(cells, values.ravel(), len(rows) * factors)
+            return sums.reshape(len(rows), factors).astype(np.float32)
+
+        def apply(p: np.ndarray) -> np.ndarray:
+            """(gram + Y^T (C - I) Y) p for every row of the block"""
+            inner = np.einsum("mf,mf->m", y, p[owner]) * (c - 1.0)
+            return p @ gram + row_sums(y * inner[:, None])
+
+        x = solution[start:stop][rows]
+        r = row_sums(y * c[:, None]) - apply(x)
+        p = r.copy()
+        rs_old = np.einsum("rf,rf->r", r, r)
+        for _ in range(CG_STEPS):
+            ap = apply(p)
+            denominator = np.einsum("rf,rf->r", p, ap)
+            step = np.divide(rs_old, denominator, out=np.zeros_like(rs_old), where=denominator > 1e-12)
+            x += step[:, None] * p
+            r -= step[:, None] * ap
+            rs_new = np.einsum("rf,rf->r", r, r)
+            p = r + np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 1e-12)[:, None] * p
+            rs_old = rs_new
+        solution[start + rows] = x
+
+def train_als(user: np.ndarray, item: np.ndarray, weight: np.ndarray, n_users: int, n_items: int,
+              factors: int = DEFAULT_FACTORS, iterations: int = DEFAULT_ITERATIONS,
+              regularization: float = DEFAULT_REGULARIZATION, alpha: float = DEFAULT_ALPHA,
+              seed: int = 0) -> Tuple[np.ndarray, np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """Fit float32 user and item factors to (user, item, weight) interactions.
+
+    Repeated pairs are summed; pairs whose total weight is not positive are
+    dropped. Returns (user factors, item factors, (seen indptr, seen items)).
+    """
+    pair = user.astype(np.int64) * n_items + item
+    pairs, inverse = np.unique(pair, return_inverse=True)
+    totals = np.bincount(inverse, weights=weight, minlength=len(pairs))
+    keep = totals > 0
+    pairs, totals = pairs[keep], totals[keep]
+    users, items = (pairs // n_items).astype(np.int32), (pairs % n_items).astype(np.int32)
+    confidence = (1.0 + alpha * totals).astype(np.float32)
+
+    by_user = _csr(users, items, confidence, n_users)
+    by_item = _csr(items, users, confidence, n_items)
+
+    rng = np.random.default_rng(seed)
+    user_factors = (rng.standard_normal((n_users, factors)) * 0.01).astype(np.float32)
+    item_factors = (rng.standard_normal((n_items, factors)) * 0.01).astype(np.float32)
+    for _ in range(iterations):
+        _half_step(*by_user, item_factors, user_factors, regularization)
+        _half_step(*by_item, user_factors, item_factors, regularization)
+    return user_factors, item_factors, (by_user[0], by_user[1])
+
+def train_model_version(directory: str, version: str, user: np.ndarray, item: np.ndarray,
+                        weight: np.ndarray, user_ids: List[str], resource_ids: List[str],
+                        excluded_items: np.ndarray, params: Dict[str, float]) -> dict:
+    """Process-pool entry point: train and write one model version; returns its stats"""
+    import tracemalloc
+    tracemalloc.start()
+    started = time.perf_counter()
+    user_factors, item_factors, (seen_indptr, seen_items) = train_als(
+        user, item, weight, len(user_ids), len(resource_ids), **params)
+    train_seconds = time.perf_counter() - started
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    stats = {
+        "version": version,
+        "trained_at": time.time(),
+        "users": len(user_ids),
+        "resources": len(resource_ids),
+        "interactions": int(len(seen_items)),
+        "train_seconds": round(train_seconds, 3),
+        "peak_training_bytes": int(peak_bytes),
+        "factor_bytes": int(user_factors.nbytes + item_factors.nbytes),
+        **params,
+    }
+    tmp = os.path.join(directory, f"als-{version}.tmp")
+    os.makedirs(tmp, exist_ok=True)
+    for name, array in (("user_factors", user_factors), ("item_factors", item_factors),
+                        ("seen_indptr", seen_indptr), ("seen_items", seen_items)):
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+    with open(os.path.join(tmp, "meta.pkl"), "wb") as f:
+        pickle.dump({"user_ids": user_ids, "resource_ids": resource_ids,
+                     "excluded_items": excluded_items, "stats": stats}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp, os.path.join(directory, f"als-{version}"))
+    return stats
+
+# ============================================================================
+# SERVING (mmap'd factors)
+# ============================================================================
+
+class FactorModel:
+    """One trained model version, its arrays mapped read-only"""
+
+    def __init__(self, path: str):
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+        with open(os.path.join(path, "meta.pkl"), "rb") as f:
+            meta = pickle.load(f)
+        self.path = path
+        self.user_factors = load("user_factors")
+        self.item_factors = load("item_factors")
+        self.seen_indptr = load("seen_indptr")
+        self.seen_items = load("seen_items")
+        self.resource_ids: List[str] = meta["resource_ids"]
+        self.user_rows: Dict[str, int] = {user_id: row for row, user_id in enumerate(meta["user_ids"])}
+        self.excluded = np.zeros(len(self.resource_ids), bool)
+        self.excluded[meta["excluded_items"]] = True
+        self.stats: dict = meta["stats"]
+
+    def top_k(self, user_id: str, k: int) -> Optional[List[Tuple[str, float]]]:
+        """Best k unseen resources with their predicted preference, or None for unknown users"""
+        row = self.user_rows.get(user_id)
+        if row is None or self.seen_indptr[row] == self.seen_indptr[row + 1]:
+            return None
+        scores = self.item_factors @ self.user_factors[row]
+        scores[self.excluded] = -np.inf
+        scores[self.seen_items[self.seen_indptr[row]:self.seen_indptr[row + 1]]] = -np.inf
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.resource_ids[i], float(scores[i])) for i in top]
+
+# () -> (user codes, item codes, weights, user ids, resource ids, excluded item codes)
+TrainingData = Tuple[np.ndarray, np.ndarray, np.ndarray, List[str], List[str], np.ndarray]
+
+# Called on the event loop: captures what to train on (row counts, id lists) and
+# returns the builder that assembles the arrays in a worker thread
+CollectTrainingData = Callable[[], Callable[[], TrainingData]]
+
+class CollaborativeModel:
+    """Schedules training in a worker process and hot-swaps the served FactorModel"""
+
+    def __init__(self, directory: str, collect: CollectTrainingData, factors: int = DEFAULT_FACTORS, iterations: int = DEFAULT_ITERATIONS,
+                 regularization: float = DEFAULT_REGULARIZATION, alpha: float = DEFAULT_ALPHA):
+        self.directory = directory
+        self.collect = collect
+        self.params = {"factors": factors, "iterations": iterations,
+                       "regularization": regularization, "alpha": alpha}
+        self.current: Optional[FactorModel] = None
+        self.training = False
+        self.last_error: Optional[str] = None
+        self._pool = None                                  # ProcessPoolExecutor, created on first train()
+        self._lock = asyncio.Lock()
+
+    def top_k(self, user_id: str, k: int) -> Optional[List[Tuple[str, float]]]:
+        model = self.current
+        return model.top_k(user_id, k) if model is not None else None
+
+    async def load_latest(self) -> Optional[dict]:
+        """Serve the newest model version on disk (startup)"""
+        versions = self._versions()
+        if not versions:
+            return None
+        model = await asyncio.to_thread(FactorModel, os.path.join(self.directory, versions[-1]))
+        self.current = model
+        return model.stats
+
+    def warm_up(self):
+        """Page in the mapped factors and run one dummy top-k (blocking; call in a thread)"""
+        model = self.current
+        if model is None:
+            return
+        for array in (model.user_factors, model.item_factors, model.seen_indptr, model.seen_items):
+            np.add.reduce(array, axis=None)
+        if model.user_rows:
+            model.top_k(next(iter(model.user_rows)), 10)
+
+    async def train(self) -> Optional[dict]:
+        """Train a new version on collect() in the worker process, then swap to it.
+
+        Returns the version's stats; None if a training run is already going
+        or there is nothing to train on.
+        """
+        if self._lock.locked():
+            return None
+        async with self._lock:
+            self.training = True
+            try:
+                build = self.collect()                     # cheap capture on the loop
+                user, item, weight, user_ids, resource_ids, excluded_items = await asyncio.to_thread(build)
+                if not len(user):
+                    return None
+                os.makedirs(self.directory, exist_ok=True)
+                if self._pool is None:
+                    # the process pool machinery is only imported once training starts; the
+                    # worker comes from a forkserver, never forked from this threaded process
+                    from concurrent.futures import ProcessPoolExecutor
+                    from multiprocessing import get_context
+                    self._pool = ProcessPoolExecutor(max_workers=1, mp_context=get_context("forkserver"))
+                version = f"{time.time_ns() // 1_000_000:015d}"        # sorts by training time
+                stats = await asyncio.get_running_loop().run_in_executor(
+                    self._pool, train_model_version, self.directory, version, user, item, weight,
+                    user_ids, resource_ids, excluded_items, self.params
+                )
+                model = await asyncio.to_thread(FactorModel, os.path.join(self.directory, f"als-{version}"))
+                self.current = model                       # the swap: one reference assignment
+                await asyncio.to_thread(self._prune)
+                self.last_error = None
+                return stats
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            finally:
+                self.training = False
+
+    async def run_periodic(self, interval: float):
+        """Background task: retrain every interval seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                stats = await self.train()
+                if stats:
+                    print(f" Trained collaborative model {stats['version']}: {stats['users']} users x "
+                          f"{stats['resources']} resources in {stats['train_seconds']}s")
+            except Exception as e:
+                print(f" Collaborative model training failed: {str(e)}")
+
+    def _versions(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.startswith("als-") and not name.endswith(".tmp"))
+
+    def _prune(self):
+        """Delete old versions (mapped files stay readable until unmapped)"""
+        for name in self._versions()[:-KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def summary(self) -> dict:
+        return {
+            "model": self.current.stats if self.current is not None else None,
+            "training": self.training,
+            "last_error": self.last_error,
+            "params": self.params,
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,453 @@
+"""
+Resource File Storage
+Streams multipart uploads into content-addressed local storage
+
+Uploaded bytes go straight from the request body to disk in fixed-size
+chunks and are hashed (SHA-256) on the way, so memory per upload does not
+depend on file size. Files are stored under their hash, so identical
+uploads share one copy on disk:
+
+    <UPLOAD_DIR>/objects/ab/abcdef...    stored file (name = SHA-256)
+    <UPLOAD_DIR>/tmp/<uuid>.part         upload in progress, or staged until claimed
+
+A finished upload stays staged in tmp/ until the state owner claims it:
+claim() moves it to its content address (or drops it on a dedupe hit) and
+holds the object until release(), which runs once the upload's command has
+finished, successfully or not. Every claim and release of every worker goes
+through the owner, so an object is removed exactly when no upload holds it
+and no stored-file record references it; a failed upload never removes an
+object another upload has just deduplicated against.
+
+MIME sniffing and page counting read the stored file afterwards and are
+meant to run off the request path (see analyze_file).
+
+Downloads stream the stored file back out, whole or as one HTTP byte range
+(resumable downloads, seeking in videos and PDFs), see FileDownload.
+"""
+
+import asyncio
+import hashlib
+import mimetypes
+import os
+import re
+import uuid
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+from urllib.parse import quote
+
+from fastapi import HTTPException
+from multipart.multipart import MultipartParser, parse_options_header
+from pydantic import BaseModel
+from starlette.responses import Response
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024      # bytes written per disk write
+MAX_FIELD_SIZE = 64 * 1024           # limit for plain (non-file) form fields
+ANALYZE_READ_SIZE = 1024 * 1024
+TEXT_SAMPLE_BYTES = 256 * 1024       # text read from a file for near-duplicate detection
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024    # bytes read per disk read when serving a download
+
+class StoredFile(BaseModel):
+    """A file that finished streaming into the content store"""
+    checksum: str
+    file_path: str
+    size_bytes: int
+    file_name: str
+    declared_content_type: str = ""
+    staged_path: str = ""            # fsynced upload waiting in tmp/ for ContentStore.claim
+
+# ============================================================================
+# CONTENT-ADDRESSED STORE
+# ============================================================================
+
+class ContentStore:
+    """Local directory of files named by their SHA-256"""
+
+    def __init__(self, root: str, max_upload_bytes: int):
+        self.root = root
+        self.max_upload_bytes = max_upload_bytes
+        self.leases: Dict[str, int] = {}      # checksum -> claimed uploads whose command has not finished
+
+    def object_path(self, checksum: str) -> str:
+        return os.path.join(self.root, "objects", checksum[:2], checksum)
+
+    def open_upload(self, file_name: str, content_type: str) -> "UploadWriter":
+        """Start writing a new upload"""
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        return UploadWriter(self, os.path.join(tmp_dir, f"{uuid.uuid4()}.part"), file_name, content_type)
+
+    # claim/release run in the state owner, one at a time. They only rename and
+    # unlink (the data was fsynced while staging), inline so that no other claim
+    # can run between checking for an object and removing it.
+
+    def claim(self, staged_path: str, checksum: str) -> bool:
+        """Move a staged upload to its content address and hold the object until release().
+
+        Returns False when identical content was already stored (the staged copy is dropped).
+        """
+        self.leases[checksum] = self.leases.get(checksum, 0) + 1
+        path = self.object_path(checksum)
+        if os.path.exists(path):
+            os.remove(staged_path)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(staged_path, path)
+        return True
+
+    def release(self, checksum: str, referenced: bool):
+        """The command of a claimed upload finished; remove the object if nothing uses it"""
+        remaining = self.leases.get(checksum, 1) - 1
+        if remaining:
+            self.leases[checksum] = remaining
+            return
+        self.leases.pop(checksum, None)
+        if referenced:
+            return
+        try:
+            os.remove(self.object_path(checksum))
+            print(f"  → Removed unreferenced upload {checksum[:12]}")
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def discard(stored: StoredFile):
+        """Drop a staged upload that was never claimed"""
+        try:
+            os.remove(stored.staged_path)
+        except FileNotFoundError:
+            pass
+
+class UploadWriter:
+    """Buffers up to one chunk, then hashes and writes it in a worker thread"""
+
+    def __init__(self, store: ContentStore, tmp_path: str, file_name: str, content_type: str):
+        self.store = store
+        self.tmp_path = tmp_path
+        self.file_name = file_name
+        self.content_type = content_type
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file = open(tmp_path, "wb")
+
+    async def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.store.max_upload_bytes:
+            self.abort()
+            raise HTTPException(status_code=413, detail="File too large")
+        self._buffer += data
+        if len(self._buffer) >= UPLOAD_CHUNK_SIZE:
+            await self._flush()
+
+    async def _flush(self):
+        chunk, self._buffer = bytes(self._buffer), bytearray()
+        await asyncio.to_thread(self._write_chunk, chunk)
+
+    def _write_chunk(self, chunk: bytes):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    async def finish(self) -> StoredFile:
+        """Flush the last chunk and stage the file for ContentStore.claim"""
+        await self._flush()
+        await asyncio.to_thread(self._seal)
+        checksum = self._hash.hexdigest()
+        return StoredFile(checksum=checksum, file_path=self.store.object_path(checksum), size_bytes=self.size,
+                          file_name=self.file_name, declared_content_type=self.content_type,
+                          staged_path=self.tmp_path)
+
+    def _seal(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+    def abort(self):
+        """Discard a partial or staged upload"""
+        if not self._file.closed:
+            self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+# ============================================================================
+# STREAMING MULTIPART PARSER
+# ============================================================================
+
+async def parse_streaming_upload(headers, stream: AsyncIterator[bytes],
+                                 store: ContentStore) -> Tuple[Dict[str, str], Optional[StoredFile]]:
+    """Parse a multipart/form-data body, streaming its file part into the store.
+
+    Returns the plain form fields and the staged file (None if the form had
+    no file part); the caller claims or discards it. Only the first file part
+    is kept, and any error removes what was written.
+    """
+    _, params = parse_options_header(headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status_code=400, detail="Expected multipart/form-data with a boundary")
+
+    fields: Dict[str, str] = {}
+    part = {"headers": {}, "name": "", "data": bytearray(), "writer": None}
+    header = {"field": b"", "value": b""}
+    pending: list = []          # file data/finish actions queued by the sync callbacks
+    writers: list = []
+
+    def on_part_begin():
+        part.update(headers={}, name="", data=bytearray(), writer=None)
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"][header["field"].lower()] = header["value"]
+        header.update(field=b"", value=b"")
+
+    def on_headers_finished():
+        _, options = parse_options_header(part["headers"].get(b"content-disposition", b""))
+        part["name"] = options.get(b"name", b"").decode("utf-8", "replace")
+        if b"filename" in options and not writers:
+            file_name = os.path.basename(options[b"filename"].decode("utf-8", "replace"))
+            content_type = part["headers"].get(b"content-type", b"").decode("latin-1")
+            part["writer"] = store.open_upload(file_name, content_type)
+            writers.append(part["writer"])
+
+    def on_part_data(data, start, end):
+        if part["writer"] is not None:
+            pending.append(("write", part["writer"], bytes(data[start:end])))
+        else:
+            part["data"] += data[start:end]
+            if len(part["data"]) > MAX_FIELD_SIZE:
+                raise HTTPException(status_code=413, detail=f"Form field {part['name']} too large")
+
+    def on_part_end():
+        if part["writer"] is not None:
+            pending.append(("finish", part["writer"], None))
+        elif part["name"]:
+            fields[part["name"]] = part["data"].decode("utf-8", "replace")
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin, "on_part_data": on_part_data, "on_part_end": on_part_end,
+        "on_header_field": on_header_field, "on_header_value": on_header_value,
+        "on_header_end": on_header_end, "on_headers_finished": on_headers_finished,
+    })
+
+    stored = None
+    try:
+        async for chunk in stream:
+            parser.write(chunk)
+            for action, writer, data in pending:
+                if action == "write":
+                    await writer.write(data)
+                else:
+                    stored = await writer.finish()
+            pending.clear()
+        parser.finalize()
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+
+    if writers and stored is None:
+        writers[0].abort()
+        raise HTTPException(status_code=400, detail="Incomplete file upload")
+    return fields, stored
+
+# ============================================================================
+# DOWNLOADS (byte ranges, streamed from disk)
+# ============================================================================
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single `Range: bytes=` request, None for the whole file.
+
+    Malformed and multi-range headers are ignored (the whole file is sent);
+    a range that starts past the end of the file raises 416.
+    """
+    match = _RANGE.match(header.strip()) if header else None
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if not first:                                      # suffix range: the last N bytes
+        start, end = size - min(int(last), size) if int(last) else size, size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    if start >= size:
+        raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+def content_disposition(file_name: str) -> str:
+    """inline Content-Disposition with an ASCII fallback and the UTF-8 name (RFC 6266)"""
+    fallback = file_name.encode("ascii", "replace").decode("ascii").replace('"', "_").replace("?", "_")
+    return f"inline; filename=\"{fallback}\"; filename*=UTF-8''{quote(file_name)}"
+
+class FileDownload(Response):
+    """Sends a stored file, or one byte range of it, in DOWNLOAD_CHUNK_SIZE reads.
+
+    The next chunk is read in a worker thread while the current one is being
+    sent, and the server's flow control keeps at most about one chunk per
+    download in memory. Servers advertising the ASGI `http.response.zerocopy`
+    extension get the file descriptor instead and sendfile() it.
+
+    `on_complete(bytes_sent, completed)` is called once the transfer ends,
+    also when the client disconnects part way.
+    """
+
+    def __init__(self, path: str, size: int, file_name: str, media_type: str, etag: str,
+                 range_header: Optional[str] = None, if_range: Optional[str] = None, head: bool = False,
+                 on_complete: Optional[Callable[[int, bool], None]] = None):
+        self.path = path
+        self.head = head
+        self.on_complete = on_complete
+        self.background = None
+        if if_range and if_range.strip() != etag:
+            range_header = None                    # file changed since the client's partial copy
+        byte_range = parse_range(range_header, size)
+        self.start, self.end = byte_range or (0, size - 1)
+        self.status_code = 206 if byte_range else 200
+        self.media_type = media_type
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": etag,
+            "Content-Disposition": content_disposition(file_name),
+            "Content-Length": str(self.end - self.start + 1),
+        }
+        if byte_range:
+            headers["Content-Range"] = f"bytes {self.start}-{self.end}/{size}"
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.head:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        sent, remaining = 0, self.end - self.start + 1
+        try:
+            with open(self.path, "rb") as f:
+                if "http.response.zerocopy" in scope.get("extensions", {}):
+                    await send({"type": "http.response.zerocopy", "file": f, "offset": self.start,
+                                "count": remaining, "more_body": False})
+                    sent, remaining = remaining, 0
+                else:
+                    sent, remaining = await _send_chunks(f.fileno(), self.start, remaining, send, disconnected)
+        finally:
+            disconnected.cancel()
+            if self.on_complete is not None:
+                self.on_complete(sent, remaining == 0)
+
+async def _send_chunks(fd: int, offset: int, count: int, send, disconnected: asyncio.Future) -> Tuple[int, int]:
+    """Send `count` bytes from `offset`, reading one chunk ahead; returns (bytes sent, bytes left)"""
+    loop = asyncio.get_running_loop()
+    sent = 0
+    read = loop.run_in_executor(None, os.pread, fd, min(DOWNLOAD_CHUNK_SIZE, count), offset) if count else None
+    try:
+        while read is not None:
+            chunk, read = await read, None
+            if not chunk or disconnected.done():      # file shorter than recorded, or client gone
+                break
+            count -= len(chunk)
+            offset += len(chunk)
+            if count > 0:
+                read = loop.run_in_executor(None, os.pread, fd, min(DOWNLOAD_CHUNK_SIZE, count), offset)
+            await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+            sent += len(chunk)
+    finally:
+        if read is not None and not read.done():
+            await asyncio.wait([read])                  # the file is closed once we return
+    if (count > 0 or not sent) and not disconnected.done():
+        await send({"type": "http.response.body", "body": b""})
+    return sent, count
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+# ============================================================================
+# CONTENT ANALYSIS (run in a worker thread)
+# ============================================================================
+
+_MAGIC = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"\x1aE\xdf\xa3", "video/webm"),
+    (b"OggS", "audio/ogg"),
+    (b"ID3", "audio/mpeg"),
+    (b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage"),
+]
+
+_ZIP_TYPES = {
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".pptx": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+_PDF_PAGE = re.compile(rb"/Type\s*/Page(?![a-zA-Z])")
+_PDF_COUNT = re.compile(rb"/Count\s+(\d+)")
+
+def sniff_mime_type(head: bytes, file_name: str) -> str:
+    """Detect a MIME type from the first bytes of a file"""
+    guessed = mimetypes.guess_type(file_name)[0]
+    for magic, mime in _MAGIC:
+        if head.startswith(magic):
+            if mime == "application/x-ole-storage":
+                return guessed or "application/msword"
+            return mime
+    if head.startswith(b"PK\x03\x04"):
+        return _ZIP_TYPES.get(os.path.splitext(file_name)[1].lower(), "application/zip")
+    if head[4:8] == b"ftyp":
+        return "video/quicktime" if head[8:10] == b"qt" else "video/mp4"
+    if head[:4] == b"RIFF":
+        return {b"WAVE": "audio/wav", b"AVI ": "video/x-msvideo", b"WEBP": "image/webp"}.get(
+            head[8:12], "application/octet-stream")
+    try:
+        head.decode("utf-8")
+        return guessed if guessed and guessed.startswith("text/") else "text/plain"
+    except UnicodeDecodeError:
+        return guessed or "application/octet-stream"
+
+def count_pdf_pages(path: str) -> Optional[int]:
+    """Count PDF pages by scanning page objects chunk by chunk (constant memory).
+
+    Falls back to the largest /Count of a page tree when pages sit inside
+    compressed object streams.
+    """
+    pages, max_count, carry = 0, 0, b""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(ANALYZE_READ_SIZE)
+            if not block:
+                break
+            data = carry + block
+            # Only count matches that start before the carried-over tail
+            cut = max(len(data) - 64, 0)
+            pages += sum(1 for m in _PDF_PAGE.finditer(data) if m.start() < cut)
+            max_count = max([max_count] + [int(m.group(1)) for m in _PDF_COUNT.finditer(data) if m.start() < cut])
+            carry = data[cut:]
+    pages += len(_PDF_PAGE.findall(carry))
+    max_count = max([max_count] + [int(c) for c in _PDF_COUNT.findall(carry)])
+    return pages or max_count or None
+
+def analyze_file(path: str, file_name: str) -> Dict[str, Optional[object]]:
+    """Sniff the MIME type and count pages of a stored file"""
+    with open(path, "rb") as f:
+        head = f.read(512)
+    mime_type = sniff_mime_type(head, file_name)
+    page_count = count_pdf_pages(path) if mime_type == "application/pdf" else None
+    return {"mime_type": mime_type, "page_count": page_count}
+
+def read_text_sample(path: str, file_name: str, max_bytes: int = TEXT_SAMPLE_BYTES) -> str:
+    """Start of a text file's content, or "" for binary formats"""
+    with open(path, "rb") as f:
+        data = f.read(max_bytes)
+    if not sniff_mime_type(data[:512], file_name).startswith("text/"):
+        return ""
+    return data.decode("utf-8", errors="ignore")
@@ -0,0 +1,102 @@
+"""
+Idempotency Keys
+Suppresses duplicate commands sent by retrying clients
+
+A client sends the same `Idempotency-Key` header on every retry of one
+logical request. The first request runs the command; retries get the stored
+CommandResult back without touching any table or publishing any event.
+Retries that arrive while the first request is still running wait for it.
+"""
+
+import asyncio
+import functools
+import hashlib
+import inspect
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+class IdempotencyCache:
+    """Bounded TTL cache of completed and in-flight command results"""
+
+    def __init__(self, max_entries: int = 100_000, ttl_seconds: float = 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires_at, fingerprint, result); insertion order == expiry order
+        self._completed: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self.stats = {"executed": 0, "replayed": 0, "waited": 0, "conflicts": 0}
+
+    async def run(self, key: str, fingerprint: str, execute: Callable[[], Awaitable[Any]]) -> Any:
+        """Execute once per key; return the stored result for duplicates"""
+        self._expire()
+
+        entry = self._completed.get(key)
+        if entry is not None:
+            self._check_fingerprint(entry[1], fingerprint)
+            self.stats["replayed"] += 1
+            return entry[2]
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self._check_fingerprint(in_flight[0], fingerprint)
+            self.stats["waited"] += 1
+            return await asyncio.shield(in_flight[1])
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = (fingerprint, future)
+        try:
+            result = await execute()
+        except BaseException as e:
+            # Failures are not stored: the client may retry with the same key
+            future.set_exception(e)
+            raise
+        finally:
+            del self._in_flight[key]
+
+        self.stats["executed"] += 1
+        self._completed[key] = (time.monotonic() + self.ttl_seconds, fingerprint, result)
+        while len(self._completed) > self.max_entries:
+            self._completed.popitem(last=False)
+        future.set_result(result)
+        return result
+
+    def idempotent(self, handle: Callable) -> Callable:
+        """Decorator: accept an `idempotency_key` keyword on a command handler"""
+        command_name = list(inspect.signature(handle).parameters.values())[0].annotation.__name__
+
+        @functools.wraps(handle)
+        async def wrapper(command, *args, idempotency_key: Optional[str] = None, **kwargs):
+            if not idempotency_key:
+                return await handle(command, *args, **kwargs)
+            return await self.run(
+                f"{command_name}:{idempotency_key}",
+                fingerprint(command),
+                lambda: handle(command, *args, **kwargs)
+            )
+
+        return wrapper
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._completed:
+            key, (expires_at, _, _) = next(iter(self._completed.items()))
+            if expires_at > now:
+                break
+            del self._completed[key]
+
+    def _check_fingerprint(self, stored: str, fingerprint: str):
+        if stored != fingerprint:
+            self.stats["conflicts"] += 1
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request"
+            )
+
+def fingerprint(command) -> str:
+    """Stable hash of a command's type and fields"""
+    body = f"{type(command).__name__}:{command.model_dump_json()}".encode()
+    return hashlib.sha256(body).hexdigest()
@@ -0,0 +1,249 @@
+"""
+Incremental User Interest Profiles
+Decayed per-user interest vectors over tags, resource types and difficulty
+"""
+
+import math
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Interest halves every two weeks without new activity
+DEFAULT_HALF_LIFE_SECONDS = 14 * 24 * 3600
+
+# Number of leading features tracked per group (tag/type/difficulty)
+LEADERS_PER_GROUP = 5
+
+# Rebase inflated weights once the growth exponent passes this bound
+_MAX_EXPONENT = 50.0
+
+FEATURE_GROUPS = ("tag", "type", "difficulty")
+
+# ============================================================================
+# INTERACTION WEIGHTS
+# ============================================================================
+
+def view_weight(duration_seconds: int) -> float:
+    """Weight of a view: short glances count a little, 10+ minutes counts fully"""
+    return 0.2 + 0.8 * min(max(duration_seconds, 0), 600) / 600
+
+def rating_weight(rating_value: int) -> float:
+    """Weight of a rating: 1 star adds nothing, 5 stars adds the most"""
+    return max(rating_value - 1, 0) / 4 * 2.0
+
+def feature_key(group: str, value: str) -> str:
+    """Build a vector key such as 'tag:mathematics'"""
+    return f"{group}:{value}"
+
+# ============================================================================
+# PROFILE STORE
+# ============================================================================
+
+class _Profile:
+    """Interest vector for a single user.
+
+    Weights are stored inflated by exp(rate * (t - origin)) so that adding a
+    new interaction only touches the features of that interaction; decay is
+    applied once, at read time.
+    """
+    __slots__ = ("origin", "weights", "group_totals", "leaders", "last_interaction", "event_count")
+
+    def __init__(self, origin: float):
+        self.origin = origin
+        self.weights: Dict[str, float] = {}
+        self.group_totals: Dict[str, float] = {g: 0.0 for g in FEATURE_GROUPS}
+        self.leaders: Dict[str, List[str]] = {g: [] for g in FEATURE_GROUPS}
+        self.last_interaction: Dict[str, float] = {}
+        self.event_count = 0
+
+class InterestProfileStore:
+    """Keeps every user's decayed interest vector up to date, one event at a time"""
+
+    def __init__(self, half_life_seconds: float = DEFAULT_HALF_LIFE_SECONDS):
+        self.decay_rate = math.log(2) / half_life_seconds
+        self.profiles: Dict[str, _Profile] = {}
+        self.resource_features: Dict[str, Tuple[str, ...]] = {}
+
+    def register_resource(self, resource_id: str, resource_type: str,
+                          difficulty: str, tags: Iterable[str]) -> Tuple[str, ...]:
+        """Remember which features a resource contributes to a profile"""
+        features = [feature_key("type", resource_type), feature_key("difficulty", difficulty)]
+        features.extend(feature_key("tag", t) for t in dict.fromkeys(tags))
+        self.resource_features[resource_id] = tuple(features)
+        return self.resource_features[resource_id]
+
+    def record_interaction(self, user_id: str, resource_id: str, weight: float,
+                           now: Optional[float] = None) -> Dict[str, float]:
+        """Add an interaction to the user's vector.
+
+        Cost is proportional to the number of features on the resource, not
+        to the size of the profile or the user's history. Returns the decayed
+        share of each touched feature within its group.
+        """
+        features = self.resource_features.get(resource_id)
+        if not features or weight <= 0:
+            return {}
+        now = time.time() if now is None else now
+
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            profile = self.profiles[user_id] = _Profile(now)
+        elif self.decay_rate * (now - profile.origin) > _MAX_EXPONENT:
+            self._rebase(profile, now)
+
+        inflated = weight * math.exp(self.decay_rate * (now - profile.origin))
+        for key in features:
+            group = key.split(":", 1)[0]
+            profile.weights[key] = profile.weights.get(key, 0.0) + inflated
+            profile.group_totals[group] += inflated
+            profile.last_interaction[key] = now
+            self._promote(profile, group, key)
+        profile.event_count += 1
+
+        return {key: self._share(profile, key) for key in features}
+
+    def replace_interaction(self, user_id: str, resource_id: str, previous_weight: float,
+                            previous_time: float, weight: float,
+                            now: Optional[float] = None) -> Dict[str, float]:
+        """Replace an earlier interaction's weight (e.g. a re-rating) without counting a new event.
+
+        The earlier weight is taken out as it was added at previous_time, so
+        it has decayed exactly as much as it would have in the vector; the
+        new weight is added at now. Returns the shares like record_interaction.
+        """
+        features = self.resource_features.get(resource_id)
+        if not features or (previous_weight <= 0 and weight <= 0):
+            return {}
+        now = time.time() if now is None else now
+
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            profile = self.profiles[user_id] = _Profile(now)
+        elif self.decay_rate * (now - profile.origin) > _MAX_EXPONENT:
+            self._rebase(profile, now)
+
+        removed = previous_weight * math.exp(self.decay_rate * (previous_time - profile.origin))
+        added = weight * math.exp(self.decay_rate * (now - profile.origin))
+        for key in features:
+            group = key.split(":", 1)[0]
+            old = profile.weights.get(key, 0.0)
+            new = old - removed + added
+            if new <= old * 1e-9:
+                profile.weights.pop(key, None)          # nothing left of this feature
+                new = 0.0
+            else:
+                profile.weights[key] = new
+            profile.group_totals[group] = max(profile.group_totals[group] + new - old, 0.0)
+            if added > 0:
+                profile.last_interaction[key] = now
+            if new >= old:
+                self._promote(profile, group, key)
+            else:
+                self._rank(profile, group)
+
+        return {key: self._share(profile, key) for key in features}
+
+    def get_vector(self, user_id: str, now: Optional[float] = None) -> Dict[str, float]:
+        """Return the user's decayed interest vector"""
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            return {}
+        factor = self._decay_factor(profile, now)
+        return {k: w * factor for k, w in profile.weights.items()}
+
+    def get_leaders(self, user_id: str, group: str) -> List[str]:
+        """Return the strongest feature values of a group, best first"""
+        profile = self.profiles.get(user_id)
+        if profile is None:
+            return []
+        return [k.split(":", 1)[1] for k in profile.leaders[group]]
+
+    def last_interaction(self, user_id: str, key: str) -> Optional[float]:
+        """Return when the user last touched a feature"""
+        profile = self.profiles.get(user_id)
+        return profile.last_interaction.get(key) if profile else None
+
+    def score_resource(self, user_id: str, resource_id: str) -> Tuple[float, Optional[str]]:
+        """Score a resource against the user's vector.
+
+        The score is the user's average share of interest, per group, in the
+        resource's features (0-1). Decay cancels out of a share, so the stored
+        weights are read directly. Returns the score and the strongest
+        matching feature.
+        """
+        profile = self.profiles.get(user_id)
+        features = self.resource_features.get(resource_id)
+        if profile is None or not features:
+            return 0.0, None
+
+        group_scores: Dict[str, float] = {}
+        best_key, best_share = None, 0.0
+        for key in features:
+            share = self._share(profile, key)
+            group = key.split(":", 1)[0]
+            group_scores[group] = max(group_scores.get(group, 0.0), share)
+            if share > best_share:
+                best_key, best_share = key, share
+
+        score = sum(group_scores.values()) / len(FEATURE_GROUPS)
+        return score, best_key
+
+    @staticmethod
+    def interest_level(share: float) -> str:
+        """Bucket a share into the high/medium/low levels of mapping_user_interests"""
+        if share >= 0.5:
+            return "high"
+        if share >= 0.2:
+            return "medium"
+        return "low"
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _decay_factor(self, profile: _Profile, now: Optional[float]) -> float:
+        now = time.time() if now is None else now
+        return math.exp(-self.decay_rate * (now - profile.origin))
+
+    @staticmethod
+    def _share(profile: _Profile, key: str) -> float:
+        total = profile.group_totals[key.split(":", 1)[0]]
+        return profile.weights.get(key, 0.0) / total if total > 0 else 0.0
+
+    def _rebase(self, profile: _Profile, now: float):
+        """Fold accumulated growth back into the weights (amortised, rare)"""
+        factor = self._decay_factor(profile, now)
+        for key in profile.weights:
+            profile.weights[key] *= factor
+        for group in profile.group_totals:
+            profile.group_totals[group] *= factor
+        profile.origin = now
+
+    @staticmethod
+    def _promote(profile: _Profile, group: str, key: str):
+        """Keep the per-group leaderboard ordered.
+
+        All weights decay at the same rate, so only the feature that just
+        grew can change position.
+        """
+        leaders = profile.leaders[group]
+        weights = profile.weights
+        if key not in leaders:
+            if len(leaders) < LEADERS_PER_GROUP:
+                leaders.append(key)
+            elif weights[key] > weights[leaders[-1]]:
+                leaders[-1] = key
+            else:
+                return
+        leaders.sort(key=weights.__getitem__, reverse=True)
+
+    @staticmethod
+    def _rank(profile: _Profile, group: str):
+        """Rebuild a group's leaderboard after a feature shrank (rare: re-ratings)"""
+        prefix = f"{group}:"
+        weights = profile.weights
+        keys = [k for k in weights if k.startswith(prefix)]
+        profile.leaders[group] = sorted(keys, key=weights.__getitem__, reverse=True)[:LEADERS_PER_GROUP]
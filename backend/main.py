@@ -1,10 +1,16 @@
 from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from typing import Dict, Optional
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
+import asyncio
 import os
 
+from persistence import StateStore, now_iso
+from readiness import Readiness, ReadinessGateMiddleware
+from state_owner import STATE_MODE, routed, spawn_owner
+
 #Initialization of FastAPI applicaiton (Turning the Server on)
 #  When you run this and visit http://localhost:8000/api/docs, you will see the API documentation.
 app = FastAPI(
@@ -32,7 +38,52 @@ app.add_middleware(
 # Structure: {email: user_data}
 # user_data: {id: int, name: str, email: EmailStr, password: str, created_at: datetime, updated_at: datetime}
 users_db: Dict[str, dict] = {}
-# This data disappears when the server stops/restarts. In Sprint 2 will add PostgreSQl for permanent storate
+# Until PostgreSQL lands in Sprint 2, users_db is kept in a snapshot + write-ahead log on disk
+# so it survives restarts. Every successful registration is appended to the log, and the
+# log is folded into a snapshot every SNAPSHOT_INTERVAL_SECONDS. Off unless STATE_DIR_MAIN is set.
+state_store = StateStore(
+    os.getenv("STATE_DIR_MAIN", ""),
+    snapshot_interval=float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "300")),
+    fsync=os.getenv("WAL_FSYNC", "false").lower() == "true",
+    module="main"
+)
+state_store.register_table("users", users_db)
+
+# Recovery runs after the server is up; requests wait for it (see readiness.py)
+readiness = Readiness()
+app.add_middleware(
+    ReadinessGateMiddleware,
+    readiness=readiness,
+    max_wait_seconds=float(os.getenv("READINESS_MAX_WAIT_SECONDS", "30")),
+    exempt_paths=("/", "/api/docs", "/api/redoc", "/openapi.json",
+                  "/api/health", "/api/health/live", "/api/health/ready")
+)
+
+@readiness.component("state")
+async def recover_state():
+    """Load the latest snapshot and replay registrations made after it"""
+    stats = await state_store.recover()
+    if stats:
+        app.state.snapshot_task = asyncio.create_task(state_store.run_periodic_snapshots())
+    return stats
+
+@app.on_event("startup")
+async def restore_state():
+    """Start recovery without blocking server startup"""
+    if STATE_MODE == "worker":
+        return  # users_db lives in the state owner process
+    app.state.warm_up_task = asyncio.create_task(readiness.warm_up())
+    if STATE_MODE == "owner":
+        await readiness.wait_ready()  # workers start forwarding as soon as the owner's socket is up
+
+@app.on_event("shutdown")
+async def flush_state():
+    """Flush the write-ahead log"""
+    warm_up_task = getattr(app.state, "warm_up_task", None)
+    if warm_up_task:
+        await warm_up_task
+    await state_store.wait_for_snapshot()
+    state_store.close()
 
 #Pydantic Models (Data Visualization) Blueprints or contracts for the data
 # 1. Define what the data looks like - what fields are required, what data types are allowed
@@ -93,6 +144,7 @@ async def root():
 # Monoitoring tools can ping if the server crashed 
 # Gives debugging info (how many users, is DB connected)
 @app.get("/api/health")
+@routed
 async def health_check():
     """Health check endpoint"""
     return {
@@ -102,12 +154,30 @@ async def health_check():
         "database_connected": False # Will be true when we connect to PostgresSQL
     }
 
+# Liveness: is the process up? (orchestrators restart it when this fails)
+@app.get("/api/health/live")
+async def liveness():
+    """Liveness endpoint (never waits for startup work)"""
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+# Readiness: can it take traffic? (load balancers only route to it once this returns 200)
+@app.get("/api/health/ready")
+@routed
+async def readiness_check():
+    """Readiness endpoint: per-component load state and timings, 503 until ready"""
+    report = readiness.report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
 # User Registration endpoint
 # @app.post(...): This endpoint accepts POST requests (used for creating/submitting data)
 # "/api/auth/register": The URL path
 # response_model=UserResponse: Tells FastAPI what data structure to return (and validates it)
 # status_code=status.HTTP_201_CREATED: Returns HTTP 201 (standard for "successfully created something")
+# @state_store.journaled: Records every successful registration so it can be replayed after a restart
+# @routed: With several workers, runs in the single process that owns users_db (see state_owner.py)
 @app.post("/api/auth/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+@routed
+@state_store.journaled
 async def register_user(user: UserRegister): # FastAPI automatically parses the JSON request body into a UserRegister object
     """
     Register a new user
@@ -149,7 +219,7 @@ async def register_user(user: UserRegister): # FastAPI automatically parses the
         "email": user.email,
         "password": user.password, # WARNING NO PLAIN TEXT PASSWORDS in production
         "role": user.role,
-        "created_at": datetime.now().isoformat()
+        "created_at": now_iso()
 
     }
 
@@ -171,6 +241,7 @@ async def register_user(user: UserRegister): # FastAPI automatically parses the
 # Secure Note: Notice it says "Invalid email or password" for both cases. You never want to say "Email doesn't exist" because that helps hackers figure out which emails are registered!
 
 @app.post("/api/auth/login")
+@routed
 async def login_user(credentials: UserLogin):
     """
     Login user
@@ -209,6 +280,7 @@ async def login_user(credentials: UserLogin):
 
 # Get all users (for testing - will be removed or restricted in Sprint 2)
 @app.get("/api/users")
+@routed
 async def get_users():
     """Get all registered users (for testing purposes)"""
     users_list = []
@@ -227,9 +299,20 @@ if __name__ == "__main__":
     port = int(os.getenv("API_PORT", 8000))
     host = os.getenv("API_HOST", "0.0.0.0")
     
-    uvicorn.run(
-        "main:app",
-        host=host,
-        port=port,
-        reload=True  # Auto-reload on code changes
-    )
\ No newline at end of file
+    # WEB_CONCURRENCY > 1: one process owns users_db, N workers serve HTTP on all cores
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        owner = spawn_owner("main", os.getenv("STATE_SOCKET", "/tmp/smart-study-main.sock"))
+        os.environ["STATE_MODE"] = "worker"
+        try:
+            uvicorn.run("main:app", host=host, port=port, workers=workers)
+        finally:
+            owner.terminate()
+            owner.wait()
+    else:
+        uvicorn.run(
+            "main:app",
+            host=host,
+            port=port,
+            reload=True  # Auto-reload on code changes
+        )
\ No newline at end of file
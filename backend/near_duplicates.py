@@ -0,0 +1,261 @@
+"""
+Near-Duplicate Resource Detection
+MinHash signatures over word shingles, indexed with LSH banding
+
+Each upload with enough text content is reduced to the set of its 3-word
+shingles (title, description and the start of the content); uploads
+without readable content are not compared, since shared titles say
+nothing about the files. A MinHash signature of NUM_PERM values estimates
+the Jaccard similarity of two such sets: the fraction of equal positions.
+
+The signature is cut into BANDS bands of ROWS values. Two resources become
+candidates when any band matches exactly, which happens with probability
+1 - (1 - J^ROWS)^BANDS (about 95% at J = 0.8 and 6% at J = 0.5 for the
+default 16 x 8). Candidates are then checked against the stored signature,
+so a query costs a few binary searches plus the candidates, never a scan.
+
+Band keys of all bands live in one sorted array (binary search) plus a
+small dict of recent inserts. Every MERGE_ROWS inserts that dict is frozen
+and merged into a new sorted array in a worker thread while inserts go to
+a fresh dict; the loop then swaps the arrays in, so uploads never wait for
+a merge. Without a running event loop the merge runs inline.
+Stored signatures keep the low 16 bits of each value (b-bit MinHash), which
+biases the estimate by at most 2^-16.
+"""
+
+import asyncio
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+DEFAULT_THRESHOLD = 0.8
+MIN_CONTENT_SHINGLES = 20   # content shingles needed before an upload is matched or indexed
+
+BLOCK_ROWS = 1 << 16        # signatures per storage block
+MERGE_ROWS = 1 << 13        # pending band keys before merging into the sorted arrays
+HASH_BLOCK = 4096           # shingles hashed per step (bounds temporary memory)
+
+_WORD = re.compile(r"\w+")
+_SEEDS = np.random.default_rng(20240101).integers(0, 2**63, size=(3, NUM_PERM), dtype=np.uint64)
+_PERMUTATIONS = _SEEDS[0]
+_BAND_WEIGHTS = _SEEDS[1:].reshape(BANDS, ROWS * 2)[:, :ROWS] | np.uint64(1)   # distinct per band
+_SHINGLE_PRIME = np.uint64(0x100000001B3)
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, in place on a uint64 array"""
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return x
+
+def shingle_hashes(text: str, size: int = SHINGLE_WORDS) -> np.ndarray:
+    """Distinct 64-bit hashes of the word shingles of a text"""
+    words = _WORD.findall(text.lower())
+    if not words:
+        return np.zeros(0, np.uint64)
+    vocabulary: Dict[str, int] = {}
+    hashes = np.array([vocabulary.setdefault(w, zlib.crc32(w.encode())) for w in words], np.uint64)
+    size = min(size, len(hashes))
+    count = len(hashes) - size + 1
+    shingles = hashes[:count].copy()
+    for offset in range(1, size):
+        shingles *= _SHINGLE_PRIME
+        shingles ^= hashes[offset:offset + count]
+        _mix(shingles)
+    return np.unique(shingles)
+
+def minhash(shingles: np.ndarray) -> np.ndarray:
+    """NUM_PERM-value MinHash signature (uint32) of a set of shingle hashes"""
+    signature = np.full(NUM_PERM, np.iinfo(np.uint64).max, np.uint64)
+    for start in range(0, len(shingles), HASH_BLOCK):
+        block = shingles[start:start + HASH_BLOCK, None] ^ _PERMUTATIONS
+        np.minimum(signature, _mix(block).min(axis=0), out=signature)
+    return (signature >> np.uint64(32)).astype(np.uint32)
+
+def merge_sorted(keys: np.ndarray, key_rows: np.ndarray, new_keys: List[int],
+                 new_rows: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted (keys, key_rows) with the new entries merged in; the inputs are not modified"""
+    new = np.array(new_keys, np.uint64)
+    order = np.argsort(new)
+    new = new[order]
+    # Slots of the new keys in the merged array; old keys fill the rest in order
+    slots = np.searchsorted(keys, new, side="right") + np.arange(len(new))
+    old = np.ones(len(keys) + len(new), bool)
+    old[slots] = False
+    merged = []
+    for current, added in ((keys, new), (key_rows, np.array(new_rows, np.int32)[order])):
+        column = np.empty(len(old), added.dtype)
+        column[slots] = added
+        column[old] = current
+        merged.append(column)
+    return merged[0], merged[1]
+
+# One row, or a list once a key repeats: most keys are unique, and bare ints are
+# not tracked by the garbage collector (a list per key made its full passes slow)
+Rows = Union[int, List[int]]
+
+def _add_row(table: Dict[int, Rows], key: int, row: int):
+    rows = table.get(key)
+    if rows is None:
+        table[key] = row
+    elif isinstance(rows, list):
+        rows.append(row)
+    else:
+        table[key] = [rows, row]
+
+def band_keys(signature: np.ndarray) -> np.ndarray:
+    """One 64-bit key per band of a uint32 signature (bands never share keys)"""
+    bands = signature.reshape(BANDS, ROWS).astype(np.uint64)
+    return _mix((bands * _BAND_WEIGHTS).sum(axis=1, dtype=np.uint64))
+
+class NearDuplicateIndex:
+    """LSH banding index of resource MinHash signatures"""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self.resource_ids: List[str] = []
+        self._blocks: List[np.ndarray] = []                 # (BLOCK_ROWS, NUM_PERM) uint16
+        self._keys = np.zeros(0, np.uint64)                  # sorted band keys
+        self._key_rows = np.zeros(0, np.int32)               # row of each band key
+        self._pending: Dict[int, Rows] = {}                  # band key -> rows, not merged yet
+        self._pending_keys: List[int] = []                   # same entries in insertion order
+        self._pending_key_rows: List[int] = []
+        self._merging: Dict[int, Rows] = {}                  # band key -> rows, merging in a thread
+        self._merging_keys: List[int] = []
+        self._merging_key_rows: List[int] = []
+        self._merge_task: Optional[asyncio.Task] = None
+        self._generation = 0                                 # bumped when a thread merge goes stale
+
+    def __len__(self):
+        return len(self.resource_ids)
+
+    def signature(self, *texts: str) -> Optional[np.ndarray]:
+        """Signature of the concatenated texts, or None when they have no words"""
+        shingles = shingle_hashes(" ".join(texts))
+        return minhash(shingles) if len(shingles) else None
+
+    def content_signature(self, content: str, *metadata: str) -> Optional[np.ndarray]:
+        """Signature of metadata plus content, or None when the content is too short to compare.
+
+        Titles and descriptions alone ("Lecture notes", "Week 1") are shared by
+        unrelated resources, so uploads without readable content (PDFs and
+        other binary files) are neither matched nor indexed.
+        """
+        if len(shingle_hashes(content)) < MIN_CONTENT_SHINGLES:
+            return None
+        return self.signature(*metadata, content)
+
+    def _stored(self, rows: np.ndarray) -> np.ndarray:
+        return np.stack([self._blocks[row // BLOCK_ROWS][row % BLOCK_ROWS] for row in rows])
+
+    def query(self, signature: np.ndarray, limit: int = 10) -> List[Tuple[str, float]]:
+        """Indexed resources with estimated Jaccard similarity >= threshold, most similar first"""
+        keys = band_keys(signature)
+        candidates = set()
+        his = np.searchsorted(self._keys, keys, side="right").tolist()
+        for key, lo, hi in zip(keys.tolist(), np.searchsorted(self._keys, keys).tolist(), his):
+            if lo < hi:
+                candidates.update(self._key_rows[lo:hi].tolist())
+            for pending in (self._pending, self._merging):
+                rows = pending.get(key)
+                if isinstance(rows, list):
+                    candidates.update(rows)
+                elif rows is not None:
+                    candidates.add(rows)
+        if not candidates:
+            return []
+        rows = np.fromiter(sorted(candidates), np.int64, len(candidates))
+        similarity = (self._stored(rows) == signature.astype(np.uint16)).mean(axis=1)
+        order = np.argsort(-similarity, kind="stable")
+        return [(self.resource_ids[rows[i]], round(float(similarity[i]), 4))
+                for i in order[:limit] if similarity[i] >= self.threshold]
+
+    def add(self, resource_id: str, signature: np.ndarray) -> int:
+        """Index a resource's signature; returns its row"""
+        row = len(self.resource_ids)
+        if row % BLOCK_ROWS == 0:
+            self._blocks.append(np.zeros((BLOCK_ROWS, NUM_PERM), np.uint16))
+        self._blocks[-1][row % BLOCK_ROWS] = signature.astype(np.uint16)
+        self.resource_ids.append(resource_id)
+        keys = band_keys(signature).tolist()
+        for key in keys:
+            _add_row(self._pending, key, row)
+        self._pending_keys += keys
+        self._pending_key_rows += [row] * BANDS
+        if len(self._pending_keys) >= MERGE_ROWS * BANDS and self._merge_task is None:
+            self._start_merge()
+        return row
+
+    def _start_merge(self):
+        """Freeze the pending keys and merge them in a worker thread (inline without an event loop)"""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None or self._merging_keys:               # no loop, or left over from a cancelled merge
+            self.merge()
+            return
+        self._merging, self._pending = self._pending, {}
+        self._merging_keys, self._pending_keys = self._pending_keys, []
+        self._merging_key_rows, self._pending_key_rows = self._pending_key_rows, []
+        self._merge_task = loop.create_task(self._merge_in_thread())
+
+    async def _merge_in_thread(self):
+        generation = self._generation
+        try:
+            merged = await asyncio.to_thread(merge_sorted, self._keys, self._key_rows,
+                                             self._merging_keys, self._merging_key_rows)
+        finally:
+            self._merge_task = None
+        if generation != self._generation:                   # merged inline or reloaded meanwhile
+            return
+        self._keys, self._key_rows = merged                  # the swap, between two loop steps
+        self._merging, self._merging_keys, self._merging_key_rows = {}, [], []
+        if len(self._pending_keys) >= MERGE_ROWS * BANDS:
+            self._start_merge()
+
+    def merge(self):
+        """Move pending band keys into the sorted array now (blocking)"""
+        keys = self._merging_keys + self._pending_keys
+        if not keys:
+            return
+        self._generation += 1                                # a merge still in a thread is discarded
+        self._keys, self._key_rows = merge_sorted(self._keys, self._key_rows, keys,
+                                                  self._merging_key_rows + self._pending_key_rows)
+        self._pending, self._merging = {}, {}
+        self._pending_keys, self._pending_key_rows = [], []
+        self._merging_keys, self._merging_key_rows = [], []
+
+    def nbytes(self) -> int:
+        return sum(b.nbytes for b in self._blocks) + self._keys.nbytes + self._key_rows.nbytes
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def dump(self) -> tuple:
+        filled = len(self.resource_ids) - (len(self._blocks) - 1) * BLOCK_ROWS
+        blocks = self._blocks[:-1] + [self._blocks[-1][:filled]] if self._blocks else []
+        return (self.resource_ids, blocks, self._keys, self._key_rows,
+                self._merging_keys + self._pending_keys, self._merging_key_rows + self._pending_key_rows)
+
+    def load(self, state: tuple):
+        self.resource_ids, blocks, self._keys, self._key_rows, self._pending_keys, self._pending_key_rows = state
+        self._generation += 1
+        self._merging, self._merging_keys, self._merging_key_rows = {}, [], []
+        self._pending = {}
+        for key, row in zip(self._pending_keys, self._pending_key_rows):
+            _add_row(self._pending, key, row)
+        self._blocks = list(blocks)
+        if self._blocks and len(self._blocks[-1]) < BLOCK_ROWS:
+            last = np.zeros((BLOCK_ROWS, NUM_PERM), np.uint16)
+            last[:len(self._blocks[-1])] = self._blocks[-1]
+            self._blocks[-1] = last
@@ -0,0 +1,661 @@
+"""
+Snapshot + Write-Ahead Log Persistence
+Fast restart for the in-memory stores
+
+Layout of a state directory:
+    snapshot.bin        latest consistent snapshot (binary, written atomically)
+    wal-00000042.log    commands executed since that snapshot
+
+Snapshot format (all integers little-endian):
+    MAGIC | section bytes ... | footer (pickle) | u64 footer length | MAGIC
+
+The footer lists every section by name with its byte ranges, so startup only
+maps the file and reads the footer. Small tables are decoded immediately;
+large tables and the event log are decoded chunk-by-chunk on first use.
+Array buffers inside registered state (NumPy columns) are written
+out-of-band and restored as views over the copy-on-write file mapping, so
+they are not copied or decoded at all.
+
+The WAL records each successful command together with the ids and
+timestamps it generated, so replaying the tail reproduces the exact same
+rows and events.
+
+Background snapshots rely on that: the serving process only cuts the WAL,
+and a fresh process (python persistence.py <module> <dir> <segment>)
+imports the app module, loads the previous snapshot, replays the closed
+segments and writes the new snapshot. Nothing is forked from the serving
+process, which runs threads.
+
+Read replicas (see state_owner.py) rely on it too: the state owner keeps
+the records of every command it ran in a CommandJournal, and each worker
+loads the snapshot and applies the journal entries it does not cover.
+"""
+
+import asyncio
+import functools
+import inspect
+import mmap
+import os
+import pickle
+import struct
+import subprocess
+import sys
+import time
+import uuid
+import zlib
+from bisect import bisect_right
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+SNAPSHOT_MAGIC = b"SSRSNAP1"
+SNAPSHOT_FILE = "snapshot.bin"
+CHUNK_ROWS = 65536
+EVENT_CHUNK_ROWS = 4096
+REPLAY_YIELD_EVERY = 256            # WAL commands replayed between event loop yields
+
+BUFFER_ALIGNMENT = 64
+
+_FRAME = struct.Struct("<II")       # payload length, crc32
+_FOOTER_LEN = struct.Struct("<Q")
+
+# ============================================================================
+# DETERMINISTIC IDS AND TIMESTAMPS
+# ============================================================================
+
+# Values generated by the command currently executing (live) or still to be
+# handed out (replay). Both are per-task, so concurrent requests don't mix.
+_recorded: ContextVar[Optional[list]] = ContextVar("_recorded", default=None)
+_replaying: ContextVar[Optional[Deque]] = ContextVar("_replaying", default=None)
+
+def _generate(factory: Callable[[], Any]) -> Any:
+    replay = _replaying.get()
+    if replay:
+        return replay.popleft()
+    value = factory()
+    recorded = _recorded.get()
+    if recorded is not None:
+        recorded.append(value)
+    return value
+
+def new_id() -> str:
+    """Generate a UUID string (replayed verbatim during recovery)"""
+    return _generate(lambda: str(uuid.uuid4()))
+
+def now() -> datetime:
+    """Current time (replayed verbatim during recovery)"""
+    return _generate(datetime.now)
+
+def now_iso() -> str:
+    """Current time as an ISO string (replayed verbatim during recovery)"""
+    return now().isoformat()
+
+def recorded_value(factory: Callable[[], Any]) -> Any:
+    """Any other value a command depends on but cannot recompute on replay
+    (e.g. a model's output); must be picklable"""
+    return _generate(factory)
+
+def is_replaying() -> bool:
+    """True while the WAL tail (or a replica's journal entry) is being replayed"""
+    return _replaying.get() is not None
+
+# ============================================================================
+# LAZY CONTAINERS
+# ============================================================================
+
+class LazyTable(dict):
+    """Dict that can be restored from encoded snapshot chunks without decoding them.
+
+    New rows can be inserted while chunks are still pending; any read
+    decodes every pending chunk first (older rows keep their original order).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending: List[memoryview] = []
+        self._pending_rows = 0
+
+    def attach(self, chunks: List[memoryview], rows: int):
+        """Attach encoded chunks to be decoded on first read"""
+        self._pending = list(chunks)
+        self._pending_rows = rows
+
+    @property
+    def is_materialized(self) -> bool:
+        return not self._pending
+
+    def materialize(self):
+        """Decode every pending chunk"""
+        if not self._pending:
+            return
+        newer = dict(super().items())
+        super().clear()
+        for chunk in self._pending:
+            super().update(pickle.loads(chunk))
+        super().update(newer)
+        self._pending = []
+        self._pending_rows = 0
+
+    def encoded_chunks(self) -> Iterator[bytes]:
+        """Yield the table as snapshot chunks, copying still-encoded chunks as-is"""
+        for chunk in self._pending:
+            yield chunk
+        items = iter(dict.items(self))
+        while True:
+            batch = dict(islice(items, CHUNK_ROWS))
+            if not batch:
+                return
+            yield pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def split_rows(self, skip: int = 0) -> Tuple[List[memoryview], int, list]:
+        """Rows in insertion order without decoding anything: the still-encoded
+        chunks, how many rows they hold, and the keys of the decoded rows that
+        follow them (the first `skip` rows of the table are left out of the keys)"""
+        skip = max(skip - self._pending_rows, 0)
+        wanted = dict.__len__(self) - skip
+        if wanted <= skip:                         # a short tail: walk back from the newest row
+            keys = list(islice(reversed(dict.keys(self)), max(wanted, 0)))[::-1]
+        else:
+            keys = list(islice(dict.keys(self), skip, None))
+        return list(self._pending), self._pending_rows, keys
+
+    def __len__(self):
+        return super().__len__() + self._pending_rows
+
+    def clear(self):
+        self._pending = []
+        self._pending_rows = 0
+        super().clear()
+
+def _materializing(name: str):
+    """Wrap a dict read method so pending chunks are decoded first"""
+    base = getattr(dict, name)
+
+    def method(self, *args, **kwargs):
+        self.materialize()
+        return base(self, *args, **kwargs)
+
+    method.__name__ = name
+    return method
+
+for _name in ("__getitem__", "__contains__", "__iter__", "__reversed__", "__delitem__",
+              "__eq__", "__repr__", "get", "keys", "values", "items", "pop",
+              "popitem", "setdefault", "copy"):
+    setattr(LazyTable, _name, _materializing(_name))
+
+class LazySequence:
+    """Append-only list restored from encoded snapshot chunks, decoded on access"""
+
+    def __init__(self, decode: Callable[[Any], Any] = lambda row: row,
+                 encode: Callable[[Any], Any] = lambda item: item):
+        self._decode = decode
+        self._encode = encode
+        self._chunks: List[Tuple[memoryview, int]] = []
+        self._starts: List[int] = []
+        self._frozen = 0
+        self._tail: list = []
+        self._cache: Dict[int, list] = {}
+
+    def attach(self, chunks: List[Tuple[memoryview, int]]):
+        """Attach encoded (chunk, row count) pairs"""
+        self._chunks = list(chunks)
+        self._starts, total = [], 0
+        for _, rows in self._chunks:
+            self._starts.append(total)
+            total += rows
+        self._frozen = total
+        self._cache = {}
+
+    def append(self, item):
+        self._tail.append(item)
+
+    def __len__(self):
+        return self._frozen + len(self._tail)
+
+    def _chunk(self, index: int) -> list:
+        rows = self._cache.get(index)
+        if rows is None:
+            if len(self._cache) >= 8:
+                self._cache.pop(next(iter(self._cache)))
+            rows = self._cache[index] = [self._decode(r) for r in pickle.loads(self._chunks[index][0])]
+        return rows
+
+    def _get(self, i: int):
+        if i >= self._frozen:
+            return self._tail[i - self._frozen]
+        index = bisect_right(self._starts, i) - 1
+        return self._chunk(index)[i - self._starts[index]]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._get(i) for i in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("LazySequence index out of range")
+        return self._get(key)
+
+    def __iter__(self):
+        for index in range(len(self._chunks)):
+            yield from self._chunk(index)
+        yield from self._tail
+
+    def encoded_chunks(self) -> Iterator[Tuple[bytes, int]]:
+        """Yield (chunk, row count) pairs, copying still-encoded chunks as-is"""
+        yield from self._chunks
+        tail = self._tail
+        for start in range(0, len(tail), EVENT_CHUNK_ROWS):
+            batch = [self._encode(item) for item in tail[start:start + EVENT_CHUNK_ROWS]]
+            yield pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL), len(batch)
+
+# ============================================================================
+# COMMAND JOURNAL (read replicas)
+# ============================================================================
+
+class CommandJournal:
+    """Commands executed since startup, kept in memory for read replicas.
+
+    Entries are (WAL segment, record) at increasing positions. A replica
+    subscribes first, then loads the snapshot on disk and applies the entries
+    from that snapshot's segment on. Entries are dropped once a newer snapshot
+    covers them and every subscribed replica has received them.
+    """
+
+    def __init__(self):
+        self.entries: List[Tuple[int, tuple]] = []
+        self.start = 0                                  # position of entries[0]
+        self.readers: Dict[int, int] = {}               # subscriber -> next position it needs
+        self._appended: Optional[asyncio.Event] = None
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.entries)
+
+    def append(self, segment: int, record: tuple):
+        self.entries.append((segment, record))
+        if self._appended is not None:
+            self._appended.set()
+            self._appended = None
+
+    def read(self, position: int, limit: int) -> List[Tuple[int, tuple]]:
+        offset = position - self.start
+        return self.entries[offset:offset + limit]
+
+    async def wait(self, position: int):
+        """Wait until there is an entry at position"""
+        while self.end <= position:
+            if self._appended is None:
+                self._appended = asyncio.Event()
+            await self._appended.wait()
+
+    def trim(self, first_segment: int):
+        """A snapshot now covers the segments before first_segment"""
+        keep = min(self.readers.values(), default=self.end) - self.start
+        dropped = 0
+        while dropped < keep and self.entries[dropped][0] < first_segment:
+            dropped += 1
+        del self.entries[:dropped]
+        self.start += dropped
+
+# ============================================================================
+# STATE STORE
+# ============================================================================
+
+class StateStore:
+    """Owns the snapshot file and WAL for one application's in-memory state"""
+
+    def __init__(self, directory: str, snapshot_interval: float = 300.0, fsync: bool = False,
+                 module: Optional[str] = None):
+        # "" disables persistence; a relative path is pinned to the startup directory
+        self.directory = os.path.abspath(directory) if directory else ""
+        self.module = module                               # imported by the snapshot process
+        self.snapshot_interval = snapshot_interval
+        self.fsync = fsync
+        self.enabled = bool(directory)
+
+        self._tables: Dict[str, dict] = {}
+        self._sequences: Dict[str, LazySequence] = {}
+        self._objects: Dict[str, Tuple[Callable[[], Any], Callable[[Any], None]]] = {}
+        self._commands: Dict[str, Tuple[type, Callable]] = {}
+
+        self._wal = None
+        self._wal_segment = 0
+        self._wal_records = 0
+        self._snapshot_map: Optional[mmap.mmap] = None
+        self._snapshot_process: Optional[subprocess.Popen] = None
+        self.journal: Optional[CommandJournal] = None    # set by the state owner when serving replicas
+        self.stats: Dict[str, Any] = {}
+
+    # ------------------------------------------------------------------
+    # Registration
+    # ------------------------------------------------------------------
+
+    def register_table(self, name: str, table: dict):
+        """Persist a dict table (LazyTable instances are restored lazily)"""
+        self._tables[name] = table
+
+    def register_sequence(self, name: str, sequence: LazySequence):
+        """Persist an append-only LazySequence"""
+        self._sequences[name] = sequence
+
+    def register_state(self, name: str, dump: Callable[[], Any], load: Callable[[Any], None]):
+        """Persist any other picklable state through dump/load callbacks.
+
+        Objects supporting pickle protocol 5 buffers (NumPy arrays) are
+        restored zero-copy from the snapshot mapping.
+        """
+        self._objects[name] = (dump, load)
+
+    def journaled(self, handle: Callable) -> Callable:
+        """Decorator: append each successful command to the WAL (and the replica journal).
+
+        The first annotated parameter of the handler is the command model;
+        it is stored with every id and timestamp the command generated.
+        """
+        params = list(inspect.signature(handle).parameters.values())
+        command_cls = params[0].annotation
+        name = command_cls.__name__
+        self._commands[name] = (command_cls, handle)
+
+        @functools.wraps(handle)
+        async def wrapper(command, *args, **kwargs):
+            if (self._wal is None and self.journal is None) or _recorded.get() is not None or is_replaying():
+                return await handle(command, *args, **kwargs)
+
+            token = _recorded.set([])
+            try:
+                result = await handle(command, *args, **kwargs)
+                record = (name, command.model_dump(), _recorded.get())
+                if self._wal is not None:
+                    self._append_wal(record)
+                if self.journal is not None:
+                    self.journal.append(self._wal_segment, record)
+                return result
+            finally:
+                _recorded.reset(token)
+
+        return wrapper
+
+    # ------------------------------------------------------------------
+    # Recovery
+    # ------------------------------------------------------------------
+
+    async def recover(self, read_only: bool = False) -> Dict[str, Any]:
+        """Load the latest snapshot and replay the WAL tail.
+
+        With read_only=True (offline tools running next to the app) the WAL
+        is neither truncated nor opened for writing.
+        """
+        if not self.enabled or (read_only and not os.path.isdir(self.directory)):
+            return {}
+        os.makedirs(self.directory, exist_ok=True)
+        started = time.perf_counter()
+
+        first_segment = self._load_snapshot()
+        loaded = time.perf_counter()
+
+        replayed = 0
+        segments = self._wal_segments()
+        for segment in segments:
+            if segment >= first_segment:
+                replayed += await self._replay_segment(segment, truncate=not read_only)
+        self._wal_records = replayed
+
+        self._wal_segment = max(segments + [first_segment - 1]) + 1
+        if not read_only:
+            self._open_wal()
+
+        self.stats = {
+            "snapshot_load_seconds": round(loaded - started, 4),
+            "wal_replay_seconds": round(time.perf_counter() - loaded, 4),
+            "wal_commands_replayed": replayed,
+        }
+        return self.stats
+
+    def _load_snapshot(self) -> int:
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return 0
+
+        with open(path, "rb") as f:
+            # Private mapping: arrays restored from it stay writable without touching the file
+            self._snapshot_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        view = memoryview(self._snapshot_map)
+        tail = len(SNAPSHOT_MAGIC) + _FOOTER_LEN.size
+        if view[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or view[-len(SNAPSHOT_MAGIC):] != SNAPSHOT_MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        (footer_len,) = _FOOTER_LEN.unpack(view[-tail:-len(SNAPSHOT_MAGIC)])
+        footer = pickle.loads(view[-tail - footer_len:-tail])
+
+        for name, (rows, chunks) in footer["tables"].items():
+            table = self._tables.get(name)
+            if table is None:
+                continue
+            chunk_views = [view[start:end] for start, end in chunks]
+            table.clear()
+            if isinstance(table, LazyTable):
+                table.attach(chunk_views, rows)
+            else:
+                for chunk in chunk_views:
+                    table.update(pickle.loads(chunk))
+
+        for name, chunks in footer["sequences"].items():
+            sequence = self._sequences.get(name)
+            if sequence is not None:
+                sequence.attach([(view[start:end], rows) for start, end, rows in chunks])
+
+        for name, (start, end, *buffers) in footer["objects"].items():
+            if name in self._objects:
+                buffer_views = [view[s:e] for s, e in (buffers[0] if buffers else [])]
+                self._objects[name][1](pickle.loads(view[start:end], buffers=buffer_views))
+
+        return footer["wal_segment"]
+
+    def load_base(self) -> int:
+        """Read replicas: load the latest snapshot; returns the first WAL segment it does not cover"""
+        return self._load_snapshot() if self.enabled else 0
+
+    async def apply(self, record: tuple):
+        """Re-run a recorded command with the ids and timestamps it generated"""
+        name, fields, generated = record
+        command_cls, handle = self._commands[name]
+        token = _replaying.set(deque(generated))
+        try:
+            await handle(command_cls(**fields))
+        except Exception as e:
+            print(f" Replay of {name} failed: {str(e)}")
+        finally:
+            _replaying.reset(token)
+
+    async def _replay_segment(self, segment: int, truncate: bool = True) -> int:
+        path = self._wal_path(segment)
+        replayed = 0
+        with open(path, "rb") as f:
+            data = f.read()
+
+        offset = 0
+        while offset + _FRAME.size <= len(data):
+            length, crc = _FRAME.unpack_from(data, offset)
+            payload = data[offset + _FRAME.size:offset + _FRAME.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break  # torn write at the tail
+            offset += _FRAME.size + length
+            await self.apply(pickle.loads(payload))
+            replayed += 1
+            if replayed % REPLAY_YIELD_EVERY == 0:
+                await asyncio.sleep(0)   # let liveness probes through (requests wait for readiness)
+
+        if offset < len(data) and truncate:
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+        return replayed
+
+    # ------------------------------------------------------------------
+    # WAL
+    # ------------------------------------------------------------------
+
+    def _wal_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"wal-{segment:08d}.log")
+
+    def _wal_segments(self) -> List[int]:
+        return sorted(
+            int(f[4:-4]) for f in os.listdir(self.directory)
+            if f.startswith("wal-") and f.endswith(".log")
+        )
+
+    def _open_wal(self):
+        self._wal = open(self._wal_path(self._wal_segment), "ab")
+
+    def _append_wal(self, record: tuple):
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self._wal.write(_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+        self._wal.flush()
+        if self.fsync:
+            os.fsync(self._wal.fileno())
+        self._wal_records += 1
+
+    # ------------------------------------------------------------------
+    # Snapshots
+    # ------------------------------------------------------------------
+
+    def snapshot(self, background: bool = True) -> Optional[int]:
+        """Write a consistent snapshot and start a new WAL segment.
+
+        Runs between commands on the event loop, so the cut is consistent at
+        this point. With background=True (and a module to import) the
+        snapshot is rebuilt from the previous one plus the closed WAL
+        segments in a separate process, so the event loop is not blocked.
+        Returns that process's pid, or None when written inline.
+        """
+        if not self.enabled or self._wal is None or self._snapshot_process:
+            return None
+
+        self._wal.close()
+        self._wal_segment += 1
+        first_segment = self._wal_segment
+        self._open_wal()
+        self._wal_records = 0
+
+        if background and self.module:
+            self._snapshot_process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), self.module, self.directory, str(first_segment)],
+                env=dict(os.environ, STATE_MODE="local"), cwd=os.getcwd()
+            )
+            return self._snapshot_process.pid
+
+        self._write_snapshot(first_segment)
+        self._prune_wal(first_segment)
+        return None
+
+    async def wait_for_snapshot(self) -> bool:
+        """Wait for a background snapshot to finish; prune the WAL on success"""
+        process = self._snapshot_process
+        if not process:
+            return True
+        status = await asyncio.to_thread(process.wait)
+        self._snapshot_process = None
+        if status == 0:
+            self._prune_wal(self._wal_segment)
+            if self.journal is not None:
+                self.journal.trim(self._wal_segment)
+        else:
+            print(f" Snapshot process {process.pid} failed (status {status})")
+        return status == 0
+
+    async def compact(self, first_segment: int):
+        """Snapshot process: previous snapshot + WAL segments before first_segment -> new snapshot"""
+        loaded_segment = self._load_snapshot()
+        for segment in self._wal_segments():
+            if loaded_segment <= segment < first_segment:
+                await self._replay_segment(segment, truncate=False)
+        self._write_snapshot(first_segment)
+
+    async def run_periodic_snapshots(self):
+        """Background task: snapshot every snapshot_interval seconds if anything changed"""
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if self._wal_records:
+                self.snapshot()
+                await self.wait_for_snapshot()
+
+    def close(self):
+        """Flush and close the WAL"""
+        if self._wal is not None:
+            self._wal.flush()
+            os.fsync(self._wal.fileno())
+            self._wal.close()
+            self._wal = None
+
+    def _prune_wal(self, first_segment: int):
+        for segment in self._wal_segments():
+            if segment < first_segment:
+                os.remove(self._wal_path(segment))
+
+    def _write_snapshot(self, first_segment: int):
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp_path = path + ".tmp"
+        footer = {"version": 2, "wal_segment": first_segment, "created_at": time.time(),
+                  "tables": {}, "sequences": {}, "objects": {}}
+
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+
+            def write(blob) -> Tuple[int, int]:
+                start = f.tell()
+                f.write(blob)
+                return start, f.tell()
+
+            for name, table in self._tables.items():
+                if isinstance(table, LazyTable):
+                    chunks = [write(chunk) for chunk in table.encoded_chunks()]
+                else:
+                    chunks = [write(pickle.dumps(table, protocol=pickle.HIGHEST_PROTOCOL))]
+                footer["tables"][name] = (len(table), chunks)
+
+            for name, sequence in self._sequences.items():
+                footer["sequences"][name] = [
+                    write(chunk) + (rows,) for chunk, rows in sequence.encoded_chunks()
+                ]
+
+            for name, (dump, _) in self._objects.items():
+                buffers: List[pickle.PickleBuffer] = []
+                blob = pickle.dumps(dump(), protocol=5, buffer_callback=buffers.append)
+                start, end = write(blob)
+                buffer_ranges = []
+                for buffer in buffers:
+                    f.write(b"\0" * (-f.tell() % BUFFER_ALIGNMENT))
+                    buffer_ranges.append(write(buffer.raw()))
+                footer["objects"][name] = (start, end, buffer_ranges)
+
+            encoded_footer = pickle.dumps(footer, protocol=pickle.HIGHEST_PROTOCOL)
+            f.write(encoded_footer)
+            f.write(_FOOTER_LEN.pack(len(encoded_footer)))
+            f.write(SNAPSHOT_MAGIC)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+# ============================================================================
+# SNAPSHOT PROCESS
+# ============================================================================
+
+if __name__ == "__main__":
+    import contextlib
+    import importlib
+    import io
+
+    module_name, directory, first_segment = sys.argv[1], sys.argv[2], int(sys.argv[3])
+    with contextlib.redirect_stdout(io.StringIO()):
+        # the app module's store (and its registrations), not this __main__ copy of the class
+        store = importlib.import_module(module_name).state_store
+        store.directory, store.enabled = directory, True
+        asyncio.run(store.compact(first_segment))
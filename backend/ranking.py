@@ -0,0 +1,63 @@
+"""
+Recommendation Ranking
+The ranking behind GenerateRecommendationsCommand, shared with offline evaluation
+
+1. Candidates: the collaborative model's best unseen resources when the
+   algorithm is "collaborative" and the model knows the user, otherwise
+   every resource scored against the user's interest profile. Near-
+   duplicates (resources with duplicate_of set) collapse into their
+   canonical resource. The pool holds limit * CANDIDATES_PER_SLOT.
+2. The feedback bandit re-ranks the pool and the best `limit` are kept.
+
+The handler passes the live stores; evaluation.py passes stores rebuilt
+from a training split, so every change to the served ranking is what gets
+evaluated.
+"""
+
+import heapq
+from typing import Callable, Dict, List, Optional, Tuple
+
+from bandit import RecommendationBandit, arm_key
+from interest_profiles import InterestProfileStore
+
+CANDIDATES_PER_SLOT = 3          # candidate pool = limit * this
+
+# (user_id, k) -> best unseen (resource_id, score), or None when the model does not know the user
+CollaborativeTopK = Callable[[str, int], Optional[List[Tuple[str, float]]]]
+
+Ranked = List[Tuple[str, float, Optional[str]]]   # (resource_id, score, matched profile feature)
+
+def rank_resources(user_id: str, limit: int, algorithm: str, resources: Dict[str, dict],
+                   profiles: InterestProfileStore, bandit: RecommendationBandit,
+                   collaborative_top_k: Optional[CollaborativeTopK] = None) -> Tuple[str, Ranked]:
+    """Best `limit` resources for a user, best first; returns (algorithm used, ranked)"""
+    pool = limit * CANDIDATES_PER_SLOT
+    algorithm_used = algorithm
+    ranked = None
+    if algorithm == "collaborative" and collaborative_top_k is not None:
+        ranked = collaborative_top_k(user_id, pool)
+    if algorithm == "collaborative" and ranked is None:
+        algorithm_used = "hybrid"                      # user unknown to the model
+
+    candidates = []
+    if ranked is not None:
+        for resource_id, score in ranked:
+            resource = resources.get(resource_id)
+            if resource is None or resource.get("duplicate_of"):   # marked since training
+                continue
+            arm = arm_key(resource["resource_type"], resource["difficulty_level"])
+            candidates.append((min(max(score, 0.0), 1.0), arm, (resource_id, None)))
+    else:
+        scored = []
+        for position, (resource_id, resource) in enumerate(resources.items()):
+            if resource.get("duplicate_of"):
+                continue
+            score, matched = profiles.score_resource(user_id, resource_id)
+            scored.append((score, -position, resource_id, matched))
+        for score, _, resource_id, matched in heapq.nlargest(pool, scored):    # ties keep upload order
+            resource = resources[resource_id]
+            arm = arm_key(resource["resource_type"], resource["difficulty_level"])
+            candidates.append((score, arm, (resource_id, matched)))
+
+    return algorithm_used, [(resource_id, score, matched)
+                            for _, score, _, (resource_id, matched) in bandit.rerank(candidates)[:limit]]
@@ -0,0 +1,193 @@
+"""
+Startup Readiness
+Lazy heavy imports, background warm-up and liveness/readiness reporting
+
+Importing the app only builds routes and empty stores, so uvicorn accepts
+connections right away. Everything slow runs afterwards as warm-up
+components, one after the other on the event loop: recovering state
+(snapshot + WAL), mapping model files, one dummy inference per model so the
+first real request does not pay for page faults and first-call setup.
+
+    live     the process is up and its event loop answers (never waits)
+    ready    every required component has loaded; optional ones (models
+             that have a fallback) are reported but do not hold it back
+
+While the warm-up runs, ReadinessGateMiddleware holds API requests (up to
+`max_wait_seconds`, then 503 with Retry-After) instead of letting them see
+half-recovered state; a failed required component answers 503 at once.
+Health, liveness and readiness paths are never held, and nothing is held
+when no warm-up was started (e.g. uvicorn workers whose state lives in the
+state owner).
+
+Heavy dependencies that only some requests need are imported with
+lazy_import(): the module is loaded on first attribute access. Every timed
+import lands in `import_timings`, next to the app module's own import time,
+so a dependency that makes startup slower shows up in the readiness report.
+"""
+
+import asyncio
+import importlib
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from starlette.responses import JSONResponse
+
+# module name -> seconds spent importing it (app modules at startup, lazy modules on first use)
+import_timings: Dict[str, float] = {}
+
+def record_import(name: str, started: float):
+    """Record an import that began at time.perf_counter() == started"""
+    import_timings[name] = round(time.perf_counter() - started, 4)
+
+def process_uptime() -> Optional[float]:
+    """Seconds since this process was started (Linux /proc), None elsewhere"""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        return round(time.clock_gettime(time.CLOCK_BOOTTIME) - start_ticks / os.sysconf("SC_CLK_TCK"), 3)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+# ============================================================================
+# LAZY IMPORTS
+# ============================================================================
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            started = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            record_import(self._name, started)
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+# ============================================================================
+# WARM-UP COMPONENTS
+# ============================================================================
+
+class Component:
+    """One warm-up step and its load state"""
+
+    def __init__(self, name: str, load: Callable[[], Awaitable[Optional[dict]]], required: bool):
+        self.name = name
+        self.load = load
+        self.required = required
+        self.state = "pending"              # pending -> loading -> ready | failed
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self.details: Optional[dict] = None  # whatever load() returned
+
+    def report(self) -> dict:
+        return {"state": self.state, "required": self.required, "seconds": self.seconds,
+                "error": self.error, "details": self.details}
+
+class Readiness:
+    """Registry of warm-up components (required ones first, then in registration order)"""
+
+    def __init__(self):
+        self.components: Dict[str, Component] = {}
+        self.started = False                # warm_up() was called (by the startup hook)
+        self.warm_up_seconds: Optional[float] = None
+        self._required_done: Optional[asyncio.Event] = None
+
+    def component(self, name: str, required: bool = True):
+        """Decorator: register an async loader (its return value is shown as details)"""
+        def register(load: Callable[[], Awaitable[Optional[dict]]]):
+            self.components[name] = Component(name, load, required)
+            return load
+        return register
+
+    def _event(self) -> asyncio.Event:
+        if self._required_done is None:
+            self._required_done = asyncio.Event()
+        return self._required_done
+
+    async def warm_up(self):
+        """Load every component; readiness is decided once the required ones are done"""
+        self.started = True
+        started = time.perf_counter()
+        ordered = sorted(self.components.values(), key=lambda c: not c.required)
+        for component in ordered:
+            if not component.required:
+                self._event().set()
+            component.state = "loading"
+            component_started = time.perf_counter()
+            try:
+                component.details = await component.load()
+                component.state = "ready"
+            except Exception as e:
+                component.state = "failed"
+                component.error = str(e)
+                print(f" Warm-up of {component.name} failed: {str(e)}")
+            component.seconds = round(time.perf_counter() - component_started, 4)
+        self._event().set()
+        self.warm_up_seconds = round(time.perf_counter() - started, 4)
+
+    @property
+    def is_ready(self) -> bool:
+        return all(c.state == "ready" for c in self.components.values() if c.required)
+
+    @property
+    def has_failed(self) -> bool:
+        return any(c.state == "failed" for c in self.components.values() if c.required)
+
+    async def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait until the required components are done loading; True if they all loaded"""
+        if not self.is_ready and not self.has_failed:
+            try:
+                await asyncio.wait_for(self._event().wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.is_ready
+
+    def report(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "uptime_seconds": process_uptime(),
+            "warm_up_seconds": self.warm_up_seconds,
+            "components": {name: c.report() for name, c in self.components.items()},
+            "import_seconds": dict(import_timings),
+        }
+
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+
+class ReadinessGateMiddleware:
+    """ASGI middleware holding HTTP requests until the app is ready"""
+
+    def __init__(self, app: Callable, readiness: Readiness, max_wait_seconds: float = 30.0,
+                 exempt_paths: Tuple[str, ...] = ()):
+        self.app = app
+        self.readiness = readiness
+        self.max_wait_seconds = max_wait_seconds
+        self.exempt_paths = set(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        readiness = self.readiness
+        if (scope["type"] == "http" and readiness.started and not readiness.is_ready
+                and scope["path"] not in self.exempt_paths
+                and not await readiness.wait_ready(self.max_wait_seconds)):
+            pending: List[str] = [name for name, c in readiness.components.items()
+                                  if c.required and c.state != "ready"]
+            response = JSONResponse({"detail": "Service is starting", "pending": pending}, status_code=503,
+                                    headers={"Retry-After": "5"})
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
@@ -0,0 +1,132 @@
+"""
+Query Response Cache
+Pre-serialized query responses with ETags, invalidated by events
+
+Detail queries (a resource, a user) are read far more often than they
+change. The first read of an entity assembles its record from the tables,
+serializes it once and keeps the bytes; later reads send those bytes as
+they are, with no table lookups, no pydantic validation and no JSON
+encoding. A client that sends the entry's ETag in If-None-Match gets an
+empty 304 instead.
+
+Event handlers bump an entity when they change it. Bumping drops the
+cached response, and a response assembled while its entity was being
+bumped is not stored: bumps advance one global epoch, and an entity's last
+bump epoch is only remembered while a response for it is being assembled,
+so the bookkeeping is bounded by the cache plus the requests in flight. ETags are a hash of the body, so
+they stay valid across restarts and across workers.
+
+Entries are evicted least recently used first once their bodies (plus a
+fixed per-entry overhead) exceed `max_bytes`.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:         # orjson only makes serialization faster
+    orjson = None
+
+ENTRY_OVERHEAD_BYTES = 200     # key, tuple and ETag of one entry (approximate)
+
+def dumps_json(content: Any) -> bytes:
+    """Compact UTF-8 JSON, byte-for-byte what FastAPI's JSONResponse sends"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+def etag_of(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header (weak or strong, list or *) matches an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+class ResponseCache:
+    """LRU cache of serialized query results keyed by entity, bounded in bytes"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.epoch = 0                                     # advanced by every bump
+        # entity key -> epoch of its last bump, only while a response for it is being built
+        self.versions: Dict[Hashable, int] = {}
+        self._building: Dict[Hashable, int] = {}           # entity key -> builds in flight
+        # entity key -> (etag, body); order == recency
+        self._entries: "OrderedDict[Hashable, Tuple[str, bytes]]" = OrderedDict()
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "not_modified": 0, "evictions": 0, "invalidations": 0}
+
+    def bump(self, *keys: Hashable):
+        """Mark entities as changed and drop their cached responses"""
+        for key in keys:
+            self.epoch += 1
+            if key in self._building:
+                self.versions[key] = self.epoch
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.bytes -= len(entry[1]) + ENTRY_OVERHEAD_BYTES
+                self.stats["invalidations"] += 1
+
+    async def respond(self, key: Hashable, if_none_match: Optional[str],
+                      build: Callable[[], Awaitable[Dict[str, Any]]]) -> Response:
+        """Cached `{"success": true, "data": ...}` response of an entity, or 304"""
+        entry = self._entries.get(key)
+        if entry is not None:                              # bumping removes stale entries
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            etag, body = entry
+        else:
+            self.stats["misses"] += 1
+            started = self.epoch
+            self._building[key] = self._building.get(key, 0) + 1
+            try:
+                body = dumps_json({"success": True, "data": await build()})
+            finally:
+                changed = self.versions.get(key, 0) > started
+                self._building[key] -= 1
+                if not self._building[key]:
+                    del self._building[key]
+                    self.versions.pop(key, None)
+            etag = etag_of(body)
+            if not changed:
+                self._store(key, (etag, body))
+
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            self.stats["not_modified"] += 1
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
+
+    def _store(self, key: Hashable, entry: Tuple[str, bytes]):
+        size = len(entry[1]) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old[1]) + ENTRY_OVERHEAD_BYTES
+        self._entries[key] = entry
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted[1]) + ENTRY_OVERHEAD_BYTES
+            self.stats["evictions"] += 1
+
+    def summary(self) -> dict:
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "epoch": self.epoch,
+            "tracked_versions": len(self.versions),
+            "encoder": "orjson" if orjson is not None else "json",
+        }
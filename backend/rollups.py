@@ -0,0 +1,165 @@
+"""
+Activity Rollups
+Incremental per-resource and per-user counters in time buckets
+
+Every activity event adds to one bucket per granularity (minute, hour and
+day), so no query ever reads the raw activity logs:
+
+    views           number of ResourceViewedEvents
+    view_seconds    sum of view_duration_seconds
+    downloads       number of completed downloads (ResourceDownloadedEvent.counted)
+    rating_sum      sum of rating values (re-ratings add new - old)
+    rating_count    number of distinct ratings
+
+Fine buckets are only kept for a retention window (minutes: 2 days,
+hours: 90 days by default); older ones are dropped because the coarser
+buckets already hold the same totals. Range queries read one bucket per
+step, so they cost O(buckets), never O(events).
+"""
+
+import heapq
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+METRICS = ("views", "view_seconds", "downloads", "rating_sum", "rating_count")
+
+GRANULARITIES: Dict[str, int] = {"minute": 60, "hour": 3600, "day": 86400}
+
+DEFAULT_RETENTION: Dict[str, Optional[int]] = {
+    "minute": 2 * 86400,
+    "hour": 90 * 86400,
+    "day": None,            # kept forever
+}
+
+BucketKey = Tuple[str, str, int]     # (scope, entity id, bucket start in epoch seconds)
+
+class RollupStore:
+    """Minute/hour/day counters keyed by (scope, entity, bucket start)"""
+
+    def __init__(self, retention: Optional[Dict[str, Optional[int]]] = None):
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        self.buckets: Dict[str, Dict[BucketKey, List[int]]] = {g: {} for g in GRANULARITIES}
+        # Min-heap of bucket starts per granularity, plus the keys created in each start
+        self._starts: Dict[str, List[int]] = {g: [] for g in GRANULARITIES}
+        self._keys_by_start: Dict[str, Dict[int, List[BucketKey]]] = {g: {} for g in GRANULARITIES}
+        self.latest = 0         # newest event time seen (epoch seconds)
+
+    def record(self, timestamp: float, entities: List[Tuple[str, str]], **deltas: int):
+        """Add metric deltas for each (scope, entity id) at the given time"""
+        seconds = int(timestamp)
+        values = [deltas.get(metric, 0) for metric in METRICS]
+        for granularity, step in GRANULARITIES.items():
+            start = seconds - seconds % step
+            buckets = self.buckets[granularity]
+            for scope, entity_id in entities:
+                key = (scope, entity_id, start)
+                counters = buckets.get(key)
+                if counters is None:
+                    counters = buckets[key] = [0] * len(METRICS)
+                    self._track(granularity, start, key)
+                for i, value in enumerate(values):
+                    counters[i] += value
+
+        previous, self.latest = self.latest, max(self.latest, seconds)
+        if self.latest // 3600 != previous // 3600:
+            self.downsample()      # at most once per hour of event time
+
+    def _track(self, granularity: str, start: int, key: BucketKey):
+        keys = self._keys_by_start[granularity].get(start)
+        if keys is None:
+            keys = self._keys_by_start[granularity][start] = []
+            heapq.heappush(self._starts[granularity], start)
+        keys.append(key)
+
+    def downsample(self) -> int:
+        """Drop fine buckets that fell out of their retention window; returns how many"""
+        dropped = 0
+        for granularity, retention in self.retention.items():
+            if retention is None:
+                continue
+            cutoff = self.latest - retention
+            starts = self._starts[granularity]
+            while starts and starts[0] < cutoff:
+                start = heapq.heappop(starts)
+                for key in self._keys_by_start[granularity].pop(start):
+                    del self.buckets[granularity][key]
+                    dropped += 1
+        return dropped
+
+    def oldest_retained(self, granularity: str) -> int:
+        """Earliest time (epoch seconds) still covered at this granularity"""
+        retention = self.retention[granularity]
+        return 0 if retention is None else self.latest - retention
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def series(self, scope: str, entity_id: str, start: float, end: float,
+               granularity: str = "hour") -> List[dict]:
+        """One row per bucket in [start, end) at the given granularity"""
+        step = GRANULARITIES[granularity]
+        buckets = self.buckets[granularity]
+        first = int(start) - int(start) % step
+        rows = []
+        for bucket in range(first, int(end), step):
+            counters = buckets.get((scope, entity_id, bucket))
+            if counters is not None:
+                rows.append({"bucket": bucket, **dict(zip(METRICS, counters))})
+        return rows
+
+    def totals(self, scope: str, entity_id: str, start: float, end: float) -> Dict[str, int]:
+        """Sum of every metric over [start, end).
+
+        Covers the range with the coarsest aligned buckets available (days in
+        the middle, hours and minutes at the edges). Edges are rounded out to
+        whole minutes, or to the next coarser bucket once minutes expired.
+        """
+        totals = [0] * len(METRICS)
+        t, end = int(start), int(end)
+        while t < end:
+            granularity, step = self._cover(t, end)
+            bucket = t - t % step
+            counters = self.buckets[granularity].get((scope, entity_id, bucket))
+            if counters is not None:
+                for i, value in enumerate(counters):
+                    totals[i] += value
+            t = bucket + step
+        return dict(zip(METRICS, totals))
+
+    def _cover(self, t: int, end: int) -> Tuple[str, int]:
+        """Coarsest retained bucket starting at t inside the range, else the finest retained one holding t"""
+        order = sorted(GRANULARITIES.items(), key=lambda item: item[1])
+        for granularity, step in reversed(order):
+            if t % step == 0 and t + step <= end and t >= self.oldest_retained(granularity):
+                return granularity, step
+        for granularity, step in order:
+            if t - t % step >= self.oldest_retained(granularity):
+                return granularity, step
+        return order[-1]
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def dump(self) -> tuple:
+        return self.buckets, self.latest
+
+    def load(self, state: tuple):
+        buckets, self.latest = state
+        for granularity, table in buckets.items():
+            self.buckets[granularity] = table
+            self._starts[granularity] = []
+            self._keys_by_start[granularity] = {}
+            for key in table:
+                self._track(granularity, key[2], key)
+
+_EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(value: str) -> float:
+    """Naive ISO timestamp (as stored in events) -> seconds since 1970-01-01"""
+    return (datetime.fromisoformat(value) - _EPOCH).total_seconds()
+
+def from_epoch(seconds: float) -> str:
+    """Seconds since 1970-01-01 -> naive ISO timestamp"""
+    return (_EPOCH + timedelta(seconds=seconds)).isoformat()
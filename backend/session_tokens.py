@@ -0,0 +1,80 @@
+"""
+Session Tokens
+Signed bearer tokens that identify a user without a session store
+
+Registration and login hand out a token; clients send it back as
+`Authorization: Bearer <token>`. The token carries the user id and an
+expiry, signed with HMAC-SHA256 under SESSION_SECRET:
+
+    base64url(user_id) . expiry (unix seconds) . base64url(signature)
+
+Any process holding the secret verifies a token without looking anything
+up, so every uvicorn worker authenticates requests on its own (they must
+share the secret). BearerTokenBackend plugs the check into starlette's
+AuthenticationMiddleware, which puts the user in scope["user"] for the
+admission control middleware and the routes; requests without a token stay
+anonymous, an invalid or expired token is rejected with 401.
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+from typing import Optional, Tuple
+
+from starlette.authentication import AuthCredentials, AuthenticationBackend, AuthenticationError, SimpleUser
+from starlette.requests import HTTPConnection
+from starlette.responses import JSONResponse
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+class SessionTokens:
+    """Issues and verifies signed, expiring user tokens"""
+
+    def __init__(self, secret: bytes, ttl_seconds: float = 86400.0):
+        self.secret = secret
+        self.ttl_seconds = ttl_seconds
+
+    def _sign(self, payload: str) -> str:
+        return _encode(hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).digest())
+
+    def issue(self, user_id: str, now: Optional[float] = None) -> str:
+        """Token for user_id, valid for ttl_seconds"""
+        expires = int((time.time() if now is None else now) + self.ttl_seconds)
+        payload = f"{_encode(user_id.encode())}.{expires}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def verify(self, token: str, now: Optional[float] = None) -> Optional[str]:
+        """The token's user id, or None if it is malformed, forged or expired"""
+        try:
+            encoded_user, expires, signature = token.split(".")
+            payload = f"{encoded_user}.{expires}"
+            if not hmac.compare_digest(signature, self._sign(payload)):
+                return None
+            if int(expires) < (time.time() if now is None else now):
+                return None
+            return _decode(encoded_user).decode()
+        except (ValueError, TypeError, UnicodeError):     # TypeError: non-ASCII signature
+            return None
+
+class BearerTokenBackend(AuthenticationBackend):
+    """starlette authentication backend for `Authorization: Bearer <session token>`"""
+
+    def __init__(self, tokens: SessionTokens):
+        self.tokens = tokens
+
+    async def authenticate(self, conn: HTTPConnection) -> Optional[Tuple[AuthCredentials, SimpleUser]]:
+        scheme, _, token = conn.headers.get("authorization", "").partition(" ")
+        if scheme.lower() != "bearer":
+            return None
+        user_id = self.tokens.verify(token.strip())
+        if user_id is None:
+            raise AuthenticationError("Invalid or expired session token")
+        return AuthCredentials(["authenticated"]), SimpleUser(user_id)
+
+def authentication_error(conn: HTTPConnection, exc: AuthenticationError) -> JSONResponse:
+    return JSONResponse({"detail": str(exc)}, status_code=401, headers={"WWW-Authenticate": "Bearer"})
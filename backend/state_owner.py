@@ -0,0 +1,344 @@
+"""
+Single-Owner State Process
+Lets several uvicorn workers share one copy of the in-memory stores
+
+One process (the owner) imports the app module, recovers its state and runs
+every command. Uvicorn workers do the HTTP work on every core and forward
+each command to the owner over a local Unix socket.
+
+Queries run in the workers, against a read replica: a worker subscribes to
+the owner's command journal, loads the latest snapshot and applies every
+command the snapshot does not cover, in the owner's order and with the ids
+and timestamps the owner generated (the same records as the WAL, see
+persistence.py). Query assembly, caching and JSON encoding thus scale with
+the workers; replaying commands costs every worker the write load again,
+and every replica holds a full copy of the state.
+
+A forwarded call returns the owner's journal position, and the worker waits
+until its replica has applied it: a client reads its own writes through the
+same worker. Other workers catch up as soon as the entry reaches them.
+
+    STATE_MODE=local    handlers run in-process (default, single worker)
+    STATE_MODE=owner    this process owns the state and serves the socket
+    STATE_MODE=worker   @routed handlers are forwarded to the owner, @replicated
+                        ones run on the replica (forwarded with STATE_REPLICAS=false)
+
+Run an app with N workers:
+    WEB_CONCURRENCY=4 python cqrs_eda_implementation.py
+"""
+
+import asyncio
+import functools
+import importlib
+import itertools
+import os
+import pickle
+import signal
+import struct
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+from persistence import CommandJournal, StateStore
+
+STATE_MODE = os.getenv("STATE_MODE", "local")
+DEFAULT_SOCKET = "/tmp/smart-study-state.sock"
+READ_REPLICAS = os.getenv("STATE_REPLICAS", "true").lower() == "true"
+JOURNAL_BATCH = 1024                # journal entries per frame sent to a replica
+
+_HEADER = struct.Struct("<I")
+_REPLICATE = "state_owner.replicate"   # call name that turns a connection into a journal feed
+_routes: Dict[str, Callable] = {}
+_replicated_modules = set()
+
+# ============================================================================
+# ROUTING DECORATORS
+# ============================================================================
+
+def _forwarded(func: Callable) -> Callable:
+    name = f"{func.__module__}.{func.__qualname__}"
+    _routes[name] = func
+
+    @functools.wraps(func)
+    async def forward(*args, **kwargs):
+        return await get_client().call(name, args, kwargs)
+
+    return forward
+
+def routed(func: Callable) -> Callable:
+    """Run this handler in the state owner when STATE_MODE=worker"""
+    forward = _forwarded(func)
+    return forward if STATE_MODE == "worker" else func
+
+def replicated(func: Callable) -> Callable:
+    """Run this query on the worker's read replica (in the owner when replicas are off)"""
+    forward = _forwarded(func)
+    _replicated_modules.add(func.__module__)
+    return forward if STATE_MODE == "worker" and not READ_REPLICAS else func
+
+# ============================================================================
+# FRAMING
+# ============================================================================
+
+async def _read_frame(reader: asyncio.StreamReader) -> Any:
+    header = await reader.readexactly(_HEADER.size)
+    (length,) = _HEADER.unpack(header)
+    return pickle.loads(await reader.readexactly(length))
+
+def _write_frame(writer: asyncio.StreamWriter, message: Any):
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    writer.write(_HEADER.pack(len(payload)) + payload)
+
+# ============================================================================
+# OWNER (server side)
+# ============================================================================
+
+_journal: Optional[CommandJournal] = None
+_readers = itertools.count()
+
+async def _execute(writer: asyncio.StreamWriter, call_id: int, name: str, args: tuple, kwargs: dict):
+    try:
+        result = await _routes[name](*args, **kwargs)
+        response = (call_id, "ok", result)
+    except HTTPException as e:
+        response = (call_id, "http_error", (e.status_code, e.detail, e.headers))
+    except Exception as e:
+        print(f" Error in routed handler {name}: {str(e)}")
+        response = (call_id, "error", str(e))
+    _write_frame(writer, response + (_journal.end if _journal else 0,))
+
+async def _serve_replica(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Stream the journal to one replica: everything kept so far, then each new entry"""
+    reader_id = next(_readers)
+    position = _journal.readers[reader_id] = _journal.start
+    target = _journal.end               # the replica is caught up once it has applied this
+    closed = asyncio.create_task(reader.read())
+    sent = False
+    try:
+        while True:
+            entries = _journal.read(position, JOURNAL_BATCH)
+            if entries or not sent:
+                sent = True
+                _write_frame(writer, (position, entries, target))
+                position = _journal.readers[reader_id] = position + len(entries)
+                await writer.drain()
+                continue
+            waiting = asyncio.create_task(_journal.wait(position))
+            await asyncio.wait((waiting, closed), return_when=asyncio.FIRST_COMPLETED)
+            waiting.cancel()
+            if closed.done():
+                return
+    except ConnectionError:
+        pass
+    finally:
+        del _journal.readers[reader_id]
+        closed.cancel()
+        writer.close()
+
+async def _serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    tasks = set()
+    try:
+        while True:
+            call_id, name, args, kwargs = await _read_frame(reader)
+            if name == _REPLICATE:
+                await _serve_replica(reader, writer)
+                return
+            task = asyncio.create_task(_execute(writer, call_id, name, args, kwargs))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def serve_state(module_name: str, socket_path: str):
+    """Import the app module, run its startup hooks and serve handler calls"""
+    global _journal
+    module = importlib.import_module(module_name)
+    store: StateStore = module.state_store
+    if READ_REPLICAS and module_name in _replicated_modules:
+        _journal = store.journal = CommandJournal()    # before startup: every command from here on
+    await module.app.router.startup()
+    if _journal is not None and store.stats.get("wal_commands_replayed"):
+        # Replicas load the snapshot and then read the journal: cover the replayed WAL tail first
+        store.snapshot()
+        await store.wait_for_snapshot()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = await asyncio.start_unix_server(_serve_connection, path=socket_path)
+    os.chmod(socket_path, 0o600)
+    print(f" State owner for {module_name} listening on {socket_path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        await module.app.router.shutdown()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def spawn_owner(module_name: str, socket_path: str, timeout: float = 30.0) -> subprocess.Popen:
+    """Start the owner process and wait until its socket accepts connections"""
+    os.environ["STATE_SOCKET"] = socket_path
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    env = dict(os.environ, STATE_MODE="owner")
+    process = subprocess.Popen([sys.executable, os.path.abspath(__file__), module_name, socket_path],
+                               env=env, cwd=os.getcwd())
+
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(socket_path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            process.kill()
+            raise RuntimeError(f"State owner for {module_name} failed to start")
+        time.sleep(0.05)
+    return process
+
+# ============================================================================
+# WORKER (client side)
+# ============================================================================
+
+class StateClient:
+    """Multiplexed connection from one worker to the state owner"""
+
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        async with self._lock:
+            if self._writer is not None:
+                return
+            reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+            self._reader_task = asyncio.create_task(self._read_responses(reader))
+
+    async def _read_responses(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                call_id, outcome, value, position = await _read_frame(reader)
+                future = self._pending.pop(call_id, None)
+                if future is not None and not future.done():
+                    future.set_result((outcome, value, position))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"State owner disconnected: {e}"))
+            self._pending.clear()
+
+    async def call(self, name: str, args: tuple, kwargs: dict) -> Any:
+        """Run a routed handler in the owner and return its result"""
+        try:
+            if self._writer is None:
+                await self._connect()
+            call_id = next(self._ids)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[call_id] = future
+            _write_frame(self._writer, (call_id, name, args, kwargs))
+            outcome, value, position = await future
+        except (OSError, ConnectionError) as e:
+            raise HTTPException(status_code=503, detail=f"State owner unavailable: {e}")
+
+        if _replica is not None:
+            await _replica.wait_for(position)       # read-your-writes on this worker
+
+        if outcome == "ok":
+            return value
+        if outcome == "http_error":
+            status_code, detail, headers = value
+            raise HTTPException(status_code=status_code, detail=detail, headers=headers)
+        raise HTTPException(status_code=500, detail=value)
+
+_client: Optional[StateClient] = None
+
+def get_client() -> StateClient:
+    """Return this worker's connection to the owner"""
+    global _client
+    if _client is None:
+        _client = StateClient(os.getenv("STATE_SOCKET", DEFAULT_SOCKET))
+    return _client
+
+class ReadReplica:
+    """This worker's copy of the state, kept current from the owner's command journal"""
+
+    def __init__(self, store: StateStore, socket_path: str):
+        self.store = store
+        self.socket_path = socket_path
+        self.position = 0                   # journal entries applied (or skipped as covered)
+        self.base_segment = 0               # first WAL segment the loaded snapshot does not cover
+        self._applied: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> Dict[str, Any]:
+        """Subscribe, load the snapshot and catch up with the journal"""
+        started = time.perf_counter()
+        reader, self._writer = await asyncio.open_unix_connection(self.socket_path)
+        _write_frame(self._writer, (0, _REPLICATE, (), {}))
+        frame = await _read_frame(reader)
+        # Subscribed: the owner keeps every entry from here on, so any snapshot on disk will do
+        self.base_segment = self.store.load_base()
+        target = frame[2]
+        applied = await self._apply(frame)
+        while self.position < target:
+            applied += await self._apply(await _read_frame(reader))
+        self._task = asyncio.create_task(self._follow(reader))
+        return {"snapshot_segment": self.base_segment, "journal_commands_applied": applied,
+                "seconds": round(time.perf_counter() - started, 4)}
+
+    async def _apply(self, frame: tuple) -> int:
+        position, entries, _ = frame
+        applied = 0
+        for segment, record in entries:
+            if segment >= self.base_segment:
+                await self.store.apply(record)
+                applied += 1
+        self.position = position + len(entries)
+        if self._applied is not None:
+            self._applied.set()
+            self._applied = None
+        return applied
+
+    async def _follow(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                await self._apply(await _read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f" Lost the state owner's journal, replica stops at {self.position}: {e}")
+            if self._applied is not None:
+                self._applied.set()         # waiters see the stopped replica and answer 503
+
+    async def wait_for(self, position: int):
+        """Wait until the replica has applied the journal up to position"""
+        while self.position < position:
+            if self._task is None or self._task.done():
+                raise HTTPException(status_code=503, detail="Read replica is not following the state owner")
+            if self._applied is None:
+                self._applied = asyncio.Event()
+            await self._applied.wait()
+
+_replica: Optional[ReadReplica] = None
+
+async def follow_owner(store: StateStore) -> Dict[str, Any]:
+    """Worker warm-up: build this worker's read replica from the owner's snapshot and journal"""
+    global _replica
+    replica = ReadReplica(store, os.getenv("STATE_SOCKET", DEFAULT_SOCKET))
+    stats = await replica.start()
+    _replica = replica
+    return stats
+
+if __name__ == "__main__":
+    # Go through the importable module so the app registers its routes on the same instance
+    import state_owner
+    asyncio.run(state_owner.serve_state(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else DEFAULT_SOCKET))
@@ -0,0 +1,270 @@
+"""
+Study Sessions
+Streaming session windows over view events
+
+Views are grouped into study sessions by (user, session_id) as
+ResourceViewedEvents arrive. A session stays open while views keep coming;
+once it has seen no view for `gap_seconds` it is closed into compact,
+fixed-width rows:
+
+    sessions            user, session, start, end, duration (sum of view
+                        seconds), views, resources touched, device
+                        ("mixed" when several were used)
+    session_resources   user, resource, end, duration: one row per resource
+                        a session touched (per-subject totals)
+
+Open sessions live in an OrderedDict ordered by last activity, so closing
+idle ones pops from the front. At most `max_open` sessions are open; past
+that the least recently active one is closed early. Working memory is
+bounded by the number of active sessions, while history is only the
+columnar rows (about 40 bytes per session plus 24 per touched resource).
+Strings are codes in the ActivityStore's interners, which the view log has
+already filled.
+
+Time is event time: a view ends at its event timestamp and started
+view_duration_seconds earlier. Each event advances a watermark and closes
+sessions idle for longer than the gap behind it; expire() does the same
+from the clock when no events arrive. A record depends only on its views,
+never on when it was closed, so WAL replay rebuilds the same records.
+
+Progress queries scan one user's rows with NumPy and add the user's open
+sessions; no query reads the raw view log.
+"""
+
+import asyncio
+import math
+from collections import OrderedDict
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from activity_store import ActivityStore, ColumnarLog
+
+DEFAULT_GAP_SECONDS = 30 * 60
+DEFAULT_MAX_OPEN = 100_000
+MIXED_DEVICES = "mixed"
+
+SESSION_SCHEMA = {
+    "user": "i4", "session": "i4", "start": "i8", "end": "i8",
+    "duration": "i4", "views": "i4", "resources": "i4", "device": "i4",
+}
+SESSION_RESOURCE_SCHEMA = {"user": "i4", "resource": "i4", "end": "i8", "duration": "i4"}
+
+SessionKey = Tuple[str, str]     # (user_id, session_id)
+
+class OpenSession:
+    """Running totals of a session that may still get views"""
+    __slots__ = ("start", "last", "duration", "views", "device", "resources")
+
+    def __init__(self, start: int, last: int, device: str):
+        self.start = start
+        self.last = last                    # end of the latest view (epoch seconds)
+        self.duration = 0
+        self.views = 0
+        self.device = device
+        self.resources: Dict[str, int] = {}  # resource_id -> seconds
+
+class StudySessionStore:
+    """Session windows over view events, closed into columnar records"""
+
+    def __init__(self, activity: ActivityStore, gap_seconds: int = DEFAULT_GAP_SECONDS,
+                 max_open: int = DEFAULT_MAX_OPEN):
+        self.activity = activity            # interners (looked up on use: restore replaces them)
+        self.gap_seconds = gap_seconds
+        self.max_open = max_open
+        self.open: "OrderedDict[SessionKey, OpenSession]" = OrderedDict()   # order == last activity
+        self.open_by_user: Dict[str, List[str]] = {}                        # user_id -> open session ids
+        self.sessions = ColumnarLog(SESSION_SCHEMA)
+        self.session_resources = ColumnarLog(SESSION_RESOURCE_SCHEMA)
+        self.watermark = 0                  # newest view end seen (epoch seconds)
+        self.forced_closes = 0              # sessions closed early to stay within max_open
+
+    def record_view(self, user_id: str, session_id: str, resource_id: str, timestamp: float,
+                    duration_seconds: int, device: str):
+        """Add one view (timestamp = end of the view, epoch seconds)"""
+        end = int(timestamp)
+        duration = max(int(duration_seconds), 0)
+        key = (user_id, session_id)
+        session = self.open.get(key)
+        if session is not None and end - session.last > self.gap_seconds:
+            self._close(key)                 # same session id after a break: a new session
+            session = None
+        if session is None:
+            session = self.open[key] = OpenSession(end - duration, end, device)
+            self.open_by_user.setdefault(user_id, []).append(session_id)
+        else:
+            self.open.move_to_end(key)
+            session.start = min(session.start, end - duration)
+            session.last = max(session.last, end)
+            if device != session.device:
+                session.device = MIXED_DEVICES
+        session.duration += duration
+        session.views += 1
+        session.resources[resource_id] = session.resources.get(resource_id, 0) + duration
+
+        self.watermark = max(self.watermark, end)
+        self.expire(self.watermark)
+        while len(self.open) > self.max_open:
+            self._close(next(iter(self.open)))
+            self.forced_closes += 1
+
+    def expire(self, now: float) -> int:
+        """Close sessions without a view for more than the gap before `now`; returns how many"""
+        closed = 0
+        cutoff = now - self.gap_seconds
+        while self.open:
+            key, session = next(iter(self.open.items()))
+            if session.last >= cutoff:
+                break                        # the rest were active more recently
+            self._close(key)
+            closed += 1
+        return closed
+
+    def _close(self, key: SessionKey):
+        session = self.open.pop(key)
+        user_id, session_id = key
+        session_ids = self.open_by_user[user_id]
+        session_ids.remove(session_id)
+        if not session_ids:
+            del self.open_by_user[user_id]
+
+        activity = self.activity
+        user = activity.users.intern(user_id)
+        self.sessions.append(
+            user=user, session=activity.sessions.intern(session_id), start=session.start, end=session.last,
+            duration=session.duration, views=session.views, resources=len(session.resources),
+            device=activity.devices.intern(session.device)
+        )
+        for resource_id, seconds in session.resources.items():
+            self.session_resources.append(user=user, resource=activity.resources.intern(resource_id),
+                                          end=session.last, duration=seconds)
+
+    async def run_periodic(self, interval: float, clock: Callable[[], float]):
+        """Background task: close idle sessions every interval seconds (clock() = epoch seconds)"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.expire(clock())
+            except Exception as e:
+                print(f" Session expiry failed: {str(e)}")
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def _open_sessions(self, user_id: str, start: float, end: float) -> List[Tuple[str, OpenSession]]:
+        """The user's open sessions whose latest view ended in [start, end)"""
+        sessions = [(session_id, self.open[(user_id, session_id)]) for session_id in self.open_by_user.get(user_id, ())]
+        return [(session_id, session) for session_id, session in sessions if start <= session.last < end]
+
+    def recent(self, user_id: str, limit: int = 20) -> List[dict]:
+        """The user's latest sessions (open ones included), newest first"""
+        rows = []
+        for session_id, session in self._open_sessions(user_id, 0, float("inf")):
+            rows.append({"session_id": session_id, "start": session.start, "end": session.last,
+                         "duration_seconds": session.duration, "views": session.views,
+                         "resources": len(session.resources), "device": session.device, "open": True})
+        user = self.activity.users.lookup(user_id)
+        if user >= 0:
+            found = self.sessions.scan(user=user)
+            for i in np.argsort(-found["end"], kind="stable")[:limit]:
+                rows.append({
+                    "session_id": self.activity.sessions[int(found["session"][i])],
+                    "start": int(found["start"][i]), "end": int(found["end"][i]),
+                    "duration_seconds": int(found["duration"][i]), "views": int(found["views"][i]),
+                    "resources": int(found["resources"][i]),
+                    "device": self.activity.devices[int(found["device"][i])], "open": False,
+                })
+        rows.sort(key=lambda row: row["end"], reverse=True)
+        return rows[:limit]
+
+    def progress(self, user_id: str, start: float, end: float,
+                 subjects_of: Callable[[str], List[str]]) -> dict:
+        """Study totals of sessions ending in [start, end): per day, per subject and per device.
+
+        A resource's seconds count towards every subject it is tagged with.
+        """
+        by_day: Dict[int, List[int]] = {}              # day start -> [sessions, seconds]
+        by_device: Dict[str, int] = {}
+        by_resource: Dict[str, int] = {}
+        sessions = views = seconds = longest = 0
+
+        first, stop = math.ceil(start), math.ceil(end)   # whole seconds in [start, end)
+        user = self.activity.users.lookup(user_id)
+        if user >= 0:
+            found = self.sessions.scan(["end", "duration", "views", "device"],
+                                       user=user, end__ge=first, end__lt=stop)
+            sessions, views = len(found["end"]), int(found["views"].sum())
+            seconds = int(found["duration"].sum())
+            longest = int(found["duration"].max()) if sessions else 0
+            days, inverse = np.unique(found["end"] // 86400, return_inverse=True)
+            day_sessions = np.bincount(inverse, minlength=len(days))
+            day_seconds = np.bincount(inverse, weights=found["duration"], minlength=len(days))
+            for day, count, total in zip(days.tolist(), day_sessions.tolist(), day_seconds.tolist()):
+                by_day[day * 86400] = [count, int(total)]
+            devices, inverse = np.unique(found["device"], return_inverse=True)
+            for device, total in zip(devices.tolist(), np.bincount(inverse, weights=found["duration"]).tolist()):
+                by_device[self.activity.devices[device]] = int(total)
+
+            touched = self.session_resources.scan(["resource", "duration"],
+                                                  user=user, end__ge=first, end__lt=stop)
+            codes, inverse = np.unique(touched["resource"], return_inverse=True)
+            for code, total in zip(codes.tolist(), np.bincount(inverse, weights=touched["duration"]).tolist()):
+                by_resource[self.activity.resources[code]] = int(total)
+
+        open_sessions = self._open_sessions(user_id, start, end)
+        for _, session in open_sessions:
+            sessions += 1
+            views += session.views
+            seconds += session.duration
+            longest = max(longest, session.duration)
+            day = by_day.setdefault(session.last - session.last % 86400, [0, 0])
+            day[0] += 1
+            day[1] += session.duration
+            by_device[session.device] = by_device.get(session.device, 0) + session.duration
+            for resource_id, resource_seconds in session.resources.items():
+                by_resource[resource_id] = by_resource.get(resource_id, 0) + resource_seconds
+
+        by_subject: Dict[str, int] = {}
+        for resource_id, resource_seconds in by_resource.items():
+            for subject in subjects_of(resource_id) or ["untagged"]:
+                by_subject[subject] = by_subject.get(subject, 0) + resource_seconds
+
+        return {
+            "sessions": sessions,
+            "open_sessions": len(open_sessions),
+            "study_seconds": seconds,
+            "views": views,
+            "average_session_seconds": round(seconds / sessions, 1) if sessions else 0.0,
+            "longest_session_seconds": longest,
+            "resources_studied": len(by_resource),
+            "by_day": [{"day": day, "sessions": count, "study_seconds": total}
+                       for day, (count, total) in sorted(by_day.items())],
+            "by_subject": dict(sorted(by_subject.items(), key=lambda item: -item[1])),
+            "by_device": dict(sorted(by_device.items(), key=lambda item: -item[1])),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "open_sessions": len(self.open),
+            "max_open": self.max_open,
+            "gap_seconds": self.gap_seconds,
+            "closed_sessions": len(self.sessions),
+            "session_resource_rows": len(self.session_resources),
+            "forced_closes": self.forced_closes,
+            "record_bytes": self.sessions.nbytes() + self.session_resources.nbytes(),
+        }
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def dump(self) -> tuple:
+        return self.open, self.sessions, self.session_resources, self.watermark, self.forced_closes
+
+    def load(self, state: tuple):
+        self.open, self.sessions, self.session_resources, self.watermark, self.forced_closes = state
+        self.sessions.widen(SESSION_SCHEMA)            # snapshots from before device was widened
+        self.open_by_user = {}
+        for user_id, session_id in self.open:
+            self.open_by_user.setdefault(user_id, []).append(session_id)
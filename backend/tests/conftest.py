@@ -0,0 +1,59 @@
+"""
+Shared fixtures: the CQRS app with persistence off, uploads and models in a
+temporary directory, rate limits out of the way and the test client trusted
+as a proxy (X-Forwarded-For sets the client address).
+
+Every test shares the app module's in-memory state, so tests create their
+own users/resources (unique names) instead of assuming an empty store.
+"""
+
+import os
+import sys
+import tempfile
+import uuid
+
+_SCRATCH = tempfile.mkdtemp(prefix="ssr-tests-")
+os.environ.update(
+    STATE_DIR="", MODEL_DIR=os.path.join(_SCRATCH, "models"), UPLOAD_DIR=os.path.join(_SCRATCH, "uploads"),
+    RATE_LIMIT_PER_SECOND="1e9", RATE_LIMIT_BURST="1e9", ALS_TRAIN_INTERVAL_SECONDS="0",
+    TRUSTED_PROXIES="testclient",                           # the TestClient peer acts as the proxy
+)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import cqrs_eda_implementation as app_module
+
+
+@pytest.fixture
+def client():
+    with TestClient(app_module.app) as client:
+        yield client
+
+
+def unique(prefix: str) -> str:
+    return f"{prefix}-{uuid.uuid4().hex[:12]}"
+
+
+def register(client, **fields) -> str:
+    """Register a fresh user; returns its user_id"""
+    name = unique("user")
+    body = {"username": name, "email": f"{name}@example.com", "password": "x", "full_name": "Test User", **fields}
+    response = client.post("/api/cqrs/auth/register", json=body)
+    assert response.status_code == 201, response.text
+    return response.json()["data"]["user_id"]
+
+
+def upload(client, user_id: str, content: bytes = None, file_name: str = "notes.txt", **fields) -> dict:
+    """Upload a resource (with a file when content is given); returns the response data"""
+    data = {"title": unique("Resource"), "description": "test resource", "resource_type": "pdf",
+            "difficulty_level": "beginner", "uploader_user_id": user_id, **fields}
+    files = None
+    if content is not None:
+        files = {"file": (file_name, content)}
+    else:
+        data.setdefault("file_name", file_name)
+    response = client.post("/api/cqrs/resources/upload", data=data, files=files)
+    assert response.status_code == 201, response.text
+    return response.json()["data"]
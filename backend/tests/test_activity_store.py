@@ -0,0 +1,103 @@
+"""
+Columnar activity logs: chunked columns, scans, interned columns, snapshot
+round-trips and the /view endpoint with free-form device types.
+"""
+
+import pickle
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import activity_store
+from activity_store import ActivityStore, ColumnarLog
+from conftest import register, upload
+
+AT = datetime(2026, 1, 5, 12, 0, 0)
+
+
+def log_views(store: ActivityStore, devices: int):
+    for i in range(devices):
+        store.log_view(str(uuid.uuid4()), f"u{i % 7}", f"r{i % 3}", AT, 30, f"device-{i}", "s1")
+
+
+def test_rows_span_growing_chunks(monkeypatch):
+    monkeypatch.setattr(activity_store, "FIRST_CHUNK_ROWS", 4)
+    log = ColumnarLog({"value": "i8"})
+    for i in range(30):
+        log.append(value=i)
+    assert log.sizes == [4, 8, 16, 2]
+    assert log.column("value").tolist() == list(range(30))
+    assert log.slice(3, 13)["value"].tolist() == list(range(3, 13))
+    assert log.get(12)["value"] == 12
+    log.set(12, value=-1)
+    assert log.scan(value=-1)["row"].tolist() == [12]
+    assert log.scan(value__ge=20, value__lt=23)["row"].tolist() == [20, 21, 22]
+
+
+def test_scans_filter_by_user_resource_and_time():
+    store = ActivityStore()
+    for minute in range(10):
+        store.log_view(str(uuid.uuid4()), f"u{minute % 2}", "r1", AT + timedelta(minutes=minute), 30, "pc", "s")
+    hits = store.scan(store.views, user_id="u1", since=AT + timedelta(minutes=2), until=AT + timedelta(minutes=7))
+    assert hits["row"].tolist() == [3, 5]
+    assert len(store.scan(store.views, user_id="unknown")["row"]) == 0
+    assert len(store.scan(store.views, resource_id="r1")["row"]) == 10
+
+
+def test_ratings_update_in_place():
+    store = ActivityStore()
+    row = store.add_rating(str(uuid.uuid4()), "u1", "r1", 2, "meh", AT)
+    store.add_rating(str(uuid.uuid4()), "u2", "r1", 5, "", AT)
+    assert store.find_rating("u1", "r1") == row and store.find_rating("u1", "r2") is None
+    store.update_rating(row, 4, "", AT + timedelta(days=1))
+    record = store.rating_record(row)
+    assert (record["rating_value"], record["review_text"]) == (4, "")
+    assert record["updated_at"] > record["rated_at"]
+    assert store.rating_summary("r1") == (4.5, 2)
+    assert store.rating_summary("r2") == (0.0, 0)
+
+
+def test_many_distinct_devices_round_trip():
+    store = ActivityStore()
+    log_views(store, 300)
+    assert len(store.views) == 300
+    assert store.view_record(299)["device_type"] == "device-299"
+
+
+def test_snapshot_round_trip_keeps_rows():
+    store = ActivityStore()
+    log_views(store, 50)
+    store.add_rating(str(uuid.uuid4()), "u1", "r1", 4, "good", AT)
+    restored = ActivityStore()
+    restored.restore(pickle.loads(pickle.dumps(store, protocol=5)))
+    assert [restored.view_record(i) for i in range(50)] == [store.view_record(i) for i in range(50)]
+    assert restored.rating_summary("r1") == (4.0, 1)
+    restored.log_view(str(uuid.uuid4()), "u1", "r1", AT, 10, "device-new", "s2")
+    assert restored.view_record(50)["device_type"] == "device-new"
+
+
+def test_restore_widens_columns_from_older_snapshots():
+    store = ActivityStore()
+    log_views(store, 10)
+    state = store.views.__getstate__()
+    state["schema"]["device"] = "|u1"
+    state["chunks"] = [{**chunk, "device": chunk["device"].astype(np.uint8)} for chunk in state["chunks"]]
+    store.views.__setstate__(state)
+
+    restored = ActivityStore()
+    restored.restore(pickle.loads(pickle.dumps(store, protocol=5)))
+    assert restored.views.schema["device"] == np.dtype("i4")
+    log_views(restored, 300)
+    assert restored.view_record(309)["device_type"] == "device-299"
+    assert restored.view_record(3)["device_type"] == "device-3"
+
+
+def test_view_endpoint_accepts_any_number_of_devices(client):
+    user_id = register(client)
+    resource_id = upload(client, user_id)["resource_id"]
+    for i in range(300):
+        response = client.post(f"/api/cqrs/resources/{resource_id}/view", json={
+            "user_id": user_id, "resource_id": resource_id, "view_duration_seconds": 5,
+            "device_type": f"tests-device-{i}", "session_id": "devices"})
+        assert response.status_code == 200, (i, response.text)
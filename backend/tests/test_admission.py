@@ -0,0 +1,88 @@
+"""
+Health probes under overload: admission control must never rate limit or
+shed liveness/readiness checks. Rate limits key on the session-token user, else
+on the client address (from X-Forwarded-For behind a trusted proxy).
+
+Run from backend/:
+    python -m pytest -q tests
+"""
+
+from conftest import app_module, unique
+from session_tokens import SessionTokens
+
+
+def test_probes_pass_when_rate_limited(client, monkeypatch):
+    control = app_module.admission_control
+    monkeypatch.setattr(control, "ip_rate", 1e-6)
+    monkeypatch.setattr(control, "ip_burst", 1.0)
+    monkeypatch.setattr(control, "buckets", type(control.buckets)(16))
+
+    statuses = [client.get("/api/cqrs/resources").status_code for _ in range(3)]
+    assert 429 in statuses
+    for path in app_module.HEALTH_PATHS:
+        assert client.get(path).status_code == 200
+
+
+def test_probes_pass_when_shedding(client, monkeypatch):
+    limiter = app_module.admission_control.limiter
+    monkeypatch.setattr(limiter, "in_flight", limiter.max_concurrency)   # every slot busy
+    monkeypatch.setattr(limiter, "service_time", 10.0)                   # queueing would take too long
+
+    assert client.get("/api/cqrs/resources").status_code == 503
+    assert client.get("/api/health/live").status_code == 200
+    assert client.get("/api/health/ready").status_code == 200
+
+
+def limit_to(control, monkeypatch, burst: float):
+    """Buckets that hold `burst` requests and barely refill"""
+    for name, value in (("rate", 1e-6), ("burst", burst), ("ip_rate", 1e-6), ("ip_burst", burst)):
+        monkeypatch.setattr(control, name, value)
+    monkeypatch.setattr(control, "buckets", type(control.buckets)(64))
+
+
+def test_session_tokens_are_signed_and_expire():
+    tokens = SessionTokens(b"secret", ttl_seconds=60)
+    token = tokens.issue("user-1", now=1000)
+    assert tokens.verify(token, now=1030) == "user-1"
+    assert tokens.verify(token, now=1061) is None
+    assert SessionTokens(b"other").verify(token, now=1030) is None
+    forged = f"{tokens.issue('user-2', now=1000).split('.')[0]}.{token.split('.', 1)[1]}"
+    assert tokens.verify(forged, now=1030) is None
+    assert tokens.verify("not a token") is None
+
+
+def test_register_and_login_issue_session_tokens(client):
+    name = unique("login")
+    body = {"username": name, "email": f"{name}@example.com", "password": "pw", "full_name": "Login User"}
+    registered = client.post("/api/cqrs/auth/register", json=body).json()["data"]
+    assert app_module.session_tokens.verify(registered["session_token"]) == registered["user_id"]
+
+    login = client.post("/api/cqrs/auth/login", json={"email": body["email"], "password": "pw"})
+    assert login.status_code == 200
+    assert app_module.session_tokens.verify(login.json()["data"]["session_token"]) == registered["user_id"]
+    assert client.post("/api/cqrs/auth/login", json={"email": body["email"], "password": "no"}).status_code == 401
+
+
+def test_invalid_session_token_is_rejected(client):
+    response = client.get("/api/cqrs/cache", headers={"Authorization": "Bearer forged.0.token"})
+    assert response.status_code == 401
+    assert response.headers["www-authenticate"] == "Bearer"
+
+
+def test_users_behind_one_address_get_their_own_buckets(client, monkeypatch):
+    tokens = [{"Authorization": f"Bearer {app_module.session_tokens.issue(unique('nat'))}"} for _ in range(2)]
+    limit_to(app_module.admission_control, monkeypatch, burst=2)
+
+    first = [client.get("/api/cqrs/cache", headers=tokens[0]).status_code for _ in range(3)]
+    assert first == [200, 200, 429]
+    assert client.get("/api/cqrs/cache", headers=tokens[1]).status_code == 200
+    anonymous = [client.get("/api/cqrs/cache").status_code for _ in range(3)]
+    assert anonymous == [200, 200, 429]                       # anonymous requests share the address's bucket
+
+
+def test_forwarded_for_from_trusted_proxy_sets_the_client_address(client, monkeypatch):
+    limit_to(app_module.admission_control, monkeypatch, burst=1)
+    forwarded = {"X-Forwarded-For": "203.0.113.7"}
+    assert client.get("/api/cqrs/cache", headers=forwarded).status_code == 200
+    assert client.get("/api/cqrs/cache", headers=forwarded).status_code == 429
+    assert client.get("/api/cqrs/cache", headers={"X-Forwarded-For": "203.0.113.8"}).status_code == 200
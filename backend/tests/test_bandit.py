@@ -0,0 +1,69 @@
+"""
+Recommendation feedback: the LinUCB bandit's re-ranking and resubmitted
+feedback, and the feedback endpoint feeding it.
+"""
+
+import pytest
+
+from bandit import RecommendationBandit, feedback_reward
+from conftest import app_module, register, unique, upload
+
+
+def test_without_feedback_candidates_keep_their_order():
+    bandit = RecommendationBandit()
+    candidates = [(0.9, "pdf|beginner", "a"), (0.5, "video|advanced", "b"), (0.5, "pdf|beginner", "c")]
+    assert [payload for *_, payload in bandit.rerank(candidates)] == ["a", "b", "c"]
+
+
+def test_clicked_arms_move_up():
+    bandit = RecommendationBandit()
+    for _ in range(20):
+        bandit.update("video|advanced", 0.5, 1.0)
+        bandit.update("pdf|beginner", 0.5, 0.0)
+    reranked = bandit.rerank([(0.6, "pdf|beginner", "a"), (0.5, "video|advanced", "b")])
+    assert [payload for *_, payload in reranked] == ["b", "a"]
+    assert bandit.stats()["video|advanced"]["click_through_rate"] == 1.0
+
+
+def test_adjusted_feedback_equals_the_final_reward():
+    adjusted, direct = RecommendationBandit(), RecommendationBandit()
+    adjusted.update("pdf|beginner", 0.7, 1.0)
+    adjusted.adjust("pdf|beginner", 0.7, -1.0)
+    direct.update("pdf|beginner", 0.7, 0.0)
+    assert adjusted.arms == direct.arms
+    assert adjusted.ucb("pdf|beginner", 0.7) == pytest.approx(direct.ucb("pdf|beginner", 0.7))
+
+
+def test_feedback_rewards():
+    assert feedback_reward(True) == feedback_reward(True, True) == 1.0
+    assert feedback_reward(True, False) == feedback_reward(False, True) == 0.0
+
+
+def test_feedback_endpoint_updates_the_bandit_once_per_recommendation(client):
+    uploader, user = register(client), register(client)
+    resource_type = unique("type")
+    resource_id = upload(client, uploader, resource_type=resource_type)["resource_id"]
+    client.post(f"/api/cqrs/resources/{resource_id}/view", json={
+        "user_id": user, "resource_id": resource_id, "view_duration_seconds": 600, "session_id": "s"})
+    recommendations = client.post("/api/cqrs/recommendations/generate",
+                                  json={"user_id": user, "limit": 50}).json()["data"]["recommendations"]
+    recommendation = next(r for r in recommendations if r["resource_id"] == resource_id)
+    url = f"/api/cqrs/recommendations/{recommendation['recommendation_id']}/feedback"
+    body = {"recommendation_id": recommendation["recommendation_id"], "user_id": user, "was_clicked": True}
+    arm = f"{resource_type}|beginner"
+
+    assert client.post(url, json=body).json()["message"] == "Feedback recorded"
+    stats = client.get("/api/cqrs/recommendations/bandit").json()["data"]["arms"][arm]
+    assert (stats["feedback_count"], stats["click_through_rate"]) == (1, 1.0)
+
+    resubmitted = client.post(url, json={**body, "was_helpful": False, "feedback_type": "negative"})
+    assert resubmitted.json()["message"] == "Feedback updated"
+    stats = client.get("/api/cqrs/recommendations/bandit").json()["data"]["arms"][arm]
+    assert (stats["feedback_count"], stats["click_through_rate"]) == (1, 0.0)
+
+    assert client.post(url, json={**body, "user_id": uploader}).status_code == 403
+    assert client.post(url, json={**body, "feedback_type": "great"}).status_code == 400
+    missing = f"/api/cqrs/recommendations/{unique('missing')}/feedback"
+    assert client.post(missing, json={**body, "recommendation_id": unique("missing")}).status_code == 404
+    assert len([f for f in app_module.recommendations_feedback_db.values()
+                if f["recommendation_id"] == recommendation["recommendation_id"]]) == 1
@@ -0,0 +1,85 @@
+"""
+Downloads: Range parsing, whole/ranged/conditional transfers of a stored
+file and the download counts logged after each transfer.
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import app_module, register, unique, upload
+from file_storage import parse_range
+
+CONTENT = bytes(range(256)) * 40                            # 10240 bytes
+
+
+def test_parse_range_forms():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=90-500", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=-500", 100) == (0, 99)
+    assert parse_range("bytes=20-10", 100) is None          # invalid: whole file
+    assert parse_range("bytes=0-1,5-9", 100) is None        # multi-range: whole file
+    assert parse_range("items=0-1", 100) is None
+    with pytest.raises(HTTPException) as error:
+        parse_range("bytes=100-", 100)
+    assert error.value.status_code == 416
+
+
+def download_count(client, resource_id: str) -> int:
+    while app_module.download_log_tasks:
+        client.portal.call(asyncio.sleep, 0.01)
+    return client.get(f"/api/cqrs/resources/{resource_id}").json()["data"]["download_count"]
+
+
+def test_whole_ranged_and_conditional_downloads(client):
+    user_id = register(client)
+    data = upload(client, user_id, CONTENT, "tables.bin")
+    url = f"/api/cqrs/resources/{data['resource_id']}/download"
+
+    whole = client.get(url)
+    assert whole.status_code == 200 and whole.content == CONTENT
+    assert whole.headers["accept-ranges"] == "bytes"
+    assert whole.headers["content-length"] == str(len(CONTENT))
+    etag = whole.headers["etag"]
+
+    part = client.get(url, headers={"Range": "bytes=100-299"})
+    assert part.status_code == 206 and part.content == CONTENT[100:300]
+    assert part.headers["content-range"] == f"bytes 100-299/{len(CONTENT)}"
+    assert client.get(url, headers={"Range": "bytes=-16"}).content == CONTENT[-16:]
+    assert client.get(url, headers={"Range": "bytes=100-199", "If-Range": etag}).status_code == 206
+    stale = client.get(url, headers={"Range": "bytes=100-199", "If-Range": '"older"'})
+    assert stale.status_code == 200 and stale.content == CONTENT
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    head = client.head(url)
+    assert head.status_code == 200 and head.content == b""
+    assert head.headers["content-length"] == str(len(CONTENT))
+    assert client.get(url, headers={"Range": f"bytes={len(CONTENT)}-"}).status_code == 416
+
+
+def test_ranged_downloads_count_once_per_client(client):
+    user_id = register(client)
+    resource_id = upload(client, user_id, CONTENT + unique("count").encode(), "media.bin")["resource_id"]
+    url = f"/api/cqrs/resources/{resource_id}/download"
+
+    client.get(url, params={"user_id": user_id})
+    client.get(url, params={"user_id": user_id})
+    assert download_count(client, resource_id) == 2            # whole files always count
+
+    other = register(client)
+    client.get(url, params={"user_id": other}, headers={"Range": "bytes=0-99"})
+    assert download_count(client, resource_id) == 2            # did not reach the end
+    for _ in range(3):                                         # seeking to the end repeatedly
+        client.get(url, params={"user_id": other}, headers={"Range": "bytes=5000-"})
+    assert download_count(client, resource_id) == 3
+    client.get(url, headers={"Range": "bytes=5000-", "X-Forwarded-For": "198.51.100.4"})
+    assert download_count(client, resource_id) == 4            # an anonymous client, keyed by address
+
+
+def test_resource_without_a_file_has_nothing_to_download(client):
+    resource_id = upload(client, register(client))["resource_id"]
+    assert client.get(f"/api/cqrs/resources/{resource_id}/download").status_code == 404
@@ -0,0 +1,74 @@
+"""
+Offline evaluation: ranking metrics against hand-computed values, the
+temporal split, a full run on a small synthetic fixture and loading a
+Parquet export.
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import evaluation
+import exporter
+from activity_store import ActivityStore
+from conftest import app_module
+
+
+def test_ranking_metrics_match_hand_computed_values():
+    scores = np.array([[0.9, 0.1, 0.8, 0.3], [0.2, 0.7, 0.1, 0.6]])
+    top = evaluation.rank_top_k(scores, 2)
+    assert top.tolist() == [[0, 2], [1, 3]]
+    relevant = np.array([[False, False, True, True], [False, True, False, False]])
+    metrics = evaluation.ranking_metrics(top, relevant, 2)
+    assert metrics["precision"].tolist() == [0.5, 0.5]
+    assert metrics["recall"].tolist() == [0.5, 1.0]
+    assert metrics["ndcg"] == pytest.approx([(1 / np.log2(3)) / (1 + 1 / np.log2(3)), 1.0])
+    assert metrics["map"] == pytest.approx([0.25, 1.0])
+
+    unranked = np.array([[True, False], [True, True]])           # padding entries never count as hits
+    assert evaluation.ranking_metrics(top, relevant, 2, unranked)["precision"].tolist() == [0.0, 0.5]
+
+
+def test_temporal_split_tests_on_the_latest_events():
+    log = evaluation.synthetic_log(n_users=50, n_items=40, events_per_user=10)
+    train, test, cutoff = evaluation.temporal_split(log, 0.25)
+    assert len(train) + len(test) == len(log)
+    assert train.timestamp.max() < cutoff <= test.timestamp.min()
+    assert len(test) == pytest.approx(0.25 * len(log), abs=1)
+
+
+def test_evaluation_report_on_a_synthetic_fixture():
+    log = evaluation.synthetic_log(n_users=150, n_items=80, events_per_user=20)
+    report = evaluation.evaluate(log, k=5, latency_samples=10)
+    assert set(report["algorithms"]) == set(evaluation.ALGORITHMS)
+    assert set(report["baselines"]) == set(evaluation.BASELINES)
+    assert report["split"]["users_evaluated"] > 0
+    for result in list(report["algorithms"].values()) + list(report["baselines"].values()):
+        assert all(0.0 <= result[metric] <= 1.0 for metric in ("precision@5", "recall@5", "ndcg@5", "map@5"))
+        assert 0.0 < result["coverage"] <= 1.0
+    assert report["algorithms"]["hybrid"]["precision@5"] > 0
+
+
+def test_export_round_trips_into_an_interaction_log(tmp_path):
+    store = ActivityStore()
+    at = datetime(2026, 3, 1)
+    for i in range(6):
+        store.log_view(str(uuid.uuid4()), f"u{i % 2}", f"r{i % 3}", at + timedelta(hours=i), 600, "pc", "s")
+    rating = store.add_rating(str(uuid.uuid4()), "u0", "r1", 2, "", at)
+    uploads = [app_module.Event(event_id=str(i), event_type="ResourceUploadedEvent", timestamp=at.isoformat(),
+                                data={"resource_id": f"r{i}", "resource_type": "pdf", "difficulty_level": "beginner",
+                                      "auto_tags": ["algebra"], "duplicate_of": "r0" if i == 2 else None})
+               for i in range(3)]
+    asyncio.run(exporter.build_exporter(str(tmp_path), store, {}, uploads).export())
+    store.update_rating(rating, 5, "", at + timedelta(days=1))
+    asyncio.run(exporter.build_exporter(str(tmp_path), store, {}, uploads).export())
+
+    log = evaluation.load_export(str(tmp_path))
+    assert sorted(log.users) == ["u0", "u1"] and sorted(log.items) == ["r0", "r1", "r2"]
+    assert len(log) == 7                                      # six views plus the latest version of the rating
+    assert log.item_duplicate.tolist() == [item == "r2" for item in log.items]
+    rated = (log.user == log.users.index("u0")) & (log.item == log.items.index("r1")) & (log.weight == 2.0)
+    assert rated.sum() == 1                                   # rating_weight(5), not the re-exported 2 stars
@@ -0,0 +1,85 @@
+"""
+Parquet export: incremental runs past the high-water marks, date
+partitions, re-exported ratings and a failed run redone without duplicates.
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pyarrow.parquet as pq
+import pytest
+
+import exporter
+from activity_store import ActivityStore
+from conftest import app_module
+
+AT = datetime(2026, 3, 1, 23, 0, 0)
+
+
+def log_views(store: ActivityStore, count: int, start: datetime = AT):
+    for i in range(count):
+        store.log_view(str(uuid.uuid4()), f"u{i % 5}", f"r{i % 3}", start + timedelta(minutes=i), i, "pc", "s")
+
+
+def build(directory, store: ActivityStore, recommendations=None, events=None, batch_rows: int = 16):
+    return exporter.build_exporter(str(directory), store, recommendations or {}, events or [], batch_rows)
+
+
+def read(directory, table: str):
+    return pq.read_table(os.path.join(str(directory), table)).to_pydict()
+
+
+def test_runs_export_only_new_rows_into_date_partitions(tmp_path):
+    store = ActivityStore()
+    log_views(store, 100)                                     # 23:00 to 00:39: two dates
+    events = [app_module.Event(event_id=str(i), event_type="ResourceViewedEvent",
+                               timestamp=AT.isoformat(), data={"i": i}) for i in range(3)]
+    written = asyncio.run(build(tmp_path, store, events=events).export())
+    assert written["activities_views"] == 100 and written["events"] == 3
+    assert sorted(os.listdir(tmp_path / "activities_views")) == ["date=2026-03-01", "date=2026-03-02"]
+
+    log_views(store, 10, AT + timedelta(days=1))
+    written = asyncio.run(build(tmp_path, store, events=events).export())
+    assert written["activities_views"] == 10 and written["events"] == 0
+    views = read(tmp_path, "activities_views")
+    assert sorted(views["view_duration_seconds"]) == sorted(list(range(100)) + list(range(10)))
+    assert len(set(views["view_id"])) == 110
+    assert set(views["user_id"]) == {f"u{i}" for i in range(5)}
+    assert read(tmp_path, "events")["data"] == ['{"i": 0}', '{"i": 1}', '{"i": 2}']
+
+
+def test_re_rated_rows_are_exported_again(tmp_path):
+    store = ActivityStore()
+    row = store.add_rating(str(uuid.uuid4()), "u1", "r1", 2, "meh", AT)
+    store.add_rating(str(uuid.uuid4()), "u2", "r1", 5, "", AT)
+    asyncio.run(build(tmp_path, store).export())
+    store.update_rating(row, 4, "better", AT + timedelta(hours=1))
+    assert asyncio.run(build(tmp_path, store).export())["activities_ratings"] == 1
+
+    ratings = read(tmp_path, "activities_ratings")
+    assert sorted(zip(ratings["rating_value"], ratings["review_text"])) == [(2, "meh"), (4, "better"), (5, "")]
+
+
+def test_failed_run_is_redone_without_duplicates(tmp_path, monkeypatch):
+    store = ActivityStore()
+    log_views(store, 100)
+    calls = []
+    to_table = exporter.ColumnarSource.to_table
+
+    def failing(self, batch):
+        calls.append(1)
+        if len(calls) == 3:
+            raise OSError("disk full")
+        return to_table(self, batch)
+
+    monkeypatch.setattr(exporter.ColumnarSource, "to_table", failing)
+    with pytest.raises(OSError):
+        asyncio.run(build(tmp_path, store).export())
+    assert build(tmp_path, store).load_marks() == {}
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith(".tmp")]
+
+    monkeypatch.setattr(exporter.ColumnarSource, "to_table", to_table)
+    assert asyncio.run(build(tmp_path, store).export())["activities_views"] == 100
+    assert len(read(tmp_path, "activities_views")["view_id"]) == 100
@@ -0,0 +1,92 @@
+"""
+Collaborative model: ALS on a block-structured fixture, the mmap'd serving
+model, training in the worker process with a hot swap, and collaborative
+recommendations from the API.
+"""
+
+import asyncio
+import os
+
+import numpy as np
+
+from conftest import register, upload
+from factor_model import KEEP_VERSIONS, CollaborativeModel, FactorModel, train_model_version
+
+PARAMS = {"factors": 8, "iterations": 10, "regularization": 0.1, "alpha": 10.0}
+
+
+def two_groups(users: int = 40, items: int = 20, seed: int = 3):
+    """Even users interact with the first half of the items, odd users with the second"""
+    rng = np.random.default_rng(seed)
+    user, item = [], []
+    for u in range(users):
+        group = np.arange(items // 2) + (u % 2) * (items // 2)
+        picks = rng.choice(group, size=6, replace=False)
+        user += [u] * len(picks)
+        item += picks.tolist()
+    return (np.array(user, np.int32), np.array(item, np.int32), np.ones(len(user)),
+            [f"u{u}" for u in range(users)], [f"r{i}" for i in range(items)])
+
+
+def test_served_model_recommends_unseen_items_of_the_users_group(tmp_path):
+    user, item, weight, user_ids, resource_ids = two_groups()
+    excluded = np.array([3], np.int64)
+    train_model_version(str(tmp_path), "1", user, item, weight, user_ids, resource_ids, excluded, PARAMS)
+    model = FactorModel(os.path.join(str(tmp_path), "als-1"))
+
+    seen = {f"r{i}" for i in item[user == 0]}
+    top = model.top_k("u0", 3)
+    assert len(top) == 3 and [score for _, score in top] == sorted((s for _, s in top), reverse=True)
+    assert all(int(resource_id[1:]) < 10 for resource_id, _ in top)
+    assert not seen & {resource_id for resource_id, _ in top}
+    assert "r3" not in {resource_id for resource_id, _ in model.top_k("u0", 20)}
+    assert model.top_k("stranger", 3) is None
+    assert len(model.top_k("u0", 20)) == 20 - len(seen) - (3 not in item[user == 0])
+
+
+def test_training_swaps_in_new_versions_and_prunes_old_ones(tmp_path):
+    data = two_groups()
+
+    async def scenario():
+        model = CollaborativeModel(str(tmp_path), lambda: lambda: (*data, np.zeros(0, np.int64)),
+                                   factors=8, iterations=5)
+        try:
+            first = await model.train()
+            served = model.current
+            racing = asyncio.ensure_future(model.train())
+            await asyncio.sleep(0)
+            assert await model.train() is None              # one run at a time
+            second = await racing
+            for _ in range(KEEP_VERSIONS):
+                await model.train()
+            return first, second, served, model
+        finally:
+            model.close()
+
+    first, second, served, model = asyncio.run(scenario())
+    assert second["version"] > first["version"]
+    assert model.current is not served and served.top_k("u0", 3)    # old references keep working
+    assert len(model._versions()) == KEEP_VERSIONS
+    assert model.summary()["model"]["users"] == 40
+
+
+def test_collaborative_recommendations_after_training(client):
+    users = [register(client) for _ in range(4)]
+    resources = [upload(client, users[0])["resource_id"] for _ in range(6)]
+    for i, user_id in enumerate(users):
+        for resource_id in resources[i % 2::2][:2]:
+            client.post(f"/api/cqrs/resources/{resource_id}/view", json={
+                "user_id": user_id, "resource_id": resource_id, "view_duration_seconds": 300, "session_id": "s"})
+
+    response = client.post("/api/cqrs/recommendations/model/train")
+    assert response.status_code == 200, response.text
+    stats = client.get("/api/cqrs/recommendations/model").json()["data"]
+    assert stats["model"]["version"] == response.json()["data"]["version"] and not stats["training"]
+
+    result = client.post("/api/cqrs/recommendations/generate",
+                         json={"user_id": users[0], "limit": 5, "algorithm": "collaborative"}).json()["data"]
+    assert result["algorithm_used"] == "collaborative"
+    assert not {r["resource_id"] for r in result["recommendations"]} & set(resources[0:4:2])
+    newcomer = client.post("/api/cqrs/recommendations/generate",
+                           json={"user_id": register(client), "algorithm": "collaborative"}).json()["data"]
+    assert newcomer["algorithm_used"] == "hybrid"
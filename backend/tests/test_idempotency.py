@@ -0,0 +1,101 @@
+"""
+Idempotency keys: the cache on its own (replays, concurrent retries,
+failures, conflicts, expiry) and retried commands on the endpoints.
+"""
+
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import app_module, register, unique, upload
+from idempotency import IdempotencyCache
+
+
+def counting(result="done"):
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return result
+    return calls, execute
+
+
+def test_duplicates_get_the_first_result():
+    async def scenario():
+        cache = IdempotencyCache()
+        calls, execute = counting()
+        concurrent = await asyncio.gather(*(cache.run("k", "f", execute) for _ in range(3)))
+        later = await cache.run("k", "f", execute)
+        return calls, concurrent + [later], cache.stats
+
+    calls, results, stats = asyncio.run(scenario())
+    assert len(calls) == 1 and results == ["done"] * 4
+    assert stats == {"executed": 1, "replayed": 1, "waited": 2, "conflicts": 0}
+
+
+def test_failures_are_not_stored():
+    async def scenario():
+        cache = IdempotencyCache()
+
+        async def fail():
+            raise HTTPException(status_code=404, detail="missing")
+        with pytest.raises(HTTPException):
+            await cache.run("k", "f", fail)
+        calls, execute = counting()
+        return await cache.run("k", "f", execute), calls
+
+    assert asyncio.run(scenario()) == ("done", [1])
+
+
+def test_reused_key_with_a_different_request_conflicts():
+    async def scenario():
+        cache = IdempotencyCache()
+        await cache.run("k", "f1", counting()[1])
+        await cache.run("k", "f2", counting()[1])
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(scenario())
+    assert error.value.status_code == 422
+
+
+def test_expired_and_evicted_keys_run_again():
+    async def scenario(cache):
+        calls, execute = counting()
+        for key in ("a", "b", "a"):
+            await cache.run(key, "f", execute)
+        return len(calls)
+
+    assert asyncio.run(scenario(IdempotencyCache(ttl_seconds=0))) == 3
+    assert asyncio.run(scenario(IdempotencyCache(max_entries=1))) == 3
+    assert asyncio.run(scenario(IdempotencyCache())) == 2
+
+
+def test_retried_view_is_logged_once(client):
+    user_id = register(client)
+    resource_id = upload(client, user_id)["resource_id"]
+    body = {"user_id": user_id, "resource_id": resource_id, "view_duration_seconds": 30, "session_id": "s"}
+    headers = {"Idempotency-Key": unique("view")}
+    events = len(app_module.event_bus.event_log)
+    responses = [client.post(f"/api/cqrs/resources/{resource_id}/view", json=body, headers=headers)
+                 for _ in range(3)]
+    assert {r.status_code for r in responses} == {200}
+    assert responses[0].json() == responses[1].json() == responses[2].json()
+    assert len(app_module.event_bus.event_log) == events + 1
+    assert client.get(f"/api/cqrs/resources/{resource_id}").json()["data"]["view_count"] == 1
+
+    changed = client.post(f"/api/cqrs/resources/{resource_id}/view",
+                          json={**body, "view_duration_seconds": 31}, headers=headers)
+    assert changed.status_code == 422
+
+
+def test_repeated_ratings_update_the_one_rating(client):
+    user_id = register(client)
+    resource_id = upload(client, user_id)["resource_id"]
+    rate = {"user_id": user_id, "resource_id": resource_id, "review_text": ""}
+    first = client.post(f"/api/cqrs/resources/{resource_id}/rate", json={**rate, "rating_value": 2}).json()
+    second = client.post(f"/api/cqrs/resources/{resource_id}/rate", json={**rate, "rating_value": 4}).json()
+    assert second["data"]["rating_id"] == first["data"]["rating_id"]
+    assert second["data"]["updated_stats"] == {"average_rating": 4.0, "rating_count": 1}
+    assert second["message"] == "Rating updated successfully"
@@ -0,0 +1,89 @@
+"""
+Interest profiles: decay, shares and leaderboards in the store, re-ratings
+that replace their earlier weight, and the preference/interest tables the
+view and rating events keep current.
+"""
+
+import math
+
+import pytest
+
+from conftest import app_module, register, upload
+from interest_profiles import DEFAULT_HALF_LIFE_SECONDS, InterestProfileStore, rating_weight, view_weight
+
+DAY = 24 * 3600
+
+
+def store_with(*resources) -> InterestProfileStore:
+    store = InterestProfileStore()
+    for resource_id, resource_type, difficulty, tags in resources:
+        store.register_resource(resource_id, resource_type, difficulty, tags)
+    return store
+
+
+def test_weights_halve_every_half_life():
+    store = store_with(("r1", "pdf", "beginner", ["algebra"]))
+    store.record_interaction("u1", "r1", 1.0, now=0)
+    assert store.get_vector("u1", now=0)["tag:algebra"] == pytest.approx(1.0)
+    assert store.get_vector("u1", now=DEFAULT_HALF_LIFE_SECONDS)["tag:algebra"] == pytest.approx(0.5)
+
+
+def test_recent_interest_leads_and_shares_are_per_group():
+    store = store_with(("old", "pdf", "beginner", ["algebra"]), ("new", "video", "advanced", ["physics"]))
+    store.record_interaction("u1", "old", 1.0, now=0)
+    shares = store.record_interaction("u1", "new", 1.0, now=30 * DAY)   # equal weight, two half-lives later
+    assert store.get_leaders("u1", "tag") == ["physics", "algebra"]
+    assert shares["tag:physics"] == pytest.approx(1 / (1 + 2 ** (-30 * DAY / DEFAULT_HALF_LIFE_SECONDS)))
+    score, best = store.score_resource("u1", "new")
+    assert best in ("tag:physics", "type:video", "difficulty:advanced") and 0.5 < score <= 1.0
+
+
+def test_rebase_keeps_the_decayed_vector():
+    store = store_with(("r1", "pdf", "beginner", ["algebra"]), ("r2", "pdf", "beginner", ["algebra"]))
+    store.record_interaction("u1", "r1", 1.0, now=0)
+    later = 1100 * DAY                                            # past the rebase bound (~72 half-lives)
+    store.record_interaction("u1", "r2", 1.0, now=later)
+    expected = 1.0 + math.exp(-store.decay_rate * later)
+    assert store.profiles["u1"].origin == later
+    assert store.get_vector("u1", now=later)["tag:algebra"] == pytest.approx(expected)
+
+
+def test_replacing_an_interaction_removes_its_earlier_weight():
+    store = store_with(("r1", "pdf", "beginner", ["algebra"]), ("r2", "pdf", "beginner", ["physics"]))
+    store.record_interaction("u1", "r1", rating_weight(5), now=0)
+    store.record_interaction("u1", "r2", rating_weight(3), now=DAY)
+    store.replace_interaction("u1", "r1", rating_weight(5), 0, rating_weight(1), now=2 * DAY)
+    assert "tag:algebra" not in store.get_vector("u1", now=2 * DAY)
+    assert store.get_leaders("u1", "tag") == ["physics"]
+    assert store.profiles["u1"].event_count == 2
+
+
+def test_views_and_ratings_update_preferences_and_interests(client):
+    uploader, viewer = register(client), register(client)
+    advanced = upload(client, uploader, difficulty_level="advanced")["resource_id"]
+    beginner = upload(client, uploader, difficulty_level="beginner")["resource_id"]
+    for resource_id, seconds in ((advanced, 600), (beginner, 5)):
+        client.post(f"/api/cqrs/resources/{resource_id}/view", json={
+            "user_id": viewer, "resource_id": resource_id, "view_duration_seconds": seconds, "session_id": "s"})
+
+    prefs = client.portal.call(app_module.UserRepository.get_user_preferences, viewer)
+    assert prefs["difficulty_level"] == "advanced"
+    assert prefs["preferred_subjects"] == app_module.interest_profiles.get_leaders(viewer, "tag") != []
+    interests = [m for m in app_module.mapping_user_interests_db.values() if m["user_id"] == viewer]
+    assert len(interests) == len(prefs["preferred_subjects"])
+    assert {m["interest_level"] for m in interests} == {"medium"}      # three tags share every view equally
+
+    vector = app_module.interest_profiles.get_vector(viewer)
+    assert vector["difficulty:advanced"] / vector["difficulty:beginner"] == pytest.approx(
+        view_weight(600) / view_weight(5), rel=1e-3)
+
+
+def test_re_rating_replaces_the_profile_weight(client):
+    uploader, rater = register(client), register(client)
+    resource_id = upload(client, uploader, difficulty_level="intermediate")["resource_id"]
+    rate = {"user_id": rater, "resource_id": resource_id, "review_text": ""}
+    client.post(f"/api/cqrs/resources/{resource_id}/rate", json={**rate, "rating_value": 5})
+    assert app_module.interest_profiles.get_vector(rater)["difficulty:intermediate"] > 0
+    client.post(f"/api/cqrs/resources/{resource_id}/rate", json={**rate, "rating_value": 1})
+    assert app_module.interest_profiles.get_vector(rater) == {}
+    assert app_module.interest_profiles.profiles[rater].event_count == 1
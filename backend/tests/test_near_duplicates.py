@@ -0,0 +1,155 @@
+"""
+Near-duplicate detection: the MinHash/LSH index on its own and the upload
+paths that link duplicates (identical bytes, similar text, metadata only).
+"""
+
+import asyncio
+import os
+import random
+
+import numpy as np
+
+import near_duplicates
+from conftest import app_module, register, upload
+from near_duplicates import NearDuplicateIndex
+
+WORDS = [f"word{i}" for i in range(2000)]
+
+
+def text(seed: int, words: int = 300) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def edited(content: str, changes: int = 3) -> str:
+    words = content.split()
+    for i in range(changes):
+        words[i * 37 % len(words)] = "changed"
+    return " ".join(words)
+
+
+def pdf_bytes(seed: int) -> bytes:
+    return b"%PDF-1.4\n" + random.Random(seed).randbytes(4096)
+
+
+def test_index_finds_near_copies_only():
+    index = NearDuplicateIndex()
+    for i in range(50):
+        index.add(f"r{i}", index.signature(text(i)))
+    matches = index.query(index.signature(edited(text(7))))
+    assert [resource_id for resource_id, _ in matches] == ["r7"]
+    assert matches[0][1] >= index.threshold
+    assert index.query(index.signature(text(999))) == []
+
+
+def test_content_signature_ignores_metadata_only_uploads():
+    index = NearDuplicateIndex()
+    assert index.content_signature("", "Lecture notes", "Week 1") is None
+    assert index.content_signature("too few words here", "Lecture notes") is None
+    assert index.content_signature(text(1), "Lecture notes") is not None
+
+
+def test_background_merge_matches_inline_merge(monkeypatch):
+    monkeypatch.setattr(near_duplicates, "MERGE_ROWS", 64)
+    signatures = [NearDuplicateIndex().signature(text(i, 40)) for i in range(300)]
+
+    inline = NearDuplicateIndex()
+    for i, signature in enumerate(signatures):
+        inline.add(f"r{i}", signature)
+    inline.merge()
+
+    async def threaded():
+        index = NearDuplicateIndex()
+        for i, signature in enumerate(signatures):
+            index.add(f"r{i}", signature)
+            assert index.query(signature)[0][0] == f"r{i}"       # visible before its merge finished
+            await asyncio.sleep(0)
+        while index._merge_task is not None:
+            await asyncio.sleep(0.01)
+        return index
+
+    index = asyncio.run(threaded())
+    index.merge()
+    assert np.array_equal(index._keys, inline._keys)
+    assert np.array_equal(index._key_rows, inline._key_rows)
+
+
+def test_dump_and_load_round_trip():
+    index = NearDuplicateIndex()
+    for i in range(20):
+        index.add(f"r{i}", index.signature(text(i)))
+    restored = NearDuplicateIndex()
+    restored.load(index.dump())
+    for i in range(20):
+        assert restored.query(index.signature(text(i)))[0] == (f"r{i}", 1.0)
+
+
+def test_load_during_a_merge_discards_the_stale_result(monkeypatch):
+    monkeypatch.setattr(near_duplicates, "MERGE_ROWS", 8)
+    snapshot = NearDuplicateIndex()
+    for i in range(5):
+        snapshot.add(f"s{i}", snapshot.signature(text(100 + i)))
+    state = snapshot.dump()
+
+    async def load_while_merging():
+        index = NearDuplicateIndex()
+        for i in range(8):
+            index.add(f"r{i}", index.signature(text(i)))
+        task = index._merge_task
+        assert task is not None
+        index.load(state)
+        await task
+        return index
+
+    index = asyncio.run(load_while_merging())
+    assert index.resource_ids == [f"s{i}" for i in range(5)]
+    assert np.array_equal(index._keys, snapshot._keys)
+    assert index.query(snapshot.signature(text(102)))[0] == ("s2", 1.0)
+    assert index.query(snapshot.signature(text(2))) == []
+
+
+def test_pdfs_with_the_same_title_are_not_linked(client):
+    user_id = register(client)
+    first = upload(client, user_id, pdf_bytes(1), "a.pdf", title="Lecture notes", description="Week 1")
+    second = upload(client, user_id, pdf_bytes(2), "b.pdf", title="Lecture notes", description="Week 1")
+    assert second["duplicate_of"] is None
+    assert second["near_duplicates"] == []
+    assert app_module.resources_metadata_db[first["resource_id"]]["duplicate_of"] is None
+    assert app_module.resources_metadata_db[second["resource_id"]]["duplicate_of"] is None
+
+
+def test_identical_bytes_link_to_the_first_upload(client):
+    user_id = register(client)
+    content = pdf_bytes(3)
+    first = upload(client, user_id, content, "slides.pdf", title="Slides")
+    second = upload(client, user_id, content, "copy.pdf", title="Completely different title")
+    third = upload(client, user_id, content, "again.pdf", title="Another title")
+    assert second["deduplicated"] and third["deduplicated"]
+    assert second["duplicate_of"] == third["duplicate_of"] == first["resource_id"]
+    assert app_module.resource_duplicates_index[first["resource_id"]][-2:] == [
+        second["resource_id"], third["resource_id"]]
+    details = client.get(f"/api/cqrs/resources/{first['resource_id']}").json()["data"]
+    assert details["duplicates"][-2:] == [second["resource_id"], third["resource_id"]]
+    copy = client.get(f"/api/cqrs/resources/{third['resource_id']}").json()["data"]
+    assert copy["duplicate_of"] == first["resource_id"]
+
+
+def test_similar_text_uploads_are_linked(client):
+    user_id = register(client)
+    content = text(11)
+    first = upload(client, user_id, content.encode(), "notes.txt", title="Notes")
+    second = upload(client, user_id, edited(content).encode(), "notes-v2.txt", title="Notes v2")
+    assert not second["deduplicated"]
+    assert second["duplicate_of"] == first["resource_id"]
+    assert second["near_duplicates"][0]["resource_id"] == first["resource_id"]
+
+
+def test_duplicates_are_left_out_of_recommendations(client):
+    user_id = register(client)
+    content = pdf_bytes(4)
+    first = upload(client, user_id, content, "x.pdf", title="Original")
+    copy = upload(client, user_id, content, "y.pdf", title="Copy")
+    response = client.post("/api/cqrs/recommendations/generate", json={"user_id": user_id, "limit": 50})
+    assert response.status_code == 200, response.text
+    recommended = {r["resource_id"] for r in response.json()["data"]["recommendations"]}
+    assert copy["resource_id"] not in recommended
@@ -0,0 +1,85 @@
+"""
+Snapshot + WAL recovery: state written by one process comes back unchanged in
+the next, including content analysis that finished after the upload.
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+from conftest import app_module, register, unique, upload
+
+BACKEND = os.path.join(os.path.dirname(__file__), "..")
+
+# Runs the app against a state directory. "write" registers, uploads and
+# views, waits for content analysis, compacts into a snapshot and writes more
+# to the WAL; both phases then print the tables that must survive a restart.
+SCRIPT = """
+import asyncio, json, sys
+from fastapi.testclient import TestClient
+import cqrs_eda_implementation as app
+
+def no_analysis(path, file_name):
+    raise OSError("analysis must come from the journal after a restart")
+
+if sys.argv[1] == "read":
+    app.analyze_file = no_analysis
+
+with TestClient(app.app) as client:
+    client.get("/api/cqrs/events")
+    if sys.argv[1] == "write":
+        body = {"username": "alice", "email": "alice@example.com", "password": "x", "full_name": "Alice"}
+        user_id = client.post("/api/cqrs/auth/register", json=body).json()["data"]["user_id"]
+        form = {"title": "Notes", "description": "d", "resource_type": "pdf", "difficulty_level": "beginner",
+                "uploader_user_id": user_id}
+        for name, content in (("a.txt", b"first file"), ("b.pdf", b"%PDF-1.4 /Type /Page")):
+            data = client.post("/api/cqrs/resources/upload", data=form, files={"file": (name, content)}).json()
+            while app.analysis_tasks:
+                client.portal.call(asyncio.sleep, 0.01)
+            if name == "a.txt":
+                app.state_store.snapshot()
+                client.portal.call(app.state_store.wait_for_snapshot)
+        client.post(f"/api/cqrs/resources/{data['data']['resource_id']}/view",
+                    json={"user_id": user_id, "resource_id": data["data"]["resource_id"],
+                          "view_duration_seconds": 30, "session_id": "s"})
+    tables = {name: repr(sorted(dict(table).items(), key=repr)) for name, table in app.state_store._tables.items()}
+    print(json.dumps({"tables": tables, "stored_files": app.stored_files_db}, default=str))
+"""
+
+
+def run(phase: str, state_dir: str, upload_dir: str) -> dict:
+    env = dict(os.environ, STATE_DIR=state_dir, UPLOAD_DIR=upload_dir)
+    output = subprocess.run([sys.executable, "-c", SCRIPT, phase], cwd=BACKEND, env=env,
+                            capture_output=True, text=True, timeout=120, check=True).stdout
+    return json.loads(next(line for line in output.splitlines() if line.startswith('{"tables"')))
+
+
+def test_restart_restores_snapshot_and_wal_tail(tmp_path):
+    state_dir, upload_dir = str(tmp_path / "state"), str(tmp_path / "uploads")
+    written = run("write", state_dir, upload_dir)
+    restored = run("read", state_dir, upload_dir)
+    assert restored == written
+    records = restored["stored_files"].values()
+    assert "alice" in restored["tables"]["users_auth"]
+    assert len(records) == 2 and all(record["analyzed"] for record in records)
+    assert {record["mime_type"] for record in records} == {"text/plain", "application/pdf"}
+
+
+def test_unanalyzed_files_are_resumed_after_recovery(client):
+    data = upload(client, register(client), content=unique("resume").encode())
+    while app_module.analysis_tasks:
+        client.portal.call(asyncio.sleep, 0.01)
+    record = app_module.stored_files_db[data["checksum"]]
+    record.update(analyzed=False, mime_type=None)           # as if the process died before the result was journaled
+
+    async def resume():
+        resumed = app_module.resume_content_analysis()
+        await asyncio.gather(*app_module.analysis_tasks.values())
+        return resumed
+
+    assert client.portal.call(resume) >= 1
+    assert record["analyzed"] and record["mime_type"] == "text/plain"
+    content = client.portal.call(app_module.ResourceRepository.get_resource_content, data["resource_id"])
+    assert content["mime_type"] == "text/plain"
@@ -0,0 +1,100 @@
+"""
+Read replicas: the owner's command journal on its own, and an owner with
+uvicorn workers answering queries from their replicas.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from persistence import CommandJournal
+
+BACKEND = os.path.join(os.path.dirname(__file__), "..")
+
+
+def test_journal_keeps_entries_until_snapshot_and_readers_have_them():
+    journal = CommandJournal()
+    for segment in (0, 0, 1, 1, 2):
+        journal.append(segment, ("Command", {}, []))
+    journal.readers[1] = 1
+    journal.trim(2)                                    # snapshot covers segments 0-1, reader still needs 1
+    assert (journal.start, journal.end) == (1, 5)
+    journal.readers[1] = 5
+    journal.trim(2)
+    assert (journal.start, [segment for segment, _ in journal.read(journal.start, 10)]) == (4, [2])
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Deployment:
+    """A state owner plus uvicorn worker processes sharing one state directory"""
+
+    def __init__(self, root: str):
+        self.env = dict(os.environ, STATE_DIR=os.path.join(root, "state"), UPLOAD_DIR=os.path.join(root, "uploads"),
+                        MODEL_DIR=os.path.join(root, "models"), STATE_SOCKET=os.path.join(root, "state.sock"),
+                        SNAPSHOT_INTERVAL_SECONDS="0.5")
+        self.processes = [subprocess.Popen(
+            [sys.executable, "state_owner.py", "cqrs_eda_implementation", self.env["STATE_SOCKET"]],
+            cwd=BACKEND, env=dict(self.env, STATE_MODE="owner"), stdout=subprocess.DEVNULL)]
+        while not os.path.exists(self.env["STATE_SOCKET"]):
+            time.sleep(0.05)
+
+    def add_workers(self, workers: int) -> httpx.Client:
+        port = free_port()
+        self.processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "cqrs_eda_implementation:app", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=BACKEND, env=dict(self.env, STATE_MODE="worker"), stdout=subprocess.DEVNULL))
+        client = httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30)
+        for _ in range(150):
+            try:
+                if client.get("/api/health/ready").status_code == 200:
+                    return client
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError("workers did not become ready")
+
+    def stop(self):
+        for process in reversed(self.processes):
+            process.terminate()
+            process.wait()
+
+
+def test_workers_answer_queries_from_their_replicas(tmp_path):
+    deployment = Deployment(str(tmp_path))
+    try:
+        client = deployment.add_workers(2)
+        resource_ids = []
+        for i in range(5):
+            user_id = client.post("/api/cqrs/auth/register", json={
+                "username": f"u{i}", "email": f"u{i}@example.com", "password": "x", "full_name": "U"}
+            ).json()["data"]["user_id"]
+            assert client.get(f"/api/cqrs/users/{user_id}").json()["data"]["username"] == f"u{i}"
+            resource_id = client.post("/api/cqrs/resources/upload", data={
+                "title": "Notes", "description": "d", "resource_type": "pdf", "difficulty_level": "beginner",
+                "uploader_user_id": user_id}, files={"file": ("a.txt", f"notes {i}".encode())}).json()["data"]["resource_id"]
+            client.post(f"/api/cqrs/resources/{resource_id}/view", json={
+                "user_id": user_id, "resource_id": resource_id, "view_duration_seconds": 30, "session_id": "s"})
+            details = client.get(f"/api/cqrs/resources/{resource_id}")
+            assert details.json()["data"]["view_count"] == 1
+            assert client.get(f"/api/cqrs/resources/{resource_id}",
+                              headers={"If-None-Match": details.headers["etag"]}).status_code == 304
+            resource_ids.append(resource_id)
+
+        time.sleep(1.5)                                 # a snapshot now covers part of the journal
+        late = deployment.add_workers(1)
+        assert late.get("/api/health").json()["resources_uploaded"] == 5
+        assert [late.get(f"/api/cqrs/resources/{r}").json()["data"]["view_count"] for r in resource_ids] == [1] * 5
+        state = late.get("/api/health/ready").json()["components"]["state"]
+        assert state["state"] == "ready" and state["details"]["snapshot_segment"] > 0
+    finally:
+        deployment.stop()
@@ -0,0 +1,100 @@
+"""
+Response cache: ETag matching, hits, invalidation by bumps (including bumps
+during a build), byte-bounded eviction and conditional GETs on the query
+endpoints.
+"""
+
+import asyncio
+import json
+
+from conftest import register, upload
+from response_cache import ENTRY_OVERHEAD_BYTES, ResponseCache, etag_matches
+
+
+def test_if_none_match_forms():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"x", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"x"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+def test_hits_304s_and_bumps():
+    async def scenario():
+        cache, builds = ResponseCache(), []
+
+        async def build():
+            builds.append(1)
+            return {"n": len(builds)}
+        first = await cache.respond("k", None, build)
+        hit = await cache.respond("k", None, build)
+        not_modified = await cache.respond("k", first.headers["etag"], build)
+        cache.bump("k")
+        rebuilt = await cache.respond("k", first.headers["etag"], build)
+        return first, hit, not_modified, rebuilt, builds, cache.stats
+
+    first, hit, not_modified, rebuilt, builds, stats = asyncio.run(scenario())
+    assert json.loads(first.body) == {"success": True, "data": {"n": 1}}
+    assert hit.body == first.body and hit.headers["etag"] == first.headers["etag"]
+    assert not_modified.status_code == 304 and not_modified.body == b""
+    assert rebuilt.status_code == 200 and json.loads(rebuilt.body)["data"] == {"n": 2}
+    assert rebuilt.headers["etag"] != first.headers["etag"]
+    assert len(builds) == 2
+    assert stats == {"hits": 2, "misses": 2, "not_modified": 1, "evictions": 0, "invalidations": 1}
+
+
+def test_response_built_during_a_bump_is_not_stored():
+    async def scenario():
+        cache = ResponseCache()
+
+        async def build():
+            cache.bump("k")                               # an event changed the entity mid-build
+            return {"stale": True}
+        await cache.respond("k", None, build)
+        return cache.summary()
+
+    summary = asyncio.run(scenario())
+    assert summary["entries"] == 0 and summary["tracked_versions"] == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    async def scenario():
+        cache = ResponseCache(max_bytes=3 * (ENTRY_OVERHEAD_BYTES + 100))
+
+        async def build():
+            return "x" * 70
+        for key in ("a", "b", "c"):
+            await cache.respond(key, None, build)
+        await cache.respond("a", None, build)             # "b" is now the oldest
+        await cache.respond("d", None, build)
+        return list(cache._entries), cache.bytes, cache.stats["evictions"]
+
+    keys, size, evictions = asyncio.run(scenario())
+    assert keys == ["c", "a", "d"] and evictions == 1
+    assert size <= 3 * (ENTRY_OVERHEAD_BYTES + 100)
+
+
+def test_conditional_gets_follow_resource_changes(client):
+    user_id = register(client)
+    resource_id = upload(client, user_id)["resource_id"]
+    url = f"/api/cqrs/resources/{resource_id}"
+    first = client.get(url)
+    assert first.headers["cache-control"] == "no-cache"
+    etag = first.headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    client.post(f"{url}/view", json={
+        "user_id": user_id, "resource_id": resource_id, "view_duration_seconds": 30, "session_id": "s"})
+    changed = client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.json()["data"]["view_count"] == 1
+    etag = changed.headers["etag"]
+
+    client.post(f"{url}/rate", json={"user_id": user_id, "resource_id": resource_id, "rating_value": 4})
+    rated = client.get(url, headers={"If-None-Match": etag})
+    assert rated.status_code == 200 and rated.json()["data"]["average_rating"] == 4.0
+
+    profile = client.get(f"/api/cqrs/users/{user_id}")
+    assert client.get(f"/api/cqrs/users/{user_id}",
+                      headers={"If-None-Match": profile.headers["etag"]}).status_code == 304
+    assert client.get(f"/api/cqrs/resources/{resource_id}x").status_code == 404
@@ -0,0 +1,77 @@
+"""
+Activity rollups: range totals against a brute-force sum, retention of fine
+buckets, snapshot round-trips and the analytics endpoint.
+"""
+
+import pickle
+import random
+
+from conftest import register, upload
+from rollups import RollupStore
+
+DAY = 86400
+
+
+def events(count: int, seed: int = 1):
+    rng = random.Random(seed)
+    return sorted((rng.uniform(0, 3 * DAY), rng.randint(1, 600)) for _ in range(count))
+
+
+def filled(store: RollupStore, rows) -> RollupStore:
+    for at, seconds in rows:
+        store.record(at, [("resource", "r1")], views=1, view_seconds=seconds)
+    return store
+
+
+def test_totals_match_the_events_in_range():
+    rows = events(2000)
+    store = filled(RollupStore(retention={"minute": None}), rows)      # edges stay exact to the minute
+    rng = random.Random(2)
+    for _ in range(50):
+        start = rng.randrange(0, 3 * DAY, 60)
+        end = rng.randrange(start, 3 * DAY + 60, 60)
+        inside = [seconds for at, seconds in rows if start <= at < end]
+        totals = store.totals("resource", "r1", start, end)
+        assert (totals["views"], totals["view_seconds"]) == (len(inside), sum(inside)), (start, end)
+
+
+def test_expired_minutes_leave_hour_and_day_totals():
+    rows = events(500)
+    store = filled(RollupStore(retention={"minute": 3600}), rows)
+    assert all(key[2] >= store.latest - 3600 for key in store.buckets["minute"])
+    assert store.totals("resource", "r1", 0, 2 * DAY)["views"] == sum(1 for at, _ in rows if at < 2 * DAY)
+    hourly = store.series("resource", "r1", 0, DAY, "hour")
+    assert sum(row["views"] for row in hourly) == sum(1 for at, _ in rows if at < DAY)
+
+
+def test_snapshot_round_trip_keeps_buckets_and_retention():
+    store = filled(RollupStore(retention={"minute": 3600}), events(300))
+    restored = RollupStore(retention={"minute": 3600})
+    restored.load(pickle.loads(pickle.dumps(store.dump())))
+    assert restored.totals("resource", "r1", 0, 3 * DAY) == store.totals("resource", "r1", 0, 3 * DAY)
+    restored.record(restored.latest + 2 * 3600, [("resource", "r1")], views=1)
+    assert all(key[2] >= restored.latest - 3600 for key in restored.buckets["minute"])
+
+
+def test_analytics_endpoint_rolls_up_views_and_re_ratings(client):
+    uploader, viewer = register(client), register(client)
+    resource_id = upload(client, uploader)["resource_id"]
+    for seconds in (30, 90):
+        client.post(f"/api/cqrs/resources/{resource_id}/view", json={
+            "user_id": viewer, "resource_id": resource_id, "view_duration_seconds": seconds, "session_id": "s"})
+    rate = {"user_id": viewer, "resource_id": resource_id, "review_text": ""}
+    for value in (2, 5):
+        client.post(f"/api/cqrs/resources/{resource_id}/rate", json={**rate, "rating_value": value})
+
+    response = client.get(f"/api/cqrs/analytics/resources/{resource_id}", params={"granularity": "minute"})
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["totals"] == {"views": 2, "view_seconds": 120, "downloads": 0, "rating_sum": 5, "rating_count": 1}
+    assert sum(bucket["views"] for bucket in data["buckets"]) == 2
+    user = client.get(f"/api/cqrs/analytics/users/{viewer}").json()["data"]
+    assert user["totals"]["views"] == 2
+
+    assert client.get(f"/api/cqrs/analytics/resources/{resource_id}",
+                      params={"granularity": "week"}).status_code == 400
+    assert client.get(f"/api/cqrs/analytics/tags/{resource_id}").status_code == 404
+    assert client.get(f"/api/cqrs/analytics/resources/{resource_id}", params={"start": "yesterday"}).status_code == 400
@@ -0,0 +1,85 @@
+"""
+Study sessions: gap-based windows, early closes past max_open, progress
+totals over closed and open sessions, snapshot round-trips and the
+progress endpoints.
+"""
+
+import pickle
+
+from activity_store import ActivityStore
+from conftest import register, upload
+from study_sessions import MIXED_DEVICES, StudySessionStore
+
+T0 = 1_800_000_000 - 1_800_000_000 % 86400                  # midnight, epoch seconds
+GAP = 1800
+
+
+def store(**kwargs) -> StudySessionStore:
+    return StudySessionStore(ActivityStore(), gap_seconds=GAP, **kwargs)
+
+
+def test_views_within_the_gap_form_one_session():
+    sessions = store()
+    sessions.record_view("u1", "s", "r1", T0 + 600, 600, "desktop")
+    sessions.record_view("u1", "s", "r2", T0 + 1200, 300, "mobile")
+    sessions.record_view("u1", "s", "r1", T0 + 1500, 300, "mobile")
+    assert len(sessions.open) == 1 and len(sessions.sessions) == 0
+
+    sessions.record_view("u1", "s", "r1", T0 + 1500 + GAP + 1, 60, "mobile")   # same id after a break
+    assert len(sessions.sessions) == 1
+    closed = sessions.recent("u1")[1]
+    assert (closed["start"], closed["end"], closed["duration_seconds"]) == (T0, T0 + 1500, 1200)
+    assert (closed["views"], closed["resources"], closed["device"], closed["open"]) == (3, 2, MIXED_DEVICES, False)
+    assert sessions.recent("u1")[0]["open"]
+
+
+def test_idle_sessions_expire_and_max_open_closes_the_oldest():
+    sessions = store(max_open=2)
+    for i, user_id in enumerate(("u1", "u2", "u3")):
+        sessions.record_view(user_id, "s", "r1", T0 + i, 10, "pc")
+    assert sessions.forced_closes == 1 and list(sessions.open) == [("u2", "s"), ("u3", "s")]
+    assert sessions.expire(T0 + 1 + GAP) == 0                 # idle for exactly the gap: still open
+    assert sessions.expire(T0 + 3 + GAP) == 2
+    assert sessions.stats()["closed_sessions"] == 3 and sessions.open_by_user == {}
+
+
+def test_progress_adds_open_sessions_to_closed_records():
+    sessions = store()
+    sessions.record_view("u1", "a", "r1", T0 + 3600, 600, "pc")
+    sessions.record_view("u1", "b", "r2", T0 + 86400 + 3600, 300, "phone")   # closes "a" by watermark
+    progress = sessions.progress("u1", T0, T0 + 2 * 86400, {"r1": ["algebra"], "r2": []}.get)
+    assert (progress["sessions"], progress["open_sessions"], progress["study_seconds"]) == (2, 1, 900)
+    assert progress["by_day"] == [{"day": T0, "sessions": 1, "study_seconds": 600},
+                                  {"day": T0 + 86400, "sessions": 1, "study_seconds": 300}]
+    assert progress["by_subject"] == {"algebra": 600, "untagged": 300}
+    assert progress["by_device"] == {"pc": 600, "phone": 300}
+    assert sessions.progress("u1", T0 + 86400, T0 + 2 * 86400, lambda _: [])["sessions"] == 1
+    assert sessions.progress("nobody", T0, T0 + 86400, lambda _: [])["sessions"] == 0
+
+
+def test_snapshot_round_trip_keeps_open_and_closed_sessions():
+    sessions = store()
+    sessions.record_view("u1", "a", "r1", T0, 60, "pc")
+    sessions.record_view("u1", "b", "r1", T0 + 2 * GAP, 60, "pc")
+    restored = StudySessionStore(sessions.activity, gap_seconds=GAP)
+    restored.load(pickle.loads(pickle.dumps(sessions.dump())))
+    assert restored.recent("u1") == sessions.recent("u1")
+    restored.record_view("u1", "b", "r2", T0 + 2 * GAP + 60, 60, "pc")
+    assert restored.recent("u1")[0]["views"] == 2
+
+
+def test_progress_endpoints_follow_views(client):
+    user_id = register(client)
+    resource_id = upload(client, user_id)["resource_id"]
+    for seconds in (120, 180):
+        client.post(f"/api/cqrs/resources/{resource_id}/view", json={
+            "user_id": user_id, "resource_id": resource_id, "view_duration_seconds": seconds,
+            "session_id": "evening", "device_type": "tablet"})
+
+    progress = client.get(f"/api/cqrs/users/{user_id}/study-progress").json()["data"]
+    assert (progress["sessions"], progress["open_sessions"], progress["study_seconds"]) == (1, 1, 300)
+    assert progress["by_device"] == {"tablet": 300} and sum(progress["by_subject"].values()) >= 300
+    recent = client.get(f"/api/cqrs/users/{user_id}/study-sessions").json()["data"]["sessions"]
+    assert [(s["session_id"], s["views"], s["open"]) for s in recent] == [("evening", 2, True)]
+    assert client.get("/api/cqrs/users/nobody/study-progress").status_code == 404
+    assert client.get(f"/api/cqrs/users/{user_id}/study-progress", params={"start": "soon"}).status_code == 400
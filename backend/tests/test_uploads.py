@@ -0,0 +1,105 @@
+"""
+Upload storage: staged files, claims and releases in the content store, and
+the upload endpoint's cleanup of rejected uploads.
+"""
+
+import asyncio
+import hashlib
+import os
+
+import pytest
+from fastapi import HTTPException
+
+from conftest import app_module, register, unique, upload
+from file_storage import MAX_FIELD_SIZE, ContentStore, parse_streaming_upload
+
+BOUNDARY = "testboundary"
+HEADERS = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+
+
+def multipart(content: bytes, trailer: bytes = b"") -> bytes:
+    return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.txt\"\r\n\r\n".encode()
+            + content + f"\r\n--{BOUNDARY}\r\n".encode() + trailer)
+
+
+async def chunks(body: bytes):
+    for start in range(0, len(body), 1000):
+        yield body[start:start + 1000]
+
+
+def stage(store: ContentStore, content: bytes):
+    fields, stored = asyncio.run(parse_streaming_upload(HEADERS, chunks(multipart(content, b"--")), store))
+    return stored
+
+
+def files_in(root: str, folder: str):
+    return [name for _, _, names in os.walk(os.path.join(root, folder)) for name in names]
+
+
+def test_objects_stay_until_every_claim_is_released(tmp_path):
+    store = ContentStore(str(tmp_path), max_upload_bytes=1 << 20)
+    first, second = stage(store, b"same bytes"), stage(store, b"same bytes")
+    assert files_in(str(tmp_path), "objects") == []
+
+    assert store.claim(first.staged_path, first.checksum) is True
+    assert store.claim(second.staged_path, second.checksum) is False
+    assert files_in(str(tmp_path), "tmp") == []
+
+    store.release(first.checksum, referenced=False)          # rejected, but the second upload still holds it
+    assert os.path.exists(first.file_path)
+    store.release(second.checksum, referenced=False)
+    assert not os.path.exists(first.file_path)
+    assert store.leases == {}
+
+
+def test_referenced_objects_are_kept(tmp_path):
+    store = ContentStore(str(tmp_path), max_upload_bytes=1 << 20)
+    stored = stage(store, b"kept")
+    store.claim(stored.staged_path, stored.checksum)
+    store.release(stored.checksum, referenced=True)
+    assert os.path.exists(stored.file_path)
+
+
+def test_parse_error_after_file_part_removes_staged_file(tmp_path):
+    store = ContentStore(str(tmp_path), max_upload_bytes=1 << 20)
+    oversized = b"Content-Disposition: form-data; name=\"title\"\r\n\r\n" + b"x" * (MAX_FIELD_SIZE + 1)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(parse_streaming_upload(HEADERS, chunks(multipart(b"file data", oversized)), store))
+    assert error.value.status_code == 413
+    assert files_in(str(tmp_path), "tmp") == [] and files_in(str(tmp_path), "objects") == []
+
+
+def test_rejected_upload_removes_its_object(client):
+    content = unique("orphan").encode()
+    response = client.post("/api/cqrs/resources/upload", files={"file": ("a.txt", content)}, data={
+        "title": "t", "description": "d", "resource_type": "pdf", "difficulty_level": "beginner",
+        "uploader_user_id": unique("missing-user")})
+    assert response.status_code == 404
+    assert not os.path.exists(app_module.content_store.object_path(hashlib.sha256(content).hexdigest()))
+    assert app_module.content_store.leases == {}
+
+
+def test_rejected_duplicate_keeps_the_stored_object(client):
+    content = unique("shared").encode()
+    data = upload(client, register(client), content=content)
+    path = app_module.stored_files_db[data["checksum"]]["file_path"]
+    response = client.post("/api/cqrs/resources/upload", files={"file": ("a.txt", content)}, data={
+        "title": "t", "description": "d", "resource_type": "pdf", "difficulty_level": "beginner",
+        "uploader_user_id": unique("missing-user")})
+    assert response.status_code == 404
+    assert os.path.exists(path)
+
+
+def test_retried_upload_returns_the_first_result(client):
+    user_id = register(client)
+    content = unique("retry").encode()
+    form = {"title": unique("Retry"), "description": "d", "resource_type": "pdf",
+            "difficulty_level": "beginner", "uploader_user_id": user_id}
+    headers = {"Idempotency-Key": unique("key")}
+    first = client.post("/api/cqrs/resources/upload", data=form, files={"file": ("a.txt", content)}, headers=headers)
+    retry = client.post("/api/cqrs/resources/upload", data=form, files={"file": ("a.txt", content)}, headers=headers)
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    record = app_module.stored_files_db[first.json()["data"]["checksum"]]
+    assert record["resource_ids"] == [first.json()["data"]["resource_id"]]
+    assert os.path.exists(record["file_path"])